@@ -1,16 +1,285 @@
-import requests
+import asyncio
+import copy
+import hashlib
 import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+# The query endpoint of the CAM API (http://localhost:6434/query for a local instance).
+QUERY_ENDPOINT = os.getenv("CAM_QUERY_ENDPOINT", "http://robokop.renci.org:6434/query")
+
+# Responses can be cached on disk for QUERY_CACHE_TTL seconds, so that re-running a notebook cell doesn't send the same
+# query again. The cache is off unless CAM_QUERY_CACHE is set to the folder to keep it in (e.g. ~/.cache/cam-queries),
+# or a QueryClient is given a cacheDir. The folder gets a .gitignore, so that a cache inside a checkout isn't committed.
+QUERY_CACHE_DIR = os.getenv("CAM_QUERY_CACHE", "")
+QUERY_CACHE_TTL = float(os.getenv("CAM_QUERY_CACHE_TTL", str(24 * 60 * 60)))
+
+# The number of connections to keep open to the endpoint, which is also the most queries queryAsync() runs at once.
+QUERY_POOL_SIZE = 8
+
+# The errors of a failed query (an HTTP or connection error, or a response that isn't JSON), which batchQuery() and
+# batchQueryAsync() ignore with ignoreErrors=True.
+QUERY_ERRORS = (requests.RequestException, ValueError)
+
+
+class QueryClient:
+    """
+    A client for the query endpoint, which keeps its connections open between queries and (if it has a cacheDir)
+    caches responses on disk.
+
+    :param raiseForStatus: Raise requests.HTTPError if the endpoint returns an error status. With
+        raiseForStatus=False, query() returns the body of the error response instead (as query() always used to),
+        although error responses are never cached.
+    """
+
+    def __init__(self, endpoint=QUERY_ENDPOINT, cacheDir=QUERY_CACHE_DIR, cacheTtl=QUERY_CACHE_TTL,
+                 poolSize=QUERY_POOL_SIZE, timeout=300, raiseForStatus=True):
+        self.endpoint = endpoint
+        self.cacheDir = cacheDir and os.path.expanduser(cacheDir)
+        self.cacheTtl = cacheTtl
+        self.timeout = timeout
+        self.raiseForStatus = raiseForStatus
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=poolSize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.poolSize = poolSize
+        self._semaphore = None
+        self._semaphoreLoop = None
+
+    def cacheKey(self, message, limit, strict):
+        """Hash the endpoint, the query (with its keys sorted, so that key order doesn't matter), limit and strict."""
+        canonical = json.dumps({"endpoint": self.endpoint, "message": message, "limit": limit, "strict": strict},
+                               sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _cachePath(self, key):
+        return os.path.join(self.cacheDir, key + ".json")
+
+    def _readCache(self, key):
+        path = self._cachePath(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.cacheTtl:
+                os.remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _writeCache(self, key, result):
+        if not os.path.isdir(self.cacheDir):
+            os.makedirs(self.cacheDir, exist_ok=True)
+            with open(os.path.join(self.cacheDir, ".gitignore"), "w", encoding="utf-8") as f:
+                f.write("*\n")
+        path = self._cachePath(key)
+        tmpPath = f"{path}.tmp-{os.getpid()}-{id(result)}"
+        with open(tmpPath, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        os.replace(tmpPath, path)
+
+    def evictExpired(self):
+        """Delete every cached response older than the TTL. Returns the number of responses deleted."""
+        if not self.cacheDir or not os.path.isdir(self.cacheDir):
+            return 0
+        deleted = 0
+        now = time.time()
+        for entry in os.scandir(self.cacheDir):
+            if entry.name.endswith(".json") and now - entry.stat().st_mtime > self.cacheTtl:
+                os.remove(entry.path)
+                deleted += 1
+        return deleted
+
+    def clearCache(self):
+        """Delete every cached response."""
+        if self.cacheDir and os.path.isdir(self.cacheDir):
+            for entry in os.scandir(self.cacheDir):
+                if entry.name.endswith(".json"):
+                    os.remove(entry.path)
+
+    def query(self, message, limit=20, strict=True, useCache=True):
+        key = self.cacheKey(message, limit, strict)
+        if useCache and self.cacheDir:
+            result = self._readCache(key)
+            if result is not None:
+                return result
+        r = self.session.post(self.endpoint, params={"limit": limit, "strict": "true" if strict else "false"},
+                              json=message, timeout=self.timeout)
+        if self.raiseForStatus:
+            r.raise_for_status()
+        result = r.json()
+        if self.cacheDir and r.ok:
+            self._writeCache(key, result)
+        return result
+
+    async def queryAsync(self, message, limit=20, strict=True, useCache=True):
+        """
+        Like query(), but can be awaited, e.g. with asyncio.gather() to send many queries at once. The queries are
+        sent from a thread pool over the same connections, at most poolSize at a time.
+        """
+        # A semaphore can only be used in the event loop it was first used in.
+        loop = asyncio.get_running_loop()
+        if self._semaphoreLoop is not loop:
+            self._semaphore = asyncio.Semaphore(self.poolSize)
+            self._semaphoreLoop = loop
+        async with self._semaphore:
+            return await asyncio.to_thread(self.query, message, limit, strict, useCache)
+
+    def close(self):
+        self.session.close()
+
+
+# The client used by query() and queryAsync(). Replace it (e.g. with QueryClient("http://localhost:6434/query"),
+# QueryClient(cacheDir="~/.cache/cam-queries") or QueryClient(raiseForStatus=False)) to use another endpoint, a cache,
+# or to get error responses back instead of exceptions.
+client = QueryClient()
 
 
 def query(message, limit=20, strict=True):
-    strict_str = "false"
-    if strict:
-        strict_str = "true"
-    endpoint = f"http://robokop.renci.org:6434/query?limit={limit}&strict={strict_str}"
-    #endpoint = f"http://localhost:6434/query?limit={limit}&strict={strict_str}"
-    r = requests.post(endpoint, json=message)
-    result = r.json()
-    return result
+    return client.query(message, limit=limit, strict=strict)
+
+
+async def queryAsync(message, limit=20, strict=True):
+    return await client.queryAsync(message, limit=limit, strict=strict)
+
+# The query graph that batchQuery() sends for every CURIE if no template is given: everything connected to the CURIE
+# (node n0) by any edge, in TRAPI 1.x format.
+ONE_HOP_TEMPLATE = {
+    "message": {
+        "query_graph": {
+            "nodes": {"n0": {"ids": []}, "n1": {}},
+            "edges": {"e0": {"subject": "n0", "object": "n1"}},
+        }
+    }
+}
+
+
+def substitute(template, values, node="n0"):
+    """
+    Fill in the CURIEs of the nodes of a query.
+
+    :param template: A query, in ReasonerAPI 0.9 format (nodes with a "curie") or TRAPI 1.x format (nodes with "ids").
+    :param values: A CURIE for `node`, or a dictionary of node IDs to CURIEs.
+    :return: A copy of the query with the CURIEs filled in.
+    """
+    if isinstance(values, str):
+        values = {node: values}
+    message = copy.deepcopy(template)
+    nodes = message["message"]["query_graph"]["nodes"]
+    for nodeId, curie in values.items():
+        if isinstance(nodes, dict):
+            nodes[nodeId]["ids"] = [curie]
+        else:
+            next(n for n in nodes if n["id"] == nodeId)["curie"] = curie
+    return message
+
+
+def _batchMessages(curies, template, values, node):
+    if curies is not None:
+        return [substitute(template or ONE_HOP_TEMPLATE, curie, node) for curie in curies]
+    if template is None or values is None:
+        raise ValueError("batchQuery() needs either a list of CURIEs, or a template and a list of values.")
+    return [substitute(template, value, node) for value in values]
+
+
+def batchQuery(curies=None, template=None, values=None, node="n0", limit=20, strict=True, maxConcurrent=QUERY_POOL_SIZE,
+               ignoreErrors=False):
+    """
+    Send one query for every CURIE (filled into `node` of `template`, or of ONE_HOP_TEMPLATE), or for every value
+    (a CURIE or a dictionary of node IDs to CURIEs, see substitute()) filled into `template`, at most maxConcurrent at
+    a time.
+
+    :param ignoreErrors: Return None for queries that fail, instead of raising the first error.
+    :return: A list of the results, in the same order as the CURIEs or values. mergeKnowledgeGraphs() combines them.
+    """
+    messages = _batchMessages(curies, template, values, node)
+
+    def send(message):
+        try:
+            return client.query(message, limit=limit, strict=strict)
+        except QUERY_ERRORS:
+            if ignoreErrors:
+                return None
+            raise
+
+    # A thread pool rather than asyncio, since Jupyter already runs an event loop in which asyncio.run() can't be used.
+    with ThreadPoolExecutor(max_workers=maxConcurrent) as executor:
+        return list(executor.map(send, messages))
+
+
+async def batchQueryAsync(curies=None, template=None, values=None, node="n0", limit=20, strict=True,
+                          maxConcurrent=QUERY_POOL_SIZE, ignoreErrors=False):
+    """Like batchQuery(), but can be awaited."""
+    messages = _batchMessages(curies, template, values, node)
+    semaphore = asyncio.Semaphore(maxConcurrent)
+
+    async def send(message):
+        async with semaphore:
+            try:
+                return await client.queryAsync(message, limit=limit, strict=strict)
+            except QUERY_ERRORS:
+                if ignoreErrors:
+                    return None
+                raise
+
+    return await asyncio.gather(*[send(message) for message in messages])
+
+
+def _knowledgeGraph(result):
+    if result is None:
+        return None
+    if "message" in result:
+        return result["message"].get("knowledge_graph")
+    return result.get("knowledge_graph")
+
+
+def mergeKnowledgeGraphs(results):
+    """
+    Merge the knowledge graphs of several results (TRAPI 1.x or ReasonerAPI 0.9, skipping None) into one, for
+    knowledgeGraphToCytoscape(). Nodes are deduplicated by their ID, and edges by their subject, predicate, object and
+    qualifiers; an edge whose ID is already used by a different edge gets a new ID.
+
+    :return: A knowledge graph in the same format as the results.
+    """
+    graphs = [graph for graph in map(_knowledgeGraph, results) if graph]
+    if not graphs:
+        return {"nodes": {}, "edges": {}}
+    trapi = isinstance(graphs[0]["nodes"], dict)
+
+    nodes = {}
+    edges = {}
+    edgeKeys = set()
+    for graph in graphs:
+        if trapi:
+            nodeItems = graph["nodes"].items()
+            edgeItems = graph["edges"].items()
+        else:
+            nodeItems = ((node["id"], node) for node in graph["nodes"])
+            edgeItems = ((edge["id"], edge) for edge in graph["edges"])
+        for nodeId, node in nodeItems:
+            nodes.setdefault(nodeId, node)
+        for edgeId, edge in edgeItems:
+            if trapi:
+                key = (edge["subject"], edge.get("predicate"), edge["object"],
+                       json.dumps(edge.get("qualifiers"), sort_keys=True))
+            else:
+                key = (edge["source_id"], edge.get("type"), edge["target_id"])
+            if key in edgeKeys:
+                continue
+            edgeKeys.add(key)
+            while edgeId in edges:
+                edgeId = f"{edgeId}_{len(edges)}"
+            edges[edgeId] = edge if trapi else dict(edge, id=edgeId)
+
+    if trapi:
+        return {"nodes": nodes, "edges": edges}
+    return {"nodes": list(nodes.values()), "edges": list(edges.values())}
+
 
 def graphQuestion(question):
     data = reasonerGraphToCytoscape(question)
@@ -20,112 +289,145 @@ def graphKG():
     pass
     
 
-def reasonerGraphToCytoscape(graph):
-    csGraph = {}
-    nodes = []
-    edges = []
-    for node in graph["nodes"]:
-        csNode = {}
-        node_types = ""
-        if isinstance(node["type"], str):
-            node_types = node["type"]
+# The Cytoscape style of every graph. Every conversion returns a copy of it, so that changing the style of one graph
+# doesn't change the others.
+CYTOSCAPE_STYLE = [
+    { "selector": 'node', "style": {
+        'label': 'data(label)',
+        'color': 'white',
+        'background-color': '#60f', # #009 looks good too
+        'shape': 'rectangle',
+        'text-valign': 'center',
+        'text-border-style': 'solid',
+        'text-border-width': 5,
+        'text-border-color': 'red',
+        'width': '20em',
+        'height': '5em',
+        'text-wrap': 'wrap'
+    } },
+    {"selector": "edge", "style": {
+        "curve-style": "unbundled-bezier",
+        # "control-point-distances": [20, -20],
+        # "control-point-weights": [0.250, 0.75],
+        "control-point-distances": [-20, 20],
+        "control-point-weights": [0.5],
+        'content': 'data(label)',
+        'line-color': '#808080',
+        'target-arrow-color': '#808080',
+        'target-arrow-shape': 'triangle',
+        'target-arrow-fill': 'filled'}
+    }
+]
+
+
+def _joinTypes(types):
+    if types is None:
+        return ""
+    if isinstance(types, str):
+        return types
+    return "\n".join(types)
+
+
+def _frame(items, columns):
+    """
+    Load nodes or edges (a TRAPI dictionary keyed by ID, or a ReasonerAPI list) into a DataFrame with an "id" column
+    and the given columns, with None for missing values.
+    """
+    if isinstance(items, dict):
+        frame = pd.DataFrame(list(items.values()), dtype=object)
+        frame["id"] = list(items)
+    else:
+        frame = pd.DataFrame(items, dtype=object)
+    frame = frame.reindex(columns=["id"] + columns).astype(object)
+    return frame.where(frame.notna(), None)
+
+
+def graphColumns(graph, labelBy="type"):
+    """
+    Split a query graph or knowledge graph into columns, for cytoscapeElements(). Both the ReasonerAPI 0.9 format
+    (lists of nodes and edges with "type", "source_id" and "target_id") and the TRAPI 1.x format (dictionaries of
+    nodes and edges with "categories", "subject", "object" and "predicate") are understood. The nodes and edges are
+    each loaded into a DataFrame once, and every column is built from it with a single vectorized operation.
+
+    :param labelBy: "type" to label nodes with their types and CURIE (for query graphs), or "name" to label them
+        with their name and ID (for knowledge graphs).
+    :return: A dictionary of node and edge columns.
+    """
+    trapiNodes = isinstance(graph["nodes"], dict)
+    nodes = _frame(graph["nodes"], ["categories", "ids", "type", "curie", "name"])
+    nodeTypes = nodes["categories" if trapiNodes else "type"].map(_joinTypes)
+    if labelBy == "type":
+        if trapiNodes:
+            nodeCuries = nodes["ids"].map(lambda ids: ", ".join(ids or []))
         else:
-            node_types = "\n".join(node["type"])
-        csNode["data"] = {"id": node["id"], "label": node_types + "\n[" + node.get("curie", "") + "]", "curie": node.get("curie", ""), "type": node_types}
-        nodes.append(csNode)
-    for edge in graph["edges"]:
-        csEdge = {
-            "data": {
-                "id": edge["id"],
-                "source": edge["source_id"],
-                "target": edge["target_id"],
-                "label": edge["type"]
-            }
-        }
-        edges.append(csEdge)
-    csGraph["elements"] = {"nodes": nodes, "edges": edges}
-    csGraph["style"] = [
-        { "selector": 'node', "style": {
-            'label': 'data(label)',
-            'color': 'white',
-            'background-color': '#60f', # #009 looks good too
-            'shape': 'rectangle',
-            'text-valign': 'center',
-            'text-border-style': 'solid',
-            'text-border-width': 5,
-            'text-border-color': 'red',
-            'width': '20em',
-            'height': '5em',
-            'text-wrap': 'wrap'
-        } }, 
-        {"selector": "edge", "style": {
-            "curve-style": "unbundled-bezier",
-            # "control-point-distances": [20, -20],
-            # "control-point-weights": [0.250, 0.75],
-            "control-point-distances": [-20, 20],
-            "control-point-weights": [0.5],
-            'content': 'data(label)',
-            'line-color': '#808080',
-            'target-arrow-color': '#808080',
-            'target-arrow-shape': 'triangle',
-            'target-arrow-fill': 'filled'}
-        }
-    ]
-                       
-    #print(json.dumps(csGraph, indent=4))
-    return csGraph
+            nodeCuries = nodes["curie"].fillna("")
+        nodeLabels = nodeTypes + "\n[" + nodeCuries + "]"
+    else:
+        nodeCuries = nodes["id"]
+        nodeLabels = nodes["name"].map(lambda name: name or " ") + "\n[" + nodes["id"] + "]"
+
+    edges = _frame(graph["edges"], ["subject", "object", "predicate", "predicates", "source_id", "target_id", "type"])
+    if isinstance(graph["edges"], dict):
+        sources = edges["subject"]
+        targets = edges["object"]
+        edgeLabels = edges["predicate"].where(edges["predicate"].astype(bool), edges["predicates"]).map(_joinTypes)
+    else:
+        sources = edges["source_id"]
+        targets = edges["target_id"]
+        edgeLabels = edges["type"].map(_joinTypes)
+
+    return {
+        "nodeIds": nodes["id"].tolist(), "nodeLabels": nodeLabels.tolist(), "nodeCuries": nodeCuries.tolist(),
+        "nodeTypes": nodeTypes.tolist(), "edgeIds": edges["id"].tolist(), "sources": sources.tolist(),
+        "targets": targets.tolist(), "edgeLabels": edgeLabels.tolist(),
+    }
+
+
+def cytoscapeElements(nodeIds, nodeLabels, nodeCuries, nodeTypes, edgeIds, sources, targets, edgeLabels):
+    """
+    Build the Cytoscape elements for a graph given as columns (parallel lists, as returned by graphColumns()).
+    """
+    nodes = [{"data": {"id": nodeId, "label": label, "curie": curie, "type": types}}
+             for nodeId, label, curie, types in zip(nodeIds, nodeLabels, nodeCuries, nodeTypes)]
+    edges = [{"data": {"id": edgeId, "source": source, "target": target, "label": label}}
+             for edgeId, source, target, label in zip(edgeIds, sources, targets, edgeLabels)]
+    return {"nodes": nodes, "edges": edges}
+
+
+def graphToCytoscape(graph, labelBy="type"):
+    """
+    Convert a query graph or knowledge graph into Cytoscape data, with a copy of CYTOSCAPE_STYLE.
+    """
+    return {"elements": cytoscapeElements(**graphColumns(graph, labelBy)), "style": copy.deepcopy(CYTOSCAPE_STYLE)}
+
+
+def graphToCytoscapePages(graph, pageSize=1000, labelBy="type"):
+    """
+    Convert a large graph into Cytoscape data lazily, one page of pageSize edges at a time. Every page contains the
+    nodes of its edges, and the first page also contains the nodes that have no edges, so that a page can be shown
+    with Cytoscape() by itself.
+
+    :return: A generator of Cytoscape data, like graphToCytoscape().
+    """
+    columns = graphColumns(graph, labelBy)
+    nodeRows = {nodeId: row for row, nodeId in enumerate(columns["nodeIds"])}
+    connected = set(columns["sources"]) | set(columns["targets"])
+    edgeCount = len(columns["edgeIds"])
+    for start in range(0, max(edgeCount, 1), pageSize):
+        edgeColumns = {name: columns[name][start:start + pageSize]
+                       for name in ("edgeIds", "sources", "targets", "edgeLabels")}
+        pageNodes = dict.fromkeys(edgeColumns["sources"] + edgeColumns["targets"])
+        if start == 0:
+            pageNodes.update(dict.fromkeys(nodeId for nodeId in columns["nodeIds"] if nodeId not in connected))
+        rows = [nodeRows[nodeId] for nodeId in pageNodes if nodeId in nodeRows]
+        nodeColumns = {name: [columns[name][row] for row in rows]
+                       for name in ("nodeIds", "nodeLabels", "nodeCuries", "nodeTypes")}
+        yield {"elements": cytoscapeElements(**nodeColumns, **edgeColumns), "style": copy.deepcopy(CYTOSCAPE_STYLE)}
+
+
+def reasonerGraphToCytoscape(graph):
+    return graphToCytoscape(graph, labelBy="type")
+
 
 def knowledgeGraphToCytoscape(graph):
-    csGraph = {}
-    nodes = []
-    edges = []
-    for node in graph["nodes"]:
-        csNode = {}
-        node_types = ""
-        if isinstance(node["type"], str):
-            node_types = node["type"]
-        else:
-            node_types = "\n".join(node["type"])
-        csNode["data"] = {"id": node["id"], "label": (node["name"] or " ") + "\n[" + node["id"] + "]", "curie": node["id"], "type": node_types}
-        nodes.append(csNode)
-    for edge in graph["edges"]:
-        csEdge = {
-            "data": {
-                "id": edge["id"],
-                "source": edge["source_id"],
-                "target": edge["target_id"],
-                "label": edge["type"]
-            }
-        }
-        edges.append(csEdge)
-    csGraph["elements"] = {"nodes": nodes, "edges": edges}
-    csGraph["style"] = [
-        { "selector": 'node', "style": {
-            'label': 'data(label)',
-            'color': 'white',
-            'background-color': '#60f', # #009 looks good too
-            'shape': 'rectangle',
-            'text-valign': 'center',
-            'text-border-style': 'solid',
-            'text-border-width': 5,
-            'text-border-color': 'red',
-            'width': '20em',
-            'height': '5em',
-            'text-wrap': 'wrap'
-        } }, 
-        {"selector": "edge", "style": {
-            "curve-style": "unbundled-bezier",
-            # "control-point-distances": [20, -20],
-            # "control-point-weights": [0.250, 0.75],
-            "control-point-distances": [-20, 20],
-            "control-point-weights": [0.5],
-            'content': 'data(label)',
-            'line-color': '#808080',
-            'target-arrow-color': '#808080',
-            'target-arrow-shape': 'triangle',
-            'target-arrow-fill': 'filled'}
-        }
-    ]
-                       
-    #print(json.dumps(csGraph, indent=4))
-    return csGraph
+    return graphToCytoscape(graph, labelBy="name")
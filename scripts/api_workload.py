@@ -0,0 +1,85 @@
+#
+# api_workload.py -- the requests that the tests make to the CAM-KP API, for the benchmarks.
+#
+# scripts/benchmark-api.py replays these requests under load, and scripts/benchmark-responses.py measures the size of
+# their responses. They are read from the same places as the tests, so that the benchmarks follow the tests:
+# - the TRAPI queries in tests/examples/*.json, which are POSTed to /<TRAPI version>/query,
+# - CURIES_TO_TEST in tests/test_curies.py, which are looked up with GET /biolink:NamedThing/<curie> and
+#   GET /biolink:NamedThing/biolink:NamedThing/<curie>, and
+# - GET /<TRAPI version>/meta_knowledge_graph, as in tests/test_api.py.
+#
+import ast
+import json
+import os
+from collections import namedtuple
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_EXAMPLES_DIR = os.path.join(REPOSITORY_DIR, 'tests', 'examples')
+DEFAULT_TEST_CURIES_FILE = os.path.join(REPOSITORY_DIR, 'tests', 'test_curies.py')
+
+DEFAULT_API_ENDPOINT = os.getenv('CAM_KP_API_ENDPOINT', 'https://automat.renci.org/cam-kp/')
+DEFAULT_TRAPI_VERSION = os.getenv('TRAPI_VERSION', '1.4')
+
+ENDPOINTS = ['query', 'node_type_curie', 'source_target_curie', 'meta_knowledge_graph']
+
+# A single request: the endpoint it is reported under (e.g. 'query'), a name for the request (e.g. the example file),
+# the HTTP method and URL, and the JSON body (or None).
+APIRequest = namedtuple('APIRequest', ['endpoint', 'name', 'method', 'url', 'body'])
+
+
+def load_examples(examples_dir=DEFAULT_EXAMPLES_DIR):
+    """
+    :return: A list of (filename, TRAPI query) pairs for the example files, sorted by filename.
+    """
+    examples = []
+    for filename in sorted(os.listdir(examples_dir)):
+        if filename.lower().endswith('.json'):
+            with open(os.path.join(examples_dir, filename), 'r', encoding='utf-8') as f:
+                example = json.load(f)
+            if example.get('query'):
+                examples.append((filename, example['query']))
+    return examples
+
+
+def load_test_curies(test_curies_file=DEFAULT_TEST_CURIES_FILE):
+    """
+    Read CURIES_TO_TEST from tests/test_curies.py without importing it (which would need pytest).
+
+    :return: The list of CURIEs.
+    """
+    with open(test_curies_file, 'r', encoding='utf-8') as f:
+        module = ast.parse(f.read(), test_curies_file)
+    for statement in module.body:
+        if isinstance(statement, ast.Assign) and any(
+                isinstance(target, ast.Name) and target.id == 'CURIES_TO_TEST' for target in statement.targets):
+            return ast.literal_eval(statement.value)
+    raise ValueError(f"No CURIES_TO_TEST found in {test_curies_file}.")
+
+
+def build_workload(api_endpoint=DEFAULT_API_ENDPOINT, trapi_version=DEFAULT_TRAPI_VERSION,
+                   examples_dir=DEFAULT_EXAMPLES_DIR, test_curies_file=DEFAULT_TEST_CURIES_FILE, endpoints=None):
+    """
+    Build the list of requests that the tests make.
+
+    :param api_endpoint: The base URL of the CAM-KP API, ending in '/'.
+    :param endpoints: The endpoints to include (some of ENDPOINTS), or None for all of them.
+    :return: A list of APIRequests.
+    """
+    if not api_endpoint.endswith('/'):
+        api_endpoint += '/'
+    workload = []
+    if endpoints is None or 'query' in endpoints:
+        for filename, query in load_examples(examples_dir):
+            workload.append(APIRequest('query', filename, 'POST', f"{api_endpoint}{trapi_version}/query", query))
+    curies = load_test_curies(test_curies_file) if endpoints is None or set(endpoints) & set(ENDPOINTS[1:3]) else []
+    for curie in curies:
+        if endpoints is None or 'node_type_curie' in endpoints:
+            workload.append(APIRequest('node_type_curie', curie, 'GET',
+                                       f"{api_endpoint}biolink:NamedThing/{curie}", None))
+        if endpoints is None or 'source_target_curie' in endpoints:
+            workload.append(APIRequest('source_target_curie', curie, 'GET',
+                                       f"{api_endpoint}biolink:NamedThing/biolink:NamedThing/{curie}", None))
+    if endpoints is None or 'meta_knowledge_graph' in endpoints:
+        workload.append(APIRequest('meta_knowledge_graph', 'meta_knowledge_graph', 'GET',
+                                   f"{api_endpoint}{trapi_version}/meta_knowledge_graph", None))
+    return workload
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+import argparse
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from api_workload import DEFAULT_API_ENDPOINT, DEFAULT_TRAPI_VERSION, ENDPOINTS, build_workload
+
+logging.basicConfig(level=logging.INFO)
+
+# Load-test a CAM-KP deployment (or a local stand-in server) by replaying the requests that the tests make (see
+# scripts/api_workload.py) at one or more levels of concurrency, and report the latency percentiles, throughput and
+# error rate of every endpoint.
+#
+# Every level of concurrency is a closed loop: that many threads each send a request and wait for its response (read in
+# full) before sending the next one, over a pool of kept-alive connections, until the workload has been sent --repeat
+# times. A --warmup pass is sent first and not measured. Requests that raise an exception (e.g. a timeout) or return a
+# status other than 2xx count as errors.
+#
+# The results are written to a JSON file (by default reports/benchmark-<time>.json), and compare flags the endpoints
+# whose latency, throughput or error rate have regressed between two such files.
+#
+# Usage:
+#   benchmark-api.py run [--api-endpoint https://automat.renci.org/cam-kp/] [-c 1 8 32] [--repeat 5]
+#   benchmark-api.py compare reports/benchmark-20240101T000000Z.json reports/benchmark-20240201T000000Z.json
+
+DEFAULT_CONCURRENCY = [1, 8]
+DEFAULT_REPEAT = 3
+DEFAULT_WARMUP = 1
+DEFAULT_TIMEOUT = 300
+DEFAULT_THRESHOLD = 0.2
+DEFAULT_MIN_MILLISECONDS = 50
+
+PERCENTILES = {'p50': 0.50, 'p95': 0.95, 'p99': 0.99}
+
+
+def percentile(sorted_values, fraction):
+    """Return a percentile of a sorted list, interpolating linearly between the closest ranks."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def send(session, request, timeout):
+    """
+    Send a request and read its response.
+
+    :return: A tuple of the endpoint, the latency in seconds, the status code (or the name of the exception) and the
+        number of bytes in the response.
+    """
+    start = time.perf_counter()
+    try:
+        response = session.request(request.method, request.url, json=request.body, timeout=timeout)
+        size = len(response.content)
+        status = response.status_code
+    except requests.RequestException as e:
+        size = 0
+        status = type(e).__name__
+    return request.endpoint, time.perf_counter() - start, status, size
+
+
+def summarize(samples, wall_seconds):
+    """
+    :param samples: A list of (latency, status, size) tuples.
+    :return: The statistics for a list of samples.
+    """
+    latencies = sorted(latency for latency, _, _ in samples)
+    errors = sum(1 for _, status, _ in samples if not (isinstance(status, int) and 200 <= status < 300))
+    stats = {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': errors / len(samples) if samples else 0,
+        'throughput': len(samples) / wall_seconds if wall_seconds else 0,
+        'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else None,
+        'max_ms': latencies[-1] * 1000 if latencies else None,
+        'response_bytes': sum(size for _, _, size in samples),
+        'statuses': dict(Counter(str(status) for _, status, _ in samples)),
+    }
+    for name, fraction in PERCENTILES.items():
+        value = percentile(latencies, fraction)
+        stats[f"{name}_ms"] = value * 1000 if value is not None else None
+    return stats
+
+
+def run_level(workload, concurrency, repeat, warmup, timeout):
+    """
+    Replay the workload at one level of concurrency.
+
+    :return: A dictionary of the concurrency, the wall time, and the statistics for every endpoint and in total.
+    """
+    with requests.Session() as session:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(lambda request: send(session, request, timeout), workload * warmup))
+            start = time.perf_counter()
+            results = list(executor.map(lambda request: send(session, request, timeout), workload * repeat))
+            wall_seconds = time.perf_counter() - start
+
+    by_endpoint = defaultdict(list)
+    for endpoint, latency, status, size in results:
+        by_endpoint[endpoint].append((latency, status, size))
+    return {
+        'concurrency': concurrency,
+        'wall_seconds': wall_seconds,
+        'endpoints': {endpoint: summarize(samples, wall_seconds) for endpoint, samples in sorted(by_endpoint.items())},
+        'total': summarize([sample for samples in by_endpoint.values() for sample in samples], wall_seconds),
+    }
+
+
+def format_ms(value):
+    return f"{value:.0f}ms" if value is not None else '-'
+
+
+def print_level(level):
+    print(f"Concurrency {level['concurrency']} ({level['wall_seconds']:.1f}s):")
+    print(f"  {'endpoint':<22} {'requests':>8} {'errors':>7} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for endpoint, stats in [*level['endpoints'].items(), ('total', level['total'])]:
+        print(f"  {endpoint:<22} {stats['requests']:>8} {stats['error_rate']:>7.1%} {stats['throughput']:>8.2f} "
+              f"{format_ms(stats['p50_ms']):>9} {format_ms(stats['p95_ms']):>9} {format_ms(stats['p99_ms']):>9}")
+
+
+def run(args):
+    endpoints = args.endpoints.split(',') if args.endpoints else None
+    if endpoints and set(endpoints) - set(ENDPOINTS):
+        sys.exit(f"Unknown endpoints: {', '.join(sorted(set(endpoints) - set(ENDPOINTS)))}")
+    workload = build_workload(args.api_endpoint, args.trapi_version, endpoints=endpoints)
+    logging.info(f"Replaying {len(workload)} requests {args.repeat} times against {args.api_endpoint}.")
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    results = {
+        'started_at': now.isoformat(),
+        'api_endpoint': args.api_endpoint,
+        'trapi_version': args.trapi_version,
+        'requests_per_pass': len(workload),
+        'repeat': args.repeat,
+        'levels': [],
+    }
+    for concurrency in args.concurrency:
+        level = run_level(workload, concurrency, args.repeat, args.warmup, args.timeout)
+        print_level(level)
+        results['levels'].append(level)
+
+    output = args.output or os.path.join('reports', f"benchmark-{now:%Y%m%dT%H%M%SZ}.json")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    logging.info(f"Wrote the results to {output}.")
+
+
+def find_regressions(baseline, current, threshold, min_ms):
+    """
+    Compare the statistics of an endpoint at the same concurrency in two runs.
+
+    :return: A list of descriptions of the regressions.
+    """
+    regressions = []
+    for metric in ['p50_ms', 'p95_ms', 'p99_ms']:
+        before, after = baseline.get(metric), current.get(metric)
+        if before is not None and after is not None and after - before > min_ms and after > before * (1 + threshold):
+            regressions.append(f"{metric[:-3]} {format_ms(before)} -> {format_ms(after)}")
+    if current['throughput'] < baseline['throughput'] * (1 - threshold):
+        regressions.append(f"throughput {baseline['throughput']:.2f} -> {current['throughput']:.2f} req/s")
+    if current['error_rate'] > baseline['error_rate']:
+        regressions.append(f"error rate {baseline['error_rate']:.1%} -> {current['error_rate']:.1%}")
+    return regressions
+
+
+def compare(args):
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = {level['concurrency']: level for level in json.load(f)['levels']}
+    with open(args.current, 'r', encoding='utf-8') as f:
+        current = {level['concurrency']: level for level in json.load(f)['levels']}
+
+    regressed = []
+    for concurrency, level in sorted(current.items()):
+        if concurrency not in baseline:
+            print(f"Concurrency {concurrency}: not in {args.baseline}")
+            continue
+        for endpoint, stats in level['endpoints'].items():
+            if endpoint not in baseline[concurrency]['endpoints']:
+                print(f"Concurrency {concurrency}, {endpoint}: not in {args.baseline}")
+                continue
+            regressions = find_regressions(baseline[concurrency]['endpoints'][endpoint], stats, args.threshold,
+                                           args.min_ms)
+            if regressions:
+                print(f"Concurrency {concurrency}, {endpoint}: REGRESSION in {'; '.join(regressions)}")
+                regressed.append(f"{endpoint} at concurrency {concurrency}")
+
+    if regressed:
+        print(f"{len(regressed)} endpoints regressed: {', '.join(regressed)}")
+        sys.exit(1)
+    print("No regressions.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the CAM-KP API with the requests made by the tests.")
+    subparsers = parser.add_subparsers(dest="subcommand", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmark and write the results to a JSON file.")
+    run_parser.add_argument("--api-endpoint", default=DEFAULT_API_ENDPOINT,
+                            help=f"The CAM-KP API to test (default: $CAM_KP_API_ENDPOINT or {DEFAULT_API_ENDPOINT}).")
+    run_parser.add_argument("--trapi-version", default=DEFAULT_TRAPI_VERSION,
+                            help=f"The TRAPI version (default: $TRAPI_VERSION or {DEFAULT_TRAPI_VERSION}).")
+    run_parser.add_argument("-c", "--concurrency", type=int, nargs='+', default=DEFAULT_CONCURRENCY,
+                            help=f"The numbers of requests to have in flight at once (default: "
+                                 f"{' '.join(map(str, DEFAULT_CONCURRENCY))}).")
+    run_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                            help=f"The number of times to send every request (default: {DEFAULT_REPEAT}).")
+    run_parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP,
+                            help=f"The number of unmeasured passes to send first (default: {DEFAULT_WARMUP}).")
+    run_parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                            help=f"The timeout of every request in seconds (default: {DEFAULT_TIMEOUT}).")
+    run_parser.add_argument("--endpoints", help=f"A comma-separated list of the endpoints to test (default: all of "
+                                                f"{','.join(ENDPOINTS)}).")
+    run_parser.add_argument("-o", "--output", help="The JSON file to write (default: reports/benchmark-<time>.json).")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser("compare", help="Flag endpoints that have regressed between two runs.")
+    compare_parser.add_argument("baseline", help="The results of the earlier run.")
+    compare_parser.add_argument("current", help="The results of the later run.")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help=f"Flag changes of more than this fraction (default: {DEFAULT_THRESHOLD}).")
+    compare_parser.add_argument("--min-ms", type=float, default=DEFAULT_MIN_MILLISECONDS,
+                                help=f"Ignore latency increases smaller than this (default: "
+                                     f"{DEFAULT_MIN_MILLISECONDS}).")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import time
+
+from iri_compaction import IRICompactor, compact_iri, load_namespaces
+from qualifiers import iter_souffle_qualifiers
+
+logging.basicConfig(level=logging.INFO)
+
+# Compare the linear namespace scan used by compact_iris.sc (iri_compaction.compact_iri()) with IRICompactor, with and
+# without its cache, on the IRIs in a real kg_edge.csv file. Every approach must produce exactly the same CURIEs.
+#
+# Usage: benchmark-iri-compaction.py biolink-model-prefix-map.json supplemental-namespaces.json kg_edge.csv
+
+
+def read_iris(kg_edge_csv, limit):
+    """
+    Read the IRIs from kg_edge.csv in the order in which compact-and-duplicate-kg-edges.py would compact them.
+
+    :param kg_edge_csv: The path to kg_edge.csv.
+    :param limit: The maximum number of lines to read (None to read the whole file).
+    :return: A list of IRIs, without angle brackets.
+    """
+    iris = []
+    with open(kg_edge_csv, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f):
+            if limit is not None and line_number >= limit:
+                break
+            for cell in line.rstrip('\n').split('\t'):
+                if len(cell) > 2 and cell[0] == '<' and cell[-1] == '>':
+                    iris.append(cell[1:-1])
+                elif cell.startswith('(<'):
+                    for qualifier_type, qualifier_value in iter_souffle_qualifiers(cell):
+                        iris.append(qualifier_type)
+                        if qualifier_value.startswith('<') and qualifier_value.endswith('>'):
+                            iris.append(qualifier_value[1:-1])
+    return iris
+
+
+def benchmark(name, compact, iris, repeat):
+    """
+    Time compacting every IRI, keeping the best of several runs.
+
+    :return: The list of CURIEs from the last run.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        curies = [compact(iri) for iri in iris]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    logging.info(f"{name:>30}: {best:.3f} s ({len(iris) / best:,.0f} IRIs/s)")
+    return curies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark IRI compaction on the IRIs in kg_edge.csv.")
+    parser.add_argument("prefix_map_file", help="The Biolink Model prefix map (biolink-model-prefix-map.json).")
+    parser.add_argument("supplemental_namespaces_file", help="Additional namespaces (supplemental-namespaces.json).")
+    parser.add_argument("kg_edge_csv", help="The kg_edge.csv file to read IRIs from.")
+    parser.add_argument("--limit", type=int, default=1_000_000,
+                        help="Maximum number of lines of kg_edge.csv to read (default: 1,000,000).")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of times to run each benchmark (default: 3).")
+    args = parser.parse_args()
+
+    namespaces = load_namespaces(args.prefix_map_file, args.supplemental_namespaces_file)
+    iris = read_iris(args.kg_edge_csv, args.limit)
+    logging.info(f"Compacting {len(iris)} IRIs ({len(set(iris))} distinct) with {len(namespaces)} namespaces.")
+
+    expected = benchmark("linear scan (compact_iris.sc)", lambda iri: compact_iri(iri, namespaces), iris, args.repeat)
+    uncached = IRICompactor(namespaces, cache_size=0)
+    results = {
+        "IRICompactor without cache": benchmark("IRICompactor without cache", uncached.compact, iris, args.repeat),
+    }
+    # The cache is kept between runs, so only the first run starts with an empty cache.
+    cached = IRICompactor(namespaces)
+    results["IRICompactor with cache"] = benchmark("IRICompactor with cache", cached.compact, iris, args.repeat)
+    logging.info(f"IRICompactor cache: {cached.compact.cache_info()}")
+
+    for name, curies in results.items():
+        if curies != expected:
+            mismatches = [(iri, e, a) for iri, e, a in zip(iris, expected, curies) if e != a]
+            raise RuntimeError(f"{name} compacted {len(mismatches)} IRIs differently, e.g. {mismatches[:5]}")
+    logging.info("All approaches produced the same CURIEs.")
+
+
+if __name__ == "__main__":
+    main()
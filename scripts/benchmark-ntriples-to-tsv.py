@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+logging.basicConfig(level=logging.INFO)
+
+# Compare the throughput of scripts/ntriples-to-tsv.py with the sed pipelines it replaced in the Makefile, on an
+# N-Triples or N-Quads file (such as the output of riot) or on a generated file. The outputs are compared line by
+# line: the only differences should be literals containing tabs, which ntriples-to-tsv.py escapes as '\t' instead of
+# writing them out as extra columns.
+#
+# Usage: benchmark-ntriples-to-tsv.py [--quads] [--input quads.nq | --generate 1000000] [--workers 1 4]
+
+# The sed pipelines that used to be in the Makefile (with '$$' unescaped).
+SED_TRIPLES = r"sed 's/ /\t/' | sed 's/ /\t/' | sed 's/ \.$//'"
+SED_QUADS = r"sed 's/ /\t/' | sed 's/ /\t/' | sed -E 's/\t(.+) (.+) \.$/\t\1\t\2/'"
+
+CONVERTER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ntriples-to-tsv.py')
+
+
+def generate(path, lines, quads, seed=0):
+    """Generate lines of N-Triples or N-Quads that look like the noctua models: mostly IRIs, with some literals."""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        for _ in range(lines):
+            subject = f"<http://model.geneontology.org/{rng.randrange(100000):08d}/{rng.randrange(1000)}>"
+            kind = rng.random()
+            if kind < 0.7:
+                predicate = "<http://purl.obolibrary.org/obo/RO_0002333>"
+                obj = f"<http://purl.obolibrary.org/obo/GO_{rng.randrange(10000000):07d}>"
+            elif kind < 0.9:
+                predicate = "<http://www.w3.org/2000/01/rdf-schema#comment>"
+                obj = f'"Evidence from the literature, see PMID:{rng.randrange(40000000)} \\"quoted\\" ."@en'
+            elif kind < 0.901:
+                predicate = "<http://www.w3.org/2000/01/rdf-schema#label>"
+                obj = '"a label\twith a tab"'
+            else:
+                predicate = "<http://purl.org/dc/elements/1.1/date>"
+                obj = f'"2023-{rng.randrange(1, 13):02d}-01"^^<http://www.w3.org/2001/XMLSchema#string>'
+            graph = f" <http://model.geneontology.org/{rng.randrange(1000):08d}>" if quads else ""
+            f.write(f"{subject} {predicate} {obj}{graph} .\n")
+
+
+def run(name, command, input_path, output_path, input_size):
+    """Run a shell command that reads input_path on stdin and writes output_path, and log its throughput."""
+    start = time.perf_counter()
+    with open(input_path, 'rb') as fin, open(output_path, 'wb') as fout:
+        subprocess.run(command, shell=True, stdin=fin, stdout=fout, check=True)
+    elapsed = time.perf_counter() - start
+    logging.info(f"{name:>30}: {elapsed:.3f} s ({input_size / elapsed / 1024 / 1024:.1f} MiB/s)")
+
+
+def compare(expected_path, actual_path):
+    """Log how many lines differ between two files, with some examples."""
+    differences = []
+    with open(expected_path, 'r', encoding='utf-8') as fe, open(actual_path, 'r', encoding='utf-8') as fa:
+        for expected, actual in zip(fe, fa):
+            if expected != actual:
+                differences.append((expected, actual))
+    logging.info(f"{len(differences)} lines differ from the sed pipeline.")
+    for expected, actual in differences[:3]:
+        logging.info(f"  sed:              {expected!r}")
+        logging.info(f"  ntriples-to-tsv:  {actual!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ntriples-to-tsv.py against the sed pipelines.")
+    parser.add_argument("--input", help="An N-Triples or N-Quads file to convert.")
+    parser.add_argument("--generate", type=int, default=1_000_000,
+                        help="Number of lines to generate if --input is not given (default: 1,000,000).")
+    parser.add_argument("--quads", action="store_true", help="Convert N-Quads instead of N-Triples.")
+    parser.add_argument("--workers", type=int, nargs='+', default=[1, os.cpu_count() or 1],
+                        help="Numbers of worker processes to run ntriples-to-tsv.py with.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = args.input
+        if input_path is None:
+            input_path = os.path.join(tmp, 'input.nq' if args.quads else 'input.nt')
+            generate(input_path, args.generate, args.quads)
+        input_size = os.path.getsize(input_path)
+        logging.info(f"Converting {input_path} ({input_size / 1024 / 1024:.1f} MiB).")
+
+        sed_output = os.path.join(tmp, 'sed.tsv')
+        run("sed pipeline", SED_QUADS if args.quads else SED_TRIPLES, input_path, sed_output, input_size)
+
+        for workers in args.workers:
+            output = os.path.join(tmp, f'ntriples-to-tsv-{workers}.tsv')
+            command = f"{sys.executable} {CONVERTER} {'--quads ' if args.quads else ''}-j {workers} - -"
+            run(f"ntriples-to-tsv.py -j {workers}", command, input_path, output, input_size)
+            compare(sed_output, output)
+
+
+if __name__ == "__main__":
+    main()
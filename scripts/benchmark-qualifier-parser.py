@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import re
+import timeit
+
+from qualifiers import QualifierParseError, iter_souffle_qualifiers, parse_souffle_qualifiers
+
+logging.basicConfig(level=logging.INFO)
+
+# Micro-benchmarks for the parser for the qualifier format written out by scripts/kg_edges.dl, i.e.
+#   (<predicate>=((<value>)))||(<predicate2>=((<value2>)))||...
+# comparing qualifiers.iter_souffle_qualifiers() with the regular expressions used by scripts/compact_iris.sc, on
+# synthetic qualifier lists of different lengths and (optionally) on the qualifier strings in a real kg_edge.csv.
+#
+# Usage: benchmark-qualifier-parser.py [--kg-edge-csv kg_edge.csv]
+
+# The regular expressions from scripts/compact_iris.sc.
+QUALIFIER_PATTERN = re.compile(r'\(<(.+?)>=\(\((.+?)\)\)\)')
+QUALIFIER_LIST_PATTERN = re.compile(f'({QUALIFIER_PATTERN.pattern}(?:||{QUALIFIER_PATTERN.pattern})*)')
+
+ANATOMICAL_CONTEXT_QUALIFIER = "https://w3id.org/biolink/vocab/anatomical_context_qualifier"
+
+# Malformed qualifier strings that the parser must reject.
+MALFORMED_QUALIFIER_STRINGS = [
+    f"(<{ANATOMICAL_CONTEXT_QUALIFIER}>=((value with ))) inside)))",
+    f"(<{ANATOMICAL_CONTEXT_QUALIFIER}>=((<http://purl.obolibrary.org/obo/GO_0005759>))",
+    f"(<{ANATOMICAL_CONTEXT_QUALIFIER}>=((<http://purl.obolibrary.org/obo/GO_0005759>)))|",
+    f"(<{ANATOMICAL_CONTEXT_QUALIFIER}>((<http://purl.obolibrary.org/obo/GO_0005759>)))",
+    "(<>=((<http://purl.obolibrary.org/obo/GO_0005759>)))",
+]
+
+
+def parse_with_regex(qualifier_string):
+    """Parse a qualifier list in the same way as scripts/compact_iris.sc."""
+    if not QUALIFIER_LIST_PATTERN.fullmatch(qualifier_string):
+        raise ValueError(f"Could not parse qualifiers '{qualifier_string}'")
+    qualifiers = []
+    for qualifier in qualifier_string.split('||'):
+        match = QUALIFIER_PATTERN.fullmatch(qualifier)
+        if match is None:
+            raise ValueError(f"Could not parse qualifier '{qualifier}'")
+        qualifiers.append((match.group(1), match.group(2)))
+    return qualifiers
+
+
+def synthetic_qualifier_string(count):
+    """Generate a list of count anatomical context qualifiers."""
+    return "||".join(f"(<{ANATOMICAL_CONTEXT_QUALIFIER}>=((<http://purl.obolibrary.org/obo/GO_{i:07d}>)))"
+                     for i in range(count))
+
+
+def read_qualifier_strings(kg_edge_csv, limit):
+    """Read up to limit qualifier strings from kg_edge.csv."""
+    qualifier_strings = []
+    with open(kg_edge_csv, 'r', encoding='utf-8') as f:
+        for line in f:
+            columns = line.rstrip('\n').split('\t')
+            if len(columns) == 6 and columns[5]:
+                qualifier_strings.append(columns[5])
+                if len(qualifier_strings) >= limit:
+                    break
+    return qualifier_strings
+
+
+def benchmark(name, qualifier_strings, number):
+    """Time both parsers on a list of qualifier strings, after checking that they produce the same results."""
+    for qualifier_string in qualifier_strings:
+        expected = parse_with_regex(qualifier_string)
+        actual = parse_souffle_qualifiers(qualifier_string)
+        if actual != expected:
+            raise RuntimeError(f"Parsers disagree on '{qualifier_string}': {expected} != {actual}")
+
+    timings = {
+        "regex (compact_iris.sc)": lambda: [parse_with_regex(s) for s in qualifier_strings],
+        "single-pass": lambda: [parse_souffle_qualifiers(s) for s in qualifier_strings],
+        "single-pass, first only": lambda: [next(iter_souffle_qualifiers(s)) for s in qualifier_strings],
+    }
+    for parser_name, fn in timings.items():
+        seconds = min(timeit.repeat(fn, number=number, repeat=3)) / number
+        logging.info(f"{name:>24} | {parser_name:>24}: {seconds * 1e6 / len(qualifier_strings):8.2f} µs/string")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parsers for the qualifier format in kg_edge.csv.")
+    parser.add_argument("--kg-edge-csv", help="A kg_edge.csv file to read qualifier strings from.")
+    parser.add_argument("--limit", type=int, default=100_000,
+                        help="Maximum number of qualifier strings to read from kg_edge.csv (default: 100,000).")
+    parser.add_argument("--number", type=int, default=20, help="Number of times to parse each set of strings.")
+    args = parser.parse_args()
+
+    # Make sure that malformed strings fail, and report where.
+    for qualifier_string in MALFORMED_QUALIFIER_STRINGS:
+        try:
+            parse_souffle_qualifiers(qualifier_string)
+        except QualifierParseError as e:
+            logging.info(f"Rejected malformed qualifier string: {e}")
+        else:
+            raise RuntimeError(f"Malformed qualifier string was not rejected: {qualifier_string}")
+
+    for count in [1, 2, 4, 16, 64]:
+        benchmark(f"{count} qualifier(s)", [synthetic_qualifier_string(count)] * 1000, args.number)
+
+    if args.kg_edge_csv:
+        qualifier_strings = read_qualifier_strings(args.kg_edge_csv, args.limit)
+        logging.info(f"Read {len(qualifier_strings)} qualifier strings from {args.kg_edge_csv}.")
+        if qualifier_strings:
+            benchmark("kg_edge.csv", qualifier_strings, max(1, args.number // 10))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+import argparse
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+import requests
+
+from api_workload import DEFAULT_API_ENDPOINT, DEFAULT_TRAPI_VERSION, ENDPOINTS, build_workload
+
+# orjson is optional: it decodes large responses several times faster than the json module.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logging.basicConfig(level=logging.INFO)
+
+# Measure and validate the responses of the CAM-KP API to the requests that the tests make (see
+# scripts/api_workload.py), to catch KG rebuilds that make responses pathologically large.
+#
+# Every response is streamed in chunks of --chunk-size bytes into a single buffer, and parsed exactly once, with the
+# json module or (--json-backend orjson) with orjson. For every request, this records:
+# - the status, the number of bytes in the (decompressed) body, the time to the first byte and to the last byte,
+# - the time taken to decode the body, and the number of results, knowledge graph nodes and knowledge graph edges in a
+#   TRAPI response, and
+# - the peak memory allocated while the response was read and decoded, as measured by tracemalloc (which slows
+#   decoding down, so --no-trace-memory turns it off when only the times matter).
+# A TRAPI response that is missing the query graph, knowledge graph or results, or that is bigger than --max-bytes or
+# has more than --max-results results, fails validation, and the script exits with status 1.
+#
+# Usage: benchmark-responses.py [--api-endpoint https://automat.renci.org/cam-kp/] [--json-backend orjson] \
+#   [--max-bytes 100MiB] [--output reports/responses.json]
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_TIMEOUT = 300
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+DEFAULT_ENDPOINTS = ['query', 'meta_knowledge_graph']
+JSON_BACKENDS = ['json', 'orjson']
+
+
+def decoder(backend):
+    """Return the function that decodes a response body with a JSON backend."""
+    if backend == 'orjson':
+        if orjson is None:
+            sys.exit("--json-backend orjson requires the orjson package (pip install orjson).")
+        return orjson.loads
+    return json.loads
+
+
+def measure(session, request, decode, chunk_size, timeout, trace_memory):
+    """
+    Send a request, stream its response into a buffer and decode it once.
+
+    :return: A tuple of the measurements (a dictionary) and the decoded response (or None).
+    """
+    if trace_memory:
+        tracemalloc.start()
+    measurement = {'endpoint': request.endpoint, 'name': request.name}
+    response_json = None
+    start = time.perf_counter()
+    try:
+        with session.request(request.method, request.url, json=request.body, timeout=timeout, stream=True) as response:
+            measurement['status'] = response.status_code
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size):
+                if not body:
+                    measurement['first_byte_seconds'] = time.perf_counter() - start
+                body += chunk
+        measurement['last_byte_seconds'] = time.perf_counter() - start
+        measurement['bytes'] = len(body)
+        if response.ok:
+            decode_start = time.perf_counter()
+            response_json = decode(body)
+            measurement['decode_seconds'] = time.perf_counter() - decode_start
+        del body
+    except (requests.RequestException, ValueError) as e:
+        measurement['error'] = f"{type(e).__name__}: {e}"
+    if trace_memory:
+        measurement['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return measurement, response_json
+
+
+def validate(measurement, response_json, max_bytes, max_results):
+    """
+    Check a response, adding the sizes of a TRAPI response to its measurements.
+
+    :return: A list of problems with the response.
+    """
+    problems = []
+    if 'error' in measurement:
+        return [measurement['error']]
+    if not 200 <= measurement['status'] < 300:
+        problems.append(f"status {measurement['status']}")
+    if measurement['bytes'] > max_bytes:
+        problems.append(f"{measurement['bytes']} bytes is more than {max_bytes}")
+    if measurement['endpoint'] == 'query' and response_json is not None:
+        message = response_json.get('message') or {}
+        for section in ['query_graph', 'knowledge_graph', 'results']:
+            if section not in message:
+                problems.append(f"no {section} in message")
+        knowledge_graph = message.get('knowledge_graph') or {}
+        measurement['results'] = len(message.get('results') or [])
+        measurement['kg_nodes'] = len(knowledge_graph.get('nodes') or {})
+        measurement['kg_edges'] = len(knowledge_graph.get('edges') or {})
+        if max_results is not None and measurement['results'] > max_results:
+            problems.append(f"{measurement['results']} results is more than {max_results}")
+    return problems
+
+
+def format_bytes(value):
+    for suffix in ['B', 'KiB', 'MiB', 'GiB']:
+        if abs(value) < 1024:
+            return f"{value:.1f}{suffix}"
+        value /= 1024
+    return f"{value:.1f}TiB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure and validate the sizes of CAM-KP API responses.")
+    parser.add_argument("--api-endpoint", default=DEFAULT_API_ENDPOINT,
+                        help=f"The CAM-KP API to test (default: $CAM_KP_API_ENDPOINT or {DEFAULT_API_ENDPOINT}).")
+    parser.add_argument("--trapi-version", default=DEFAULT_TRAPI_VERSION,
+                        help=f"The TRAPI version (default: $TRAPI_VERSION or {DEFAULT_TRAPI_VERSION}).")
+    parser.add_argument("--endpoints", default=','.join(DEFAULT_ENDPOINTS),
+                        help=f"A comma-separated list of the endpoints to test, out of {','.join(ENDPOINTS)} "
+                             f"(default: {','.join(DEFAULT_ENDPOINTS)}).")
+    parser.add_argument("--json-backend", choices=JSON_BACKENDS, default='json',
+                        help="The JSON library to decode responses with (default: json).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"The number of bytes to read at a time (default: {DEFAULT_CHUNK_SIZE}).")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help=f"The timeout of every request in seconds (default: {DEFAULT_TIMEOUT}).")
+    parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES,
+                        help=f"Fail responses bigger than this many bytes (default: {DEFAULT_MAX_BYTES}).")
+    parser.add_argument("--max-results", type=int, help="Fail TRAPI responses with more results than this.")
+    parser.add_argument("--no-trace-memory", action="store_true",
+                        help="Don't measure the peak memory of every response, which slows down decoding.")
+    parser.add_argument("-o", "--output", help="Also write the measurements to this JSON file.")
+    args = parser.parse_args()
+
+    endpoints = args.endpoints.split(',')
+    if set(endpoints) - set(ENDPOINTS):
+        parser.error(f"Unknown endpoints: {', '.join(sorted(set(endpoints) - set(ENDPOINTS)))}")
+    workload = build_workload(args.api_endpoint, args.trapi_version, endpoints=endpoints)
+    decode = decoder(args.json_backend)
+
+    measurements = []
+    failed = []
+    print(f"{'request':<60} {'bytes':>10} {'total':>8} {'decode':>8} {'peak mem':>10} {'results':>8}")
+    with requests.Session() as session:
+        for request in workload:
+            measurement, response_json = measure(session, request, decode, args.chunk_size, args.timeout,
+                                                 not args.no_trace_memory)
+            problems = validate(measurement, response_json, args.max_bytes, args.max_results)
+            del response_json
+            measurement['problems'] = problems
+            measurements.append(measurement)
+            if problems:
+                failed.append(request.name)
+            print(f"{request.name:<60} {format_bytes(measurement.get('bytes', 0)):>10} "
+                  f"{measurement.get('last_byte_seconds', 0):>7.2f}s {measurement.get('decode_seconds', 0):>7.3f}s "
+                  f"{format_bytes(measurement.get('peak_memory_bytes', 0)):>10} {measurement.get('results', ''):>8}"
+                  + (f"  FAILED: {'; '.join(problems)}" if problems else ''))
+
+    if args.output:
+        if os.path.dirname(args.output):
+            os.makedirs(os.path.dirname(args.output), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'api_endpoint': args.api_endpoint,
+                'json_backend': args.json_backend,
+                'measurements': measurements,
+            }, f, indent=2)
+        logging.info(f"Wrote the measurements to {args.output}.")
+
+    if failed:
+        print(f"{len(failed)} responses failed validation: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+import argparse
+import logging
+
+from stand_in_server import DEFAULT_UPSTREAMS, StandInServer
+
+logging.basicConfig(level=logging.INFO)
+
+# Run a local stand-in for CAM-KP and NodeNorm that replays recorded responses (see scripts/stand_in_server.py), so
+# that the tests and benchmarks can run without network access.
+#
+# Usage:
+#   cam-kp-stand-in.py --record tests/recordings      # record the responses from the real services
+#   cam-kp-stand-in.py tests/recordings               # replay them
+#   cam-kp-stand-in.py --kg kg_duplicated.tsv tests/recordings   # also answer unrecorded queries from a KG
+# and then, in another shell:
+#   CAM_KP_API_ENDPOINT=http://127.0.0.1:8080/cam-kp/ NODE_NORM_API_ENDPOINT=http://127.0.0.1:8080/nodenorm/ pytest
+#
+# tests/conftest.py can also start this server by itself (see CAM_KP_RECORDINGS there).
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay (or record) CAM-KP and NodeNorm responses locally.")
+    parser.add_argument("recordings_dir", help="The directory of recorded responses.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"The address to listen on (default: {DEFAULT_HOST}).")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help=f"The port to listen on (default: {DEFAULT_PORT}).")
+    parser.add_argument("--record", action="store_true",
+                        help="Forward every request to the upstream service and record its response.")
+    parser.add_argument("--upstream", action="append", default=[], metavar="PREFIX=URL",
+                        help=f"The service to forward requests under /PREFIX to (default: "
+                             f"{', '.join(f'{prefix}={url}' for prefix, url in DEFAULT_UPSTREAMS.items())}).")
+    parser.add_argument("--kg", help="Answer TRAPI queries that weren't recorded from this kg_duplicated.tsv.")
+    parser.add_argument("--biolink-facts", help="biolink.facts, for --kg.")
+    parser.add_argument("--node-categories", help="kg_node_categories.tsv, for --kg.")
+    args = parser.parse_args()
+
+    upstreams = DEFAULT_UPSTREAMS
+    if args.upstream:
+        upstreams = {}
+        for upstream in args.upstream:
+            prefix, url = upstream.split('=', 1)
+            upstreams[prefix.strip('/') + '/'] = url
+    local_kg = None
+    if args.kg:
+        from trapi_engine import LocalKG
+        local_kg = LocalKG(args.kg, biolink_facts_file=args.biolink_facts, node_categories_file=args.node_categories)
+        logging.info(f"Loaded {len(local_kg)} edges from {args.kg}.")
+
+    server = StandInServer((args.host, args.port), args.recordings_dir, upstreams=upstreams, record=args.record,
+                           local_kg=local_kg)
+    mode = "Recording" if args.record else "Replaying"
+    logging.info(f"{mode} {', '.join(f'{server.url}{prefix}' for prefix in upstreams)} "
+                 f"{'into' if args.record else 'from'} {args.recordings_dir}.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
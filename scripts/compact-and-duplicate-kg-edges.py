@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+import argparse
+import logging
+from contextlib import ExitStack
+
+from iri_compaction import DEFAULT_IRI_CACHE_SIZE, IRICompactor, load_namespaces
+from kg_io import COMPRESSION_FORMATS, map_chunks, open_input, open_output, prefetch, read_chunks
+from qualifiers import (ExpansionReport, QualifierExpander, QualifierParseError, add_expansion_arguments,
+                        expansion_settings, iter_souffle_qualifiers)
+
+logging.basicConfig(level=logging.INFO)
+
+# Convert kg_edge.csv (as written out by scripts/kg_edges) directly into kg_duplicated.tsv in a single streaming pass.
+# This does the work of two steps:
+# - scripts/compact_iris.sc, which compacts IRIs into CURIEs and rewrites qualifiers as JSON to create kg.tsv, and
+# - scripts/duplicate-spog-for-multivalued-qualifiers.py, which duplicates every row of kg.tsv for every combination
+#   of qualifier values.
+# but without writing out and re-reading kg.tsv. The output should be the same as running both of these steps.
+#
+# kg_edge.csv has six columns: subject, predicate, object, graph, primary knowledge source and qualifiers, where
+# qualifiers are written out as (<predicate>=((<value>)))||(<predicate2>=((<value2>)))||...
+#
+# Like duplicate-spog-for-multivalued-qualifiers.py, this reads its input in chunks which can be processed by a pool
+# of worker processes, and supports the same limits on qualifier expansion and the same compressed files.
+
+# By default, read about 16 MiB of lines at a time.
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+
+# The IRI compactor and qualifier expander used in this process, which are replaced by configure() with the settings
+# requested on the command line.
+compactor = None
+expander = None
+
+
+def compact_cell(cell):
+    """
+    Compact a cell from kg_edge.csv if it is an IRI in angle brackets; otherwise return it unchanged.
+    """
+    if len(cell) > 2 and cell[0] == '<' and cell[-1] == '>':
+        return compactor.compact(cell[1:-1])
+    return cell
+
+
+def parse_and_compact_qualifiers(qualifier_string):
+    """
+    Parse the qualifiers in kg_edge.csv into (qualifier_type_id, qualifier_value) pairs, compacting any IRIs.
+    """
+    return [(compactor.compact(qualifier_type), compact_cell(qualifier_value))
+            for qualifier_type, qualifier_value in iter_souffle_qualifiers(qualifier_string)]
+
+
+def configure(namespaces, iri_cache_size, cache_size, max_expansion, excess_policy):
+    """
+    Configure IRI compaction and qualifier expansion in this process. This is also used to initialize worker processes.
+    """
+    global compactor, expander
+    compactor = IRICompactor(namespaces, iri_cache_size)
+    expander = QualifierExpander(parse_and_compact_qualifiers, cache_size, max_expansion, excess_policy)
+
+
+def process_line(line, report, spill):
+    """
+    Compact and expand a single line of kg_edge.csv into one or more lines of kg_duplicated.tsv.
+
+    :param line: A line from kg_edge.csv, without its trailing newline.
+    :param report: An ExpansionReport to record the expansion factor of this line in.
+    :param spill: A list to append this line to if it is spilled (see --on-excess).
+    :return: The output lines as a single string.
+    """
+    columns = line.split('\t')
+    if len(columns) != 6:
+        raise ValueError("kg_edge.csv should have 6 tab-delimited columns, but this line has " + str(len(columns)) + " columns: " + line)
+
+    qualifier_string = columns[5]
+    if qualifier_string == '':
+        # No qualifier? Just compact the IRIs.
+        return "\t".join(map(compact_cell, columns)) + "\n"
+
+    prefix = "\t".join(map(compact_cell, columns[:5])) + "\t"
+    try:
+        return expander.expand_row(prefix, qualifier_string, line, report, spill)
+    except QualifierParseError as e:
+        raise ValueError(f"{e} in line: {line}") from e
+
+
+def process_chunk(chunk):
+    """
+    Compact and expand a chunk of complete lines from kg_edge.csv. This is the unit of work handed to worker processes.
+
+    :param chunk: A bytes object containing complete lines from kg_edge.csv.
+    :return: A tuple of the output lines for the entire chunk as a single bytes object, the spilled lines as a
+        single bytes object, and an ExpansionReport for this chunk.
+    """
+    report = ExpansionReport()
+    spill = []
+    cache_counts_before = expander.cache_counts()
+
+    lines = chunk.decode('utf-8').split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    output = "".join([process_line(line, report, spill) for line in lines])
+
+    report.counts.update(expander.cache_counts() - cache_counts_before)
+    return output.encode('utf-8'), "".join(spill).encode('utf-8'), report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compact IRIs in kg_edge.csv and duplicate s/p/o/g rows for every multivalued qualifier.")
+    parser.add_argument("prefix_map_file", help="The Biolink Model prefix map (biolink-model-prefix-map.json).")
+    parser.add_argument("supplemental_namespaces_file", help="Additional namespaces (supplemental-namespaces.json).")
+    parser.add_argument("input_file", help="The input file (kg_edge.csv), or '-' for stdin.")
+    parser.add_argument("output_file", help="The output file (kg_duplicated.tsv), or '-' for stdout.")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="Number of worker processes to use (default: 1, i.e. no worker processes).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"Approximate number of bytes to hand to a worker at a time (default: {DEFAULT_CHUNK_SIZE}).")
+    parser.add_argument("--iri-cache-size", type=int, default=DEFAULT_IRI_CACHE_SIZE,
+                        help=f"Number of recently compacted IRIs to cache in each process, or 0 to disable caching "
+                             f"(default: {DEFAULT_IRI_CACHE_SIZE}).")
+    add_expansion_arguments(parser)
+    parser.add_argument("--output-compression", choices=COMPRESSION_FORMATS,
+                        help="Compression format for the output file (default: based on its extension, or none "
+                             "for stdout).")
+    args = parser.parse_args()
+
+    settings = (load_namespaces(args.prefix_map_file, args.supplemental_namespaces_file), args.iri_cache_size,
+                *expansion_settings(parser, args))
+    configure(*settings)
+    report = ExpansionReport()
+
+    with ExitStack() as stack:
+        fin = stack.enter_context(open_input(args.input_file))
+        fout = stack.enter_context(open_output(args.output_file, args.output_compression))
+        fspill = stack.enter_context(open_output(args.spill_file)) if args.spill_file else None
+
+        # Read and decompress the input in a background thread.
+        chunks = prefetch(read_chunks(fin, args.chunk_size))
+        if args.workers > 1:
+            logging.info(f"Processing kg_edge.csv in {args.workers} worker processes.")
+        results = map_chunks(process_chunk, chunks, args.workers, initializer=configure, initargs=settings)
+        for output, spilled, chunk_report in results:
+            fout.write(output)
+            if spilled:
+                fspill.write(spilled)
+            report.update(chunk_report)
+
+    report.log()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+import argparse
+import logging
+from urllib.parse import quote
+from xml.etree.ElementTree import iterparse
+
+from id_mapping import MappingIndex
+from kg_io import map_chunks, open_input, open_output
+
+logging.basicConfig(level=logging.INFO)
+
+# Convert the CTD chemical-gene interactions (CTD_chem_gene_ixns_structured.xml) into N-Quads in parallel. This is an
+# experiment in streaming the multi-gigabyte file, which the ctd-to-owl JVM tool converts in a single thread; it is NOT
+# a replacement for ctd-to-owl.
+#
+# The XML is streamed with iterparse(), and every <ixn> element is reduced to a small tuple and cleared as soon as it
+# has been read, so memory use stays flat. Batches of interactions are converted into N-Quads in a pool of worker
+# processes (--workers), and written out in their original order. Every interaction becomes its own graph, whose IRI is
+# http://ctdbase.org/detail.go?type=relationship&ixnId=<id>, so that kg_edges.dl still gives these edges a primary
+# source of infores:ctd. Within that graph:
+# - every chemical or gene actor is an individual (http://purl.obolibrary.org/obo/CTDI_<id>_<position>) whose type is
+#   the CHEBI term for the chemical (looked up in the index of chebi_mesh.tsv, falling back to the MESH term) or the
+#   NCBIGene term for the gene,
+# - the first actor is connected to every chemical or gene in the second actor with "directly physically interacts
+#   with" (RO:0002436) if the interaction is a binding, or "causally influences" (RO:0002566) otherwise, and an actor
+#   that is itself an interaction is converted in the same way, and
+# - the graph is an owl:Ontology, with a dc:source of PMID:<pmid> for every reference.
+# This is a much simpler model than the one ctd-to-owl produces (which, for instance, models the actions of every
+# interaction as processes with their own qualifiers), so the KG built from it would lose most of the CTD edges'
+# detail. ctd-models.nq is therefore always built with ctd-to-owl, and nothing in the pipeline reads the output of this
+# script (ctd-models-python.nq in the Makefile), which is only there to measure and compare the conversion.
+#
+# The MESH to CHEBI mappings are read from the memory-mapped index of chebi_mesh.tsv (mapping-indexes/chebi_mesh.idx,
+# see scripts/id_mapping.py), which every worker opens without parsing the TSV file, and looked up a batch at a time.
+#
+# Usage: ctd-to-nquads.py -j 4 mapping-indexes/chebi_mesh.idx CTD_chem_gene_ixns_structured.xml ctd-models-python.nq
+
+# The number of interactions to hand to a worker at a time.
+DEFAULT_BATCH_SIZE = 5000
+
+GRAPH_PREFIX = 'http://ctdbase.org/detail.go?type=relationship&ixnId='
+INDIVIDUAL_PREFIX = 'http://purl.obolibrary.org/obo/CTDI_'
+CHEBI_PREFIX = 'http://purl.obolibrary.org/obo/CHEBI_'
+MESH_PREFIX = 'http://id.nlm.nih.gov/mesh/'
+NCBIGENE_PREFIX = 'http://identifiers.org/ncbigene/'
+
+RDF_TYPE = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>'
+OWL_ONTOLOGY = '<http://www.w3.org/2002/07/owl#Ontology>'
+OWL_NAMED_INDIVIDUAL = '<http://www.w3.org/2002/07/owl#NamedIndividual>'
+DC_SOURCE = '<http://purl.org/dc/elements/1.1/source>'
+DIRECTLY_INTERACTS_WITH = '<http://purl.obolibrary.org/obo/RO_0002436>'
+CAUSALLY_INFLUENCES = '<http://purl.obolibrary.org/obo/RO_0002566>'
+
+# The CTD action code for binding.
+BINDING = 'b'
+
+# Characters that can't appear in an IRI in N-Quads, which are percent-encoded if they appear in a CTD identifier.
+IRI_SAFE = "!$&'()*+,-./:;=?@_~"
+
+# The index of chebi_mesh.tsv (lines of 'CHEBI:<id>\tMESH:<id>'), opened in every process by open_chebi_mesh().
+chebi_mesh = None
+
+
+def open_chebi_mesh(index_file):
+    """
+    Open the index of chebi_mesh.tsv into chebi_mesh. This is also used to initialize worker processes.
+    """
+    global chebi_mesh
+    chebi_mesh = MappingIndex(index_file)
+
+
+def chemical_ids(actors):
+    """Return the IDs of the chemical actors of an interaction, including those of nested interactions."""
+    for actor in actors:
+        if actor[0] == 'ixn':
+            yield from chemical_ids(actor[2])
+        elif actor[0] == 'chemical' and actor[1]:
+            yield actor[1]
+
+
+def lookup_chebi(mesh_ids):
+    """
+    :return: A dictionary of the MESH IDs that map to a CHEBI ID (e.g. 'D001896') to that CHEBI ID (e.g. '22916'). If
+        a MESH ID maps to several, the first in the index is used.
+    """
+    mesh_ids = sorted(set(mesh_ids))
+    chebi_for_mesh = {}
+    for mesh_id, chebis in zip(mesh_ids, chebi_mesh.reverse_many([f"MESH:{mesh_id}" for mesh_id in mesh_ids])):
+        chebis = [chebi for chebi in chebis if chebi.startswith('CHEBI:')]
+        if chebis:
+            chebi_for_mesh[mesh_id] = chebis[0][len('CHEBI:'):]
+    return chebi_for_mesh
+
+
+def extract_actor(element):
+    """
+    Reduce an <actor> element to a tuple: ('ixn', actions, actors) for a nested interaction, or (type, id) otherwise.
+    """
+    if element.get('type') == 'ixn':
+        return ('ixn', [axn.get('code') for axn in element.findall('axn')],
+                [extract_actor(actor) for actor in element.findall('actor')])
+    return (element.get('type'), element.get('id'))
+
+
+def extract_interaction(element):
+    """
+    Reduce an <ixn> element to a picklable tuple of its ID, PubMed IDs, action codes and actors.
+    """
+    return (element.get('id'),
+            [reference.get('pmid') for reference in element.findall('reference') if reference.get('pmid')],
+            [axn.get('code') for axn in element.findall('axn')],
+            [extract_actor(actor) for actor in element.findall('actor')])
+
+
+def iri(prefix, identifier):
+    return f"<{prefix}{quote(identifier, safe=IRI_SAFE)}>"
+
+
+def actor_type(kind, identifier, chebi_for_mesh):
+    """Return the class IRI for a chemical or gene actor, or None for an actor we don't know how to type."""
+    if kind == 'chemical':
+        chebi = chebi_for_mesh.get(identifier)
+        return iri(CHEBI_PREFIX, chebi) if chebi else iri(MESH_PREFIX, identifier)
+    if kind == 'gene':
+        return iri(NCBIGENE_PREFIX, identifier)
+    return None
+
+
+def convert_actors(actions, actors, ixn_id, path, graph, quads, chebi_for_mesh):
+    """
+    Add the quads for the actors of an interaction (or a nested interaction) to a list.
+
+    :param path: The position of this interaction within the top-level interaction, e.g. '' or '2_'.
+    :param chebi_for_mesh: The CHEBI IDs of the chemicals, as returned by lookup_chebi().
+    :return: The individuals for the chemicals and genes in this interaction, including nested interactions.
+    """
+    individuals = []
+    for position, actor in enumerate(actors, 1):
+        actor_path = f"{path}{position}"
+        if actor[0] == 'ixn':
+            individuals.append(convert_actors(actor[1], actor[2], ixn_id, actor_path + '_', graph, quads,
+                                              chebi_for_mesh))
+            continue
+        class_iri = actor_type(*actor, chebi_for_mesh)
+        if class_iri is None or not actor[1]:
+            individuals.append([])
+            continue
+        individual = iri(INDIVIDUAL_PREFIX, f"{ixn_id}_{actor_path}")
+        quads.append(f"{individual} {RDF_TYPE} {OWL_NAMED_INDIVIDUAL} {graph} .\n")
+        quads.append(f"{individual} {RDF_TYPE} {class_iri} {graph} .\n")
+        individuals.append([individual])
+
+    if len(individuals) >= 2:
+        relation = DIRECTLY_INTERACTS_WITH if BINDING in actions else CAUSALLY_INFLUENCES
+        for subject in individuals[0]:
+            for obj in individuals[1]:
+                quads.append(f"{subject} {relation} {obj} {graph} .\n")
+    return [individual for group in individuals for individual in group]
+
+
+def convert_interaction(interaction, chebi_for_mesh):
+    """Convert an interaction (as returned by extract_interaction()) into a list of N-Quads lines."""
+    ixn_id, pmids, actions, actors = interaction
+    graph = iri(GRAPH_PREFIX, ixn_id)
+    quads = [f"{graph} {RDF_TYPE} {OWL_ONTOLOGY} {graph} .\n"]
+    quads.extend(f'{graph} {DC_SOURCE} "PMID:{pmid}" {graph} .\n' for pmid in pmids if pmid.isdigit())
+    convert_actors(actions, actors, ixn_id, '', graph, quads, chebi_for_mesh)
+    return quads
+
+
+def convert_batch(batch):
+    """
+    Convert a batch of interactions into N-Quads. This is the unit of work handed to workers.
+
+    :return: A tuple of the N-Quads as a single bytes object, and the number of quads in it.
+    """
+    chebi_for_mesh = lookup_chebi(mesh_id for interaction in batch for mesh_id in chemical_ids(interaction[3]))
+    quads = []
+    for interaction in batch:
+        quads.extend(convert_interaction(interaction, chebi_for_mesh))
+    return "".join(quads).encode('utf-8'), len(quads)
+
+
+def read_interactions(fin, batch_size):
+    """
+    Stream the top-level <ixn> elements of the CTD XML, yielding them in batches of extracted tuples.
+    """
+    batch = []
+    depth = 0
+    root = None
+    for event, element in iterparse(fin, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1 and element.tag == 'ixn':
+            if element.get('id'):
+                batch.append(extract_interaction(element))
+            # Drop the interaction from the tree, so that the tree never holds more than one interaction.
+            root.clear()
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert CTD chemical-gene interactions into N-Quads.")
+    parser.add_argument("chebi_mesh_index", help="The index of the mapping from CHEBI to MESH IDs (chebi_mesh.idx).")
+    parser.add_argument("input_file", help="CTD_chem_gene_ixns_structured.xml (optionally compressed), or '-'.")
+    parser.add_argument("output_file", help="The N-Quads file to write, or '-' for stdout.")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="Number of worker processes to use (default: 1, i.e. no worker processes).")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Number of interactions to hand to a worker at a time (default: {DEFAULT_BATCH_SIZE}).")
+    args = parser.parse_args()
+
+    open_chebi_mesh(args.chebi_mesh_index)
+    logging.info(f"Opened {len(chebi_mesh)} CHEBI to MESH mappings in {args.chebi_mesh_index}.")
+
+    quad_count = 0
+    with open_input(args.input_file) as fin, open_output(args.output_file) as fout:
+        batches = read_interactions(fin, args.batch_size)
+        for output, count in map_chunks(convert_batch, batches, args.workers, initializer=open_chebi_mesh,
+                                        initargs=(args.chebi_mesh_index,)):
+            fout.write(output)
+            quad_count += count
+    logging.info(f"Wrote {quad_count} quads to {args.output_file}.")
+
+
+if __name__ == "__main__":
+    main()
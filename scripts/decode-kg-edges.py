@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+import argparse
+import logging
+
+from kg_io import open_input, open_output, prefetch, read_chunks
+from symbol_table import load_terms
+
+logging.basicConfig(level=logging.INFO)
+
+# Convert the kg_edge.csv written by kg_edges compiled with `souffle -M INTERNED` back into the kg_edge.csv that
+# kg_edges writes when it reads IRIs (see scripts/kg_edges.dl and scripts/intern-facts.py), using the symbols.tsv
+# written by intern-facts.py. The interned kg_edge.csv has the same six columns, except that:
+# - subject, predicate and object are term IDs,
+# - the provenance column is the ID of the graph, rather than the graph IRI without its angle brackets, and
+# - qualifiers are written out as (<type ID>=((<value ID>)))||..., e.g. (19=((1234))).
+#
+# Usage: decode-kg-edges.py interned/symbols.tsv interned/kg_edge.csv kg_edge.csv
+
+# By default, read about 16 MiB of lines at a time.
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def decode_qualifiers(qualifier_string, terms):
+    """
+    Decode a list of interned qualifiers into the format written out by kg_edges.dl.
+
+    :param qualifier_string: A list of qualifiers such as '(19=((1234)))||(19=((1235)))', or an empty string.
+    :param terms: A list of terms indexed by their ID.
+    :return: The same list of qualifiers with the IDs replaced by terms.
+    """
+    if qualifier_string == '':
+        return ''
+    qualifiers = []
+    for qualifier in qualifier_string.split('||'):
+        if not (qualifier.startswith('(') and qualifier.endswith(')))')):
+            raise ValueError(f"Could not parse interned qualifier '{qualifier}' in '{qualifier_string}'")
+        qualifier_type, qualifier_value = qualifier[1:-3].split('=((')
+        qualifiers.append(f"({terms[int(qualifier_type)]}=(({terms[int(qualifier_value)]})))")
+    return '||'.join(qualifiers)
+
+
+def decode_line(line, terms):
+    """
+    Decode a line of interned kg_edge.csv (without its trailing newline).
+    """
+    columns = line.split('\t')
+    if len(columns) != 6:
+        raise ValueError(f"kg_edge.csv should have 6 tab-delimited columns, but this line has {len(columns)} "
+                         f"columns: {line}")
+    subject_id, predicate_id, object_id, graph_id, primary_source, qualifier_string = columns
+    graph = terms[int(graph_id)]
+    return "\t".join([terms[int(subject_id)], terms[int(predicate_id)], terms[int(object_id)], graph[1:-1],
+                      primary_source, decode_qualifiers(qualifier_string, terms)]) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode an interned kg_edge.csv back into IRIs.")
+    parser.add_argument("symbols_file", help="The symbol table written by intern-facts.py (symbols.tsv).")
+    parser.add_argument("input_file", help="The interned kg_edge.csv, or '-' for stdin.")
+    parser.add_argument("output_file", help="The decoded kg_edge.csv, or '-' for stdout.")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"Approximate number of bytes to read at a time (default: {DEFAULT_CHUNK_SIZE}).")
+    args = parser.parse_args()
+
+    terms = load_terms(args.symbols_file)
+    logging.info(f"Loaded {len(terms)} terms from {args.symbols_file}.")
+
+    line_count = 0
+    with open_input(args.input_file) as fin, open_output(args.output_file) as fout:
+        for chunk in prefetch(read_chunks(fin, args.chunk_size)):
+            lines = chunk.decode('utf-8').split('\n')
+            if lines[-1] == '':
+                lines.pop()
+            fout.write("".join([decode_line(line, terms) for line in lines]).encode('utf-8'))
+            line_count += len(lines)
+    logging.info(f"Decoded {line_count} lines of kg_edge.csv.")
+
+
+if __name__ == "__main__":
+    main()
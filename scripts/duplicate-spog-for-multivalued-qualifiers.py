@@ -1,9 +1,11 @@
 #!/usr/bin/env python
+import argparse
 import json
 import logging
-from collections import defaultdict
-from itertools import product
-from sys import argv
+from contextlib import ExitStack
+
+from kg_io import COMPRESSION_FORMATS, map_chunks, open_input, open_output, prefetch, read_chunks
+from qualifiers import ExpansionReport, QualifierExpander, add_expansion_arguments, expansion_settings
 
 logging.basicConfig(level=logging.INFO)
 
@@ -11,57 +13,224 @@ logging.basicConfig(level=logging.INFO)
 # [{"qualifier_type_id":"biolink:anatomical_context_qualifier","qualifier_value":"GO:0005829"},{"qualifier_type_id":"biolink:anatomical_context_qualifier","qualifier_value":"GO:0005789"}]
 #
 # Unfortunately, ORION does not currently support this. So instead this little Python script is intended to unwrap
-# multivalued qualifiers.
-
-# This program has two arguments: the input file (kg.tsv) and the output file (kg_duplicated_multivalued_qualifiers.tsv).
-if len(argv) != 3:
-    print("Usage: duplicate-spog-for-multivalued-qualifiers.py <input_file> <output_file>")
-    exit(1)
-kg_input_tsv = argv[1]
-kg_output_tsv = argv[2]
-
-# Loop through the input file, unwrapping multiple qualifiers where they are found.
-with open(kg_input_tsv, 'r') as fin, open(kg_output_tsv, 'w') as fout:
-    for line in fin:
-        columns = line.strip().split('\t')
-        if len(columns) == 5:
+# multivalued qualifiers (see qualifiers.py). compact-and-duplicate-kg-edges.py does the same thing starting from
+# kg_edge.csv, without going through kg.tsv.
+#
+# kg.tsv has millions of edges, so the input is read in chunks of whole lines. Chunks can be expanded in a pool of
+# worker processes (--workers), but are always written out in their original order, so the output is identical
+# to the output of a single process. Unqualified rows are copied through as raw bytes without being decoded.
+#
+# A single row with many multivalued qualifiers can expand into a combinatorial number of rows. --max-expansion limits
+# this, and --on-excess decides whether such rows cause an error, are truncated or are spilled into a separate file.
+# A histogram of expansion factors is logged at the end of every run.
+#
+# Any of the files can be compressed with gzip (.gz) or zstd (.zst), and '-' can be used for stdin or stdout (see
+# kg_io.py).
+
+# By default, read about 16 MiB of lines at a time.
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Blocks smaller than this are processed line by line rather than being bisected any further.
+MIN_BLOCK_SIZE = 4096
+
+TAB = ord('\t')
+NEWLINE = ord('\n')
+
+
+def parse_json_qualifiers(qualifier_string):
+    """
+    Parse the JSON list of qualifiers in kg.tsv into (qualifier_type_id, qualifier_value) pairs.
+    """
+    return [(qualifier['qualifier_type_id'], qualifier['qualifier_value']) for qualifier in json.loads(qualifier_string)]
+
+
+# The expander used in this process, which is replaced by configure_expander() with the settings requested on the
+# command line.
+expander = QualifierExpander(parse_json_qualifiers)
+
+
+def configure_expander(cache_size, max_expansion, excess_policy):
+    """
+    Configure qualifier expansion in this process. This is also used to initialize worker processes.
+    """
+    global expander
+    expander = QualifierExpander(parse_json_qualifiers, cache_size, max_expansion, excess_policy)
+
+
+def expand_line(line, report, spill):
+    """
+    Expand a single line of kg.tsv into one or more lines of kg_duplicated.tsv.
+
+    :param line: A line from kg.tsv, including its trailing newline (if any).
+    :param report: An ExpansionReport to record the expansion factor of this line in.
+    :param spill: A list to append this line to if it is spilled (see --on-excess).
+    :return: The output lines as a single string.
+    """
+    columns = line.strip().split('\t')
+    if len(columns) == 5:
+        # No qualifier? Nothing to do here!
+        return line
+
+    if len(columns) != 6:
+        raise ValueError("kg.tsv should have 6 tab-delimited columns, but this line has " + str(len(columns)) + " columns: " + line)
+
+    subject = columns[0]
+    predicate = columns[1]
+    obj = columns[2]
+    graph = columns[3]
+    infores = columns[4]
+    qualifier_string = columns[5]
+
+    logging.debug(f"Processing qualifiers: {qualifier_string} in line: {line}")
+
+    prefix = f"{subject}\t{predicate}\t{obj}\t{graph}\t{infores}\t"
+    return expander.expand_row(prefix, qualifier_string, line, report, spill)
+
+
+def is_unqualified_block(chunk, start, end):
+    """
+    Check whether a block of complete lines contains only unqualified rows, using only byte counts.
+
+    Unqualified rows have four tabs, or five tabs with an empty qualifier column at the end of the line, so a block
+    of N unqualified lines has 4 * N tabs plus one for every line that ends with a tab. Qualified rows always
+    include a JSON list in the sixth column, so a block without '\t[' can't contain any of them.
+
+    :param chunk: A bytes object.
+    :param start: The start of the block in chunk.
+    :param end: The end of the block in chunk; must be just after a newline.
+    """
+    if chunk.find(b'\t[', start, end) != -1:
+        return False
+    line_count = chunk.count(b'\n', start, end)
+    trailing_tabs = chunk.count(b'\t\n', start, end)
+    return chunk.count(b'\t', start, end) == 4 * line_count + trailing_tabs
+
+
+def expand_block(chunk, start, end, output, report, spill):
+    """
+    Expand the lines in chunk[start:end], appending (start, end) ranges to be copied unchanged or bytes objects
+    to be written to output. The report and spill arguments are passed on to expand_line().
+
+    Blocks that pass is_unqualified_block() are copied in a single range. Other blocks are bisected until they are
+    small enough to be processed line by line, so that the few qualified rows in kg.tsv are found with a small
+    number of byte counts.
+    """
+    if end <= start:
+        return
+    if chunk[end - 1] == NEWLINE and is_unqualified_block(chunk, start, end):
+        output.append((start, end))
+        return
+
+    if end - start > MIN_BLOCK_SIZE:
+        middle = chunk.find(b'\n', (start + end) // 2, end - 1)
+        if middle != -1:
+            expand_block(chunk, start, middle + 1, output, report, spill)
+            expand_block(chunk, middle + 1, end, output, report, spill)
+            return
+
+    pos = start
+    while pos < end:
+        line_end = chunk.find(b'\n', pos, end)
+        if line_end == -1:
+            # The last line of the file might not end with a newline.
+            line_end = end - 1
+        tab_count = chunk.count(b'\t', pos, line_end)
+        if tab_count == 4 or (tab_count == 5 and chunk[line_end - 1] == TAB):
             # No qualifier? Nothing to do here!
-            fout.write(line)
-            continue
-
-        if len(columns) != 6:
-            raise ValueError("kg.tsv should have 6 tab-delimited columns, but this line has " + str(len(columns)) + " columns: " + line)
-
-        subject = columns[0]
-        predicate = columns[1]
-        obj = columns[2]
-        graph = columns[3]
-        infores = columns[4]
-        qualifier_string = columns[5]
-
-        logging.debug(f"Processing qualifiers: {qualifier_string} in line: {line}")
-
-        # Load qualifiers into a dictionary.
-        # We might as well uniquify these values.
-        qualifiers = json.loads(qualifier_string)
-        qualifier_values_by_type_id = defaultdict(set)
-        for qualifier in qualifiers:
-            qualifier_type = qualifier['qualifier_type_id']
-            qualifier_value = qualifier['qualifier_value']
-            qualifier_values_by_type_id[qualifier_type].add(qualifier_value)
-
-        # Repeat the subject/predicate/object/graph lines for each qualifier value.
-        # This is the first time I had one LLM check another LLM's reasoning :)
-        keys = list(qualifier_values_by_type_id.keys())
-        value_sets = [sorted(qualifier_values_by_type_id[k]) for k in keys]
-
-        # Note that we're calculating the Cartesian product for the value-sets only,
-        # so we're picking one set of values for each iteration of this loop.
-        # But then we need to put the keys back in, which is why we made sure
-        # they were both in the right order.
-        for values in product(*value_sets):
-            # Put the values back together with their keys.
-            output_qualifiers = dict(zip(keys, values))
-
-            # Write out one line for each set of values
-            fout.write(f"{subject}\t{predicate}\t{obj}\t{graph}\t{infores}\t{json.dumps(output_qualifiers)}\n")
+            output.append((pos, line_end + 1))
+        else:
+            line = chunk[pos:line_end + 1].decode('utf-8')
+            output.append(expand_line(line, report, spill).encode('utf-8'))
+        pos = line_end + 1
+
+
+def expand_chunk(chunk):
+    """
+    Expand a chunk of complete lines from kg.tsv. This is the unit of work handed to worker processes.
+
+    Most rows in kg.tsv are unqualified and are copied through as raw bytes: only qualified rows are decoded and
+    passed to expand_line().
+
+    :param chunk: A bytes object containing complete lines from kg.tsv.
+    :return: A tuple of the output lines for the entire chunk as a single bytes object, the spilled lines as a
+        single bytes object, and an ExpansionReport for this chunk.
+    """
+    report = ExpansionReport()
+    spill = []
+    cache_counts_before = expander.cache_counts()
+    pieces = []
+    expand_block(chunk, 0, len(chunk), pieces, report, spill)
+    output = merge_pieces(chunk, pieces)
+    report.counts.update(expander.cache_counts() - cache_counts_before)
+    return output, "".join(spill).encode('utf-8'), report
+
+
+def merge_pieces(chunk, pieces):
+    """
+    Merge the pieces produced by expand_block() into a single bytes object.
+
+    :param chunk: The chunk that the pieces were produced from.
+    :param pieces: A list of (start, end) ranges in chunk and bytes objects.
+    """
+    if len(pieces) == 1 and pieces[0] == (0, len(chunk)):
+        # The entire chunk was unqualified.
+        return chunk
+
+    # Merge adjacent ranges, so that every run of unqualified rows is copied with a single slice.
+    output = []
+    run_start = run_end = 0
+    for piece in pieces:
+        if isinstance(piece, tuple):
+            if piece[0] != run_end:
+                output.append(chunk[run_start:run_end])
+                run_start = piece[0]
+            run_end = piece[1]
+        else:
+            output.append(chunk[run_start:run_end])
+            output.append(piece)
+            run_start = run_end = len(chunk)
+    output.append(chunk[run_start:run_end])
+    return b"".join(output)
+
+
+def main():
+    # This program has two arguments: the input file (kg.tsv) and the output file (kg_duplicated_multivalued_qualifiers.tsv).
+    parser = argparse.ArgumentParser(description="Duplicate s/p/o/g rows in kg.tsv for every multivalued qualifier.")
+    parser.add_argument("input_file", help="The input file (kg.tsv), or '-' for stdin.")
+    parser.add_argument("output_file", help="The output file (kg_duplicated.tsv), or '-' for stdout.")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="Number of worker processes to expand qualifiers in (default: 1, i.e. no worker processes).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"Approximate number of bytes to hand to a worker at a time (default: {DEFAULT_CHUNK_SIZE}).")
+    add_expansion_arguments(parser)
+    parser.add_argument("--output-compression", choices=COMPRESSION_FORMATS,
+                        help="Compression format for the output file (default: based on its extension, or none "
+                             "for stdout).")
+    args = parser.parse_args()
+
+    settings = expansion_settings(parser, args)
+    configure_expander(*settings)
+    report = ExpansionReport()
+
+    # Loop through the input file, unwrapping multiple qualifiers where they are found.
+    with ExitStack() as stack:
+        fin = stack.enter_context(open_input(args.input_file))
+        fout = stack.enter_context(open_output(args.output_file, args.output_compression))
+        fspill = stack.enter_context(open_output(args.spill_file)) if args.spill_file else None
+
+        # Read and decompress the input in a background thread.
+        chunks = prefetch(read_chunks(fin, args.chunk_size))
+        if args.workers > 1:
+            logging.info(f"Expanding qualifiers in {args.workers} worker processes.")
+        results = map_chunks(expand_chunk, chunks, args.workers, initializer=configure_expander, initargs=settings)
+        for output, spilled, chunk_report in results:
+            fout.write(output)
+            if spilled:
+                fspill.write(spilled)
+            report.update(chunk_report)
+
+    report.log()
+
+
+if __name__ == "__main__":
+    main()
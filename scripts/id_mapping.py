@@ -0,0 +1,198 @@
+#
+# id_mapping.py -- a memory-mapped index over the identifier mappings in chebi_mesh.tsv and uniprot-to-ncbi.txt.
+#
+# These mappings are plain two-column TSV files, which every consumer used to read and parse in full. build_index()
+# compiles a mapping into a binary index file, and MappingIndex opens that file with mmap, so that opening it costs
+# next to nothing (only the pages that lookups touch are ever read, and worker processes share them through the page
+# cache) and every lookup is a binary search, in either direction.
+#
+# An index file contains:
+# - a header (HEADER), followed by the options it was built with as JSON,
+# - the forward table: one entry (ENTRY) per (left, right) pair, sorted by the UTF-8 bytes of left and then right,
+# - the reverse table: the same pairs, sorted by right and then left, and
+# - the string heap: every distinct identifier once, which the entries point into.
+# A line can map one identifier to several (e.g. '<uniprot>\t<ncbigene>;<ncbigene>' in uniprot-to-ncbi.txt, with a
+# value_separator of ';'), and an identifier can appear on several lines, so every lookup returns a list.
+#
+import bisect
+import json
+import mmap
+import os
+import struct
+
+MAGIC = b'IDMAPv1\n'
+
+# magic, number of pairs, offset of the forward table, offset of the reverse table, offset of the string heap,
+# length of the options JSON (which follows the header).
+HEADER = struct.Struct('<8sQQQQI')
+
+# Offset and length of the key, offset and length of the value, relative to the start of the string heap.
+ENTRY = struct.Struct('<IIII')
+
+
+def _read_pairs(mapping_file, left_prefix, right_prefix, value_separator):
+    pairs = set()
+    with open(mapping_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            columns = line.rstrip('\n').split('\t')
+            if len(columns) < 2 or not columns[0].strip():
+                continue
+            left = left_prefix + columns[0].strip()
+            values = columns[1].split(value_separator) if value_separator else [columns[1]]
+            for value in values:
+                if value.strip():
+                    pairs.add((left, right_prefix + value.strip()))
+    return pairs
+
+
+def build_index(mapping_file, index_file, left_prefix='', right_prefix='', value_separator=None):
+    """
+    Compile a two-column TSV mapping file into an index file.
+
+    :param mapping_file: The TSV file (e.g. chebi_mesh.tsv).
+    :param index_file: The index file to write. It is written to a temporary file first and then renamed, so that
+        readers never see a partial index.
+    :param left_prefix: A prefix to add to every identifier in the first column (e.g. 'UniProtKB:').
+    :param right_prefix: A prefix to add to every identifier in the second column (e.g. 'NCBIGene:').
+    :param value_separator: If set, the second column can hold several identifiers separated by this string.
+    :return: The number of pairs in the index.
+    """
+    options = {'left_prefix': left_prefix, 'right_prefix': right_prefix, 'value_separator': value_separator}
+    pairs = [(left.encode('utf-8'), right.encode('utf-8'))
+             for left, right in _read_pairs(mapping_file, left_prefix, right_prefix, value_separator)]
+
+    heap = bytearray()
+    heap_offsets = {}
+    for identifier in sorted({identifier for pair in pairs for identifier in pair}):
+        heap_offsets[identifier] = len(heap)
+        heap += identifier
+
+    def table(sorted_pairs):
+        entries = bytearray()
+        for key, value in sorted_pairs:
+            entries += ENTRY.pack(heap_offsets[key], len(key), heap_offsets[value], len(value))
+        return entries
+
+    forward = table(sorted(pairs))
+    reverse = table(sorted((right, left) for left, right in pairs))
+    options_json = json.dumps(options, sort_keys=True).encode('utf-8')
+    forward_offset = HEADER.size + len(options_json)
+    reverse_offset = forward_offset + len(forward)
+    heap_offset = reverse_offset + len(reverse)
+
+    tmp_file = f"{index_file}.tmp-{os.getpid()}"
+    with open(tmp_file, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(pairs), forward_offset, reverse_offset, heap_offset, len(options_json)))
+        f.write(options_json)
+        f.write(forward)
+        f.write(reverse)
+        f.write(heap)
+    os.replace(tmp_file, index_file)
+    return len(pairs)
+
+
+class _Keys:
+    """The keys of a table in an index, as a sequence of bytes that bisect can search."""
+
+    def __init__(self, index, table_offset):
+        self.index = index
+        self.table_offset = table_offset
+
+    def __len__(self):
+        return self.index.pair_count
+
+    def __getitem__(self, i):
+        key_offset, key_length, _, _ = ENTRY.unpack_from(self.index.mm, self.table_offset + i * ENTRY.size)
+        start = self.index.heap_offset + key_offset
+        return self.index.mm[start:start + key_length]
+
+
+class MappingIndex:
+    """
+    A read-only, memory-mapped mapping index written by build_index(). Use as a context manager, or call close().
+    """
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        with open(index_file, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.pair_count, forward_offset, reverse_offset, self.heap_offset, options_length = \
+            HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            self.mm.close()
+            raise ValueError(f"{index_file} is not a mapping index.")
+        self.options = json.loads(self.mm[HEADER.size:HEADER.size + options_length])
+        self._forward = _Keys(self, forward_offset)
+        self._reverse = _Keys(self, reverse_offset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.pair_count
+
+    def close(self):
+        self.mm.close()
+
+    def _value(self, table, i):
+        _, _, value_offset, value_length = ENTRY.unpack_from(self.mm, table.table_offset + i * ENTRY.size)
+        start = self.heap_offset + value_offset
+        return self.mm[start:start + value_length].decode('utf-8')
+
+    def _lookup(self, table, key, lo=0):
+        """
+        :return: The values for a key as a list, and the position of the first entry after them.
+        """
+        i = bisect.bisect_left(table, key, lo)
+        values = []
+        while i < self.pair_count and table[i] == key:
+            values.append(self._value(table, i))
+            i += 1
+        return values, i
+
+    def _lookup_many(self, table, keys):
+        # Look up the distinct keys in sorted order, so that every search can start where the last one ended.
+        results = {}
+        lo = 0
+        for key in sorted(set(keys)):
+            results[key], lo = self._lookup(table, key.encode('utf-8'), lo)
+        return [results[key] for key in keys]
+
+    def forward(self, identifier):
+        """Return the identifiers that an identifier in the first column maps to (e.g. CHEBI -> MESH)."""
+        return self._lookup(self._forward, identifier.encode('utf-8'))[0]
+
+    def reverse(self, identifier):
+        """Return the identifiers in the first column that map to an identifier in the second (e.g. MESH -> CHEBI)."""
+        return self._lookup(self._reverse, identifier.encode('utf-8'))[0]
+
+    def forward_many(self, identifiers):
+        """Look up a list of identifiers with forward(), returning a list of lists in the same order."""
+        return self._lookup_many(self._forward, identifiers)
+
+    def reverse_many(self, identifiers):
+        """Look up a list of identifiers with reverse(), returning a list of lists in the same order."""
+        return self._lookup_many(self._reverse, identifiers)
+
+
+def open_mapping(mapping_file, index_file=None, left_prefix='', right_prefix='', value_separator=None):
+    """
+    Open the index for a mapping file, building it first if it doesn't exist, is older than the mapping file, or was
+    built with different options.
+
+    :param index_file: The index file (default: the mapping file with its extension replaced by .idx).
+    :return: A MappingIndex.
+    """
+    if index_file is None:
+        index_file = os.path.splitext(mapping_file)[0] + '.idx'
+    options = {'left_prefix': left_prefix, 'right_prefix': right_prefix, 'value_separator': value_separator}
+    if os.path.exists(index_file) and os.path.getmtime(index_file) >= os.path.getmtime(mapping_file):
+        index = MappingIndex(index_file)
+        if index.options == options:
+            return index
+        index.close()
+    build_index(mapping_file, index_file, **options)
+    return MappingIndex(index_file)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import os
+
+from kg_io import open_input, open_output, prefetch, read_chunks
+from symbol_table import SymbolTable, load_program_constants
+
+logging.basicConfig(level=logging.INFO)
+
+# Replace every term in the Souffle input files of kg_edges with a dense integer ID, so that kg_edges can be compiled
+# with `souffle -M INTERNED` and read numbers instead of interning every IRI itself (see scripts/kg_edges.dl).
+#
+# Every input file is written into the output directory with the same name, together with:
+# - symbols.tsv: the ID and term of every term, for scripts/decode-kg-edges.py.
+# - symbol_text.facts: the ID and term of every term that kg_edges.dl needs to look inside, i.e. every graph and every
+#   type used with sesame:directType. This is a small fraction of all the terms.
+#
+# Every file must be interned with the same symbol table, so this runs in a single process, which keeps every distinct
+# term in memory: about 160 bytes per term for typical IRIs, i.e. a few GB for the full KG. This is a separate stage
+# (interned.dir) that finishes before Souffle starts, and scripts/run-pipeline.py budgets its memory in STAGE_MEMORY.
+#
+# Usage: intern-facts.py scripts/kg_edges.dl interned quad.facts inferred.csv biolink.facts ontology.facts ...
+
+# By default, read about 16 MiB of lines at a time.
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def intern_file(symbols, input_file, output_file, text_predicates, text_ids, chunk_size):
+    """
+    Intern every column of a TSV file.
+
+    :param symbols: The SymbolTable to use.
+    :param input_file: The TSV file to read.
+    :param output_file: The TSV file of IDs to write.
+    :param text_predicates: In quads (four columns), the IDs of the predicates whose objects need their text.
+    :param text_ids: A set to add the IDs of every term that needs its text to.
+    :param chunk_size: The approximate number of bytes to read at a time.
+    :return: The number of lines interned.
+    """
+    line_count = 0
+    with open_input(input_file) as fin, open_output(output_file) as fout:
+        for chunk in prefetch(read_chunks(fin, chunk_size)):
+            lines = chunk.decode('utf-8').split('\n')
+            if lines[-1] == '':
+                lines.pop()
+            output = []
+            for line in lines:
+                ids = symbols.intern_columns(line)
+                if len(ids) == 4:
+                    text_ids.add(ids[3])
+                    if ids[1] in text_predicates:
+                        text_ids.add(ids[2])
+                output.append("\t".join(map(str, ids)))
+            output.append("")
+            fout.write("\n".join(output).encode('utf-8'))
+            line_count += len(lines)
+    return line_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replace every term in Souffle input files with an integer ID.")
+    parser.add_argument("program_file", help="The Souffle program that will read these files (scripts/kg_edges.dl).")
+    parser.add_argument("output_dir", help="The directory to write interned files, symbols.tsv and symbol_text.facts to.")
+    parser.add_argument("input_files", nargs='+', help="The TSV files to intern.")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"Approximate number of bytes to read at a time (default: {DEFAULT_CHUNK_SIZE}).")
+    args = parser.parse_args()
+
+    constants = load_program_constants(args.program_file)
+    symbols = SymbolTable(constants)
+    text_predicates = {constants[name][0] for name in ['SESAME_DIRECT_TYPE', 'PROV_WAS_DERIVED_FROM']}
+    text_ids = set()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for input_file in args.input_files:
+        output_file = os.path.join(args.output_dir, os.path.basename(input_file))
+        line_count = intern_file(symbols, input_file, output_file, text_predicates, text_ids, args.chunk_size)
+        logging.info(f"Interned {line_count} lines from {input_file} into {output_file} ({len(symbols)} terms so far).")
+    symbols.check_size()
+
+    with open(os.path.join(args.output_dir, 'symbols.tsv'), 'w', encoding='utf-8') as f:
+        symbols.write(f)
+    with open(os.path.join(args.output_dir, 'symbol_text.facts'), 'w', encoding='utf-8') as f:
+        symbols.write(f, text_ids)
+    logging.info(f"Wrote {len(symbols)} terms, {len(text_ids)} of which are needed as text by {args.program_file}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+import argparse
+import json
+import logging
+from collections import Counter
+
+from kg_io import map_chunks, open_input, prefetch, read_chunks
+from trapi_engine import prefix_categories
+
+logging.basicConfig(level=logging.INFO)
+
+# Compute the meta knowledge graph and the metadata of kg_duplicated.tsv, in the same shape as the
+# /1.4/meta_knowledge_graph and /metadata endpoints of CAM-KP, so that a deployment can serve them as they are and
+# tests/test_api.py can compare the live endpoints against them (see META_KNOWLEDGE_GRAPH_FILE there).
+#
+# The KG is read once, in chunks that are aggregated in --workers worker processes. Every chunk is reduced to counts
+# keyed by (subject categories, predicate, object categories), where the categories of every node are looked up once
+# and interned as a tuple, along with its distinct nodes and primary knowledge sources; the counts are then merged and
+# expanded into one meta edge per combination of categories. Node categories come from kg_node_categories.tsv (see
+# scripts/kg-node-categories.py), which derives them from the Biolink class mappings as CAM-KP does; if it is given
+# as '', they come from the CURIE prefix only.
+#
+# Like CAM-KP, the meta edges don't list qualifiers, and the edge properties in the metadata are the properties of
+# every edge, not its qualifier types.
+#
+# Usage: kg-meta-knowledge-graph.py -j 4 kg_node_categories.tsv kg_duplicated.tsv meta_knowledge_graph.json \
+#   kg_metadata.json
+
+# By default, read about 16 MiB of lines at a time.
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+
+# The edge properties that every edge in CAM-KP has.
+EDGE_PROPERTIES = ['subject', 'predicate', 'object', 'primary_knowledge_source', 'aggregator_knowledge_source', 'xref']
+
+# The parts of /metadata that don't depend on the KG.
+GRAPH_METADATA = {
+    'graph_id': 'CAMKP_Automat',
+    'graph_name': 'CAM KG',
+    'sources': [{
+        'source_id': 'CAM-KP',
+        'provenance': 'infores:go-cam',
+        'attribution': 'https://github.com/ExposuresProvider/cam-kp-api',
+        'source_data_url': 'https://github.com/ExposuresProvider/cam-kp-api',
+        'license': 'https://github.com/ExposuresProvider/cam-kp-api/blob/master/LICENSE',
+    }],
+}
+
+# The categories of every node in kg_node_categories.tsv, loaded in every process by load_node_categories().
+node_categories = {}
+
+
+def load_node_categories(node_categories_file):
+    """Load kg_node_categories.tsv into node_categories. This is also used to initialize worker processes."""
+    global node_categories
+    node_categories = {}
+    if node_categories_file:
+        with open(node_categories_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                curie, _, categories = line.rstrip('\n').partition('\t')
+                if categories:
+                    node_categories[curie] = tuple(categories.split('|'))
+
+
+def categories_of(curie):
+    categories = node_categories.get(curie)
+    if categories is None:
+        categories = tuple(prefix_categories(curie))
+    return categories
+
+
+def aggregate_chunk(chunk):
+    """
+    Aggregate a chunk of kg_duplicated.tsv.
+
+    :return: A tuple of a Counter of (subject categories, predicate, object categories) to edge counts, the set of
+        nodes, and a Counter of primary knowledge sources.
+    """
+    edge_counts = Counter()
+    nodes = set()
+    sources = Counter()
+    categories = {}
+    for line in chunk.decode('utf-8').split('\n'):
+        columns = line.split('\t')
+        if len(columns) < 5:
+            continue
+        subject, predicate, obj, _, source = columns[:5]
+        if subject not in categories:
+            categories[subject] = categories_of(subject)
+        if obj not in categories:
+            categories[obj] = categories_of(obj)
+        edge_counts[categories[subject], predicate, categories[obj]] += 1
+        nodes.add(subject)
+        nodes.add(obj)
+        sources[source] += 1
+    return edge_counts, nodes, sources
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the meta knowledge graph and metadata of a KG.")
+    parser.add_argument("node_categories_file",
+                        help="The categories of the nodes (kg_node_categories.tsv), or '' to use CURIE prefixes only.")
+    parser.add_argument("kg_file", help="The KG (kg_duplicated.tsv), optionally compressed, or '-' for stdin.")
+    parser.add_argument("meta_knowledge_graph_file", help="The meta knowledge graph JSON file to write.")
+    parser.add_argument("metadata_file", help="The metadata JSON file to write.")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="Number of worker processes to use (default: 1, i.e. no worker processes).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"Approximate number of bytes to read at a time (default: {DEFAULT_CHUNK_SIZE}).")
+    args = parser.parse_args()
+
+    load_node_categories(args.node_categories_file)
+    logging.info(f"Loaded the categories of {len(node_categories)} nodes from {args.node_categories_file}.")
+
+    edge_counts = Counter()
+    nodes = set()
+    sources = Counter()
+    with open_input(args.kg_file) as fin:
+        chunks = prefetch(read_chunks(fin, args.chunk_size))
+        for chunk_edge_counts, chunk_nodes, chunk_sources in map_chunks(
+                aggregate_chunk, chunks, args.workers, initializer=load_node_categories,
+                initargs=(args.node_categories_file,)):
+            edge_counts.update(chunk_edge_counts)
+            nodes.update(chunk_nodes)
+            sources.update(chunk_sources)
+
+    # Expand the aggregated counts into one meta edge for every combination of categories.
+    meta_edges = Counter()
+    for (subject_categories, predicate, object_categories), count in edge_counts.items():
+        for subject_category in subject_categories:
+            for object_category in object_categories:
+                meta_edges[subject_category, predicate, object_category] += count
+
+    id_prefixes = {}
+    prefix_counts = Counter()
+    for node in nodes:
+        prefix = node.split(':', 1)[0]
+        prefix_counts[prefix] += 1
+        for category in categories_of(node):
+            id_prefixes.setdefault(category, set()).add(prefix)
+
+    meta_knowledge_graph = {
+        'nodes': {category: {'id_prefixes': sorted(prefixes)} for category, prefixes in sorted(id_prefixes.items())},
+        'edges': [{
+            'subject': subject_category,
+            'predicate': predicate,
+            'object': object_category,
+            'qualifiers': [],
+            'knowledge_types': ['lookup'],
+        } for subject_category, predicate, object_category in sorted(meta_edges)],
+    }
+    metadata = {
+        **GRAPH_METADATA,
+        'final_node_count': len(nodes),
+        'final_edge_count': sum(sources.values()),
+        'qc_results': {
+            'primary_knowledge_sources': sorted(sources),
+            'primary_knowledge_source_counts': dict(sorted(sources.items())),
+            'node_curie_prefixes': dict(sorted(prefix_counts.items())),
+            'edge_properties': EDGE_PROPERTIES,
+            'warnings': {},
+        },
+    }
+
+    with open(args.meta_knowledge_graph_file, 'w', encoding='utf-8') as f:
+        json.dump(meta_knowledge_graph, f, indent=2)
+    with open(args.metadata_file, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2)
+    logging.info(f"Wrote {len(meta_knowledge_graph['nodes'])} categories and {len(meta_edges)} meta edges for "
+                 f"{len(nodes)} nodes and {metadata['final_edge_count']} edges.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+import argparse
+import logging
+from collections import defaultdict
+
+from iri_compaction import IRICompactor, load_namespaces
+from kg_io import open_input, open_output
+from ntriples import split_terms
+from trapi_engine import NAMED_THING, biolink_curie, prefix_categories
+
+logging.basicConfig(level=logging.INFO)
+
+# Write the Biolink categories of the nodes in kg_duplicated.tsv, for scripts/trapi_engine.py and
+# scripts/kg-meta-knowledge-graph.py.
+#
+# Categories are derived the way CAM-KP derives them: a Biolink class is a category of every ontology class that is
+# (reflexively) a subclass of a class it maps to. The mappings are the skos:exactMatch, skos:narrowMatch and
+# skos:broadMatch of the Biolink classes in biolink.facts, plus the skos:mappingRelation triples in biolink-local.ttl,
+# and the subclasses come from the rdfs:subClassOf axioms in ontology.facts. Mappings to classes that this version of
+# the Biolink Model doesn't define (e.g. deprecated classes in biolink-local.ttl) are ignored, and
+# biolink:NamedThing is dropped when a node has a more specific category.
+#
+# Nodes that no mapping reaches (e.g. genes and proteins, which aren't ontology classes) fall back to their CURIE
+# prefix (see PREFIX_CATEGORIES in trapi_engine.py), so that every node in the KG is written out.
+#
+# Usage: kg-node-categories.py biolink-model-prefix-map.json supplemental-namespaces.json biolink.facts \
+#   biolink-local.ttl ontology.facts kg_duplicated.tsv kg_node_categories.tsv
+
+RDF_TYPE = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>'
+RDFS_SUBCLASS_OF = '<http://www.w3.org/2000/01/rdf-schema#subClassOf>'
+OWL_CLASS = '<http://www.w3.org/2002/07/owl#Class>'
+
+# The properties that map a Biolink class to the ontology classes whose subclasses belong to it.
+MAPPING_PROPERTIES = {
+    '<http://www.w3.org/2004/02/skos/core#exactMatch>',
+    '<http://www.w3.org/2004/02/skos/core#narrowMatch>',
+    '<http://www.w3.org/2004/02/skos/core#broadMatch>',
+    '<http://www.w3.org/2004/02/skos/core#mappingRelation>',
+}
+
+
+def read_triples(path, tsv):
+    """
+    Read the IRI triples in a facts file (tsv=True) or an N-Triples-like Turtle file (tsv=False).
+
+    :return: An iterator of (subject, predicate, object) tuples, with angle brackets.
+    """
+    with open_input(path) as f:
+        for line in f:
+            line = line.decode('utf-8')
+            terms = line.rstrip('\n').split('\t') if tsv else split_terms(line)
+            if len(terms) == 3:
+                yield tuple(terms)
+
+
+def read_mappings(triples, compactor):
+    """
+    :return: A tuple of a dictionary of ontology class CURIEs to the Biolink classes that map to them, and the set of
+        Biolink classes that are defined as OWL classes.
+    """
+    mappings = defaultdict(set)
+    defined = set()
+    for subject, predicate, obj in triples:
+        category = biolink_curie(subject)
+        if category is None or not category[len('biolink:'):][:1].isupper():
+            continue
+        if predicate == RDF_TYPE and obj == OWL_CLASS:
+            defined.add(category)
+        elif predicate in MAPPING_PROPERTIES and obj.startswith('<'):
+            mappings[compactor.compact(obj[1:-1])].add(category)
+    return mappings, defined
+
+
+def read_superclasses(facts_file, compactor):
+    """
+    :return: A dictionary of every class CURIE to the CURIEs of its direct named superclasses.
+    """
+    superclasses = defaultdict(set)
+    for subclass, predicate, superclass in read_triples(facts_file, tsv=True):
+        if predicate == RDFS_SUBCLASS_OF and subclass.startswith('<') and superclass.startswith('<'):
+            superclasses[compactor.compact(subclass[1:-1])].add(compactor.compact(superclass[1:-1]))
+    return superclasses
+
+
+def mapped_categories(curie, superclasses, mappings, memo):
+    """
+    :return: The Biolink classes that map to a class or any of its superclasses, as a frozenset.
+    """
+    # An iterative depth-first search, since the hierarchy can be deeper than Python's recursion limit. Cycles (e.g.
+    # equivalent classes asserted as subclasses of each other) are cut off at the class already being visited.
+    stack = [(curie, iter(superclasses.get(curie, ())))]
+    visiting = {curie}
+    found = {curie: set(mappings.get(curie, ()))}
+    while stack:
+        current, parents = stack[-1]
+        parent = next(parents, None)
+        if parent is None:
+            stack.pop()
+            visiting.discard(current)
+            memo[current] = frozenset(found.pop(current))
+            if stack:
+                found[stack[-1][0]].update(memo[current])
+        elif parent in memo:
+            found[current].update(memo[parent])
+        elif parent not in visiting:
+            visiting.add(parent)
+            found[parent] = set(mappings.get(parent, ()))
+            stack.append((parent, iter(superclasses.get(parent, ()))))
+    return memo[curie]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the Biolink categories of the nodes in kg_duplicated.tsv.")
+    parser.add_argument("prefix_map_file", help="The Biolink Model prefix map (biolink-model-prefix-map.json).")
+    parser.add_argument("supplemental_namespaces_file", help="Supplemental namespaces (supplemental-namespaces.json).")
+    parser.add_argument("biolink_facts_file", help="The Biolink Model triples (biolink.facts).")
+    parser.add_argument("biolink_local_file", help="Local Biolink class mappings (biolink-local.ttl).")
+    parser.add_argument("ontology_facts_file", help="The ontology triples (ontology.facts).")
+    parser.add_argument("kg_file", help="The KG (kg_duplicated.tsv).")
+    parser.add_argument("output_file", help="The TSV file of node CURIEs and categories to write, or '-' for stdout.")
+    args = parser.parse_args()
+
+    compactor = IRICompactor(load_namespaces(args.prefix_map_file, args.supplemental_namespaces_file))
+    biolink_mappings, defined = read_mappings(read_triples(args.biolink_facts_file, tsv=True), compactor)
+    local_mappings, _ = read_mappings(read_triples(args.biolink_local_file, tsv=False), compactor)
+    mappings = {}
+    ignored = set()
+    for curie in set(biolink_mappings) | set(local_mappings):
+        categories = biolink_mappings.get(curie, set()) | local_mappings.get(curie, set())
+        ignored.update(categories - defined)
+        if categories & defined:
+            mappings[curie] = categories & defined
+    if ignored:
+        logging.warning(f"Ignored mappings to classes that aren't in the Biolink Model: {', '.join(sorted(ignored))}.")
+    logging.info(f"Read the Biolink categories of {len(mappings)} classes from {args.biolink_facts_file} and "
+                 f"{args.biolink_local_file}.")
+    superclasses = read_superclasses(args.ontology_facts_file, compactor)
+    logging.info(f"Read the superclasses of {len(superclasses)} classes from {args.ontology_facts_file}.")
+
+    nodes = set()
+    with open_input(args.kg_file) as f:
+        for line in f:
+            columns = line.decode('utf-8').split('\t', 3)
+            nodes.update((columns[0], columns[2]) if len(columns) > 3 else ())
+
+    memo = {}
+    fallbacks = 0
+    with open_output(args.output_file) as f:
+        for node in sorted(nodes):
+            categories = mapped_categories(node, superclasses, mappings, memo)
+            if len(categories) > 1:
+                categories = categories - {NAMED_THING}
+            if not categories:
+                categories = prefix_categories(node)
+                fallbacks += 1
+            f.write(f"{node}\t{'|'.join(sorted(categories))}\n".encode('utf-8'))
+    logging.info(f"Wrote the categories of {len(nodes)} nodes to {args.output_file}, {fallbacks} of them from their "
+                 f"CURIE prefix.")
+
+
+if __name__ == "__main__":
+    main()
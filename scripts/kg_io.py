@@ -0,0 +1,298 @@
+#
+# kg_io.py -- streaming input and output for the Python steps of the pipeline.
+#
+# The files at the end of the pipeline (kg.tsv, kg_duplicated.tsv) are several gigabytes in size, so these helpers
+# read them in large chunks of complete lines, and can transparently read and write gzip- or zstd-compressed files.
+# Compression is chosen based on the file extension (.gz or .zst); '-' means stdin or stdout, in which case the
+# input compression is detected from its first few bytes. Decompression and compression run in background threads,
+# so that the main thread can spend its time parsing.
+#
+import gzip
+import queue
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+# zstd support is optional, since the zstandard package is not part of the standard library.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_BY_EXTENSION = {
+    '.gz': 'gzip',
+    '.zst': 'zstd',
+}
+COMPRESSION_BY_MAGIC_NUMBER = {
+    b'\x1f\x8b': 'gzip',
+    b'\x28\xb5\x2f\xfd': 'zstd',
+}
+COMPRESSION_FORMATS = ['none', 'gzip', 'zstd']
+
+# Compression levels that favor throughput over size.
+GZIP_COMPRESSION_LEVEL = 6
+ZSTD_COMPRESSION_LEVEL = 3
+
+# The number of chunks that may be waiting in a queue for a background thread.
+DEFAULT_QUEUE_DEPTH = 4
+
+
+def compression_for_path(path):
+    """
+    Determine the compression format for a file from its extension.
+
+    :param path: The path to the file, or '-' for stdin or stdout.
+    :return: 'gzip', 'zstd' or 'none'.
+    """
+    for extension, compression in COMPRESSION_BY_EXTENSION.items():
+        if path.endswith(extension):
+            return compression
+    return 'none'
+
+
+def compression_for_header(header):
+    """
+    Determine the compression format for a stream from its first few bytes.
+
+    :param header: The first four (or more) bytes of the stream.
+    :return: 'gzip', 'zstd' or 'none'.
+    """
+    for magic_number, compression in COMPRESSION_BY_MAGIC_NUMBER.items():
+        if header.startswith(magic_number):
+            return compression
+    return 'none'
+
+
+def _check_compression(compression):
+    if compression not in COMPRESSION_FORMATS:
+        raise ValueError(f"Unknown compression format '{compression}', expected one of {COMPRESSION_FORMATS}.")
+    if compression == 'zstd' and zstandard is None:
+        raise RuntimeError("Reading or writing zstd-compressed files requires the zstandard package "
+                           "(pip install zstandard).")
+
+
+@contextmanager
+def open_input(path):
+    """
+    Open a file (or stdin) for reading in binary, decompressing it if necessary.
+
+    :param path: The path to the file, or '-' for stdin.
+    :return: A context manager for a binary file-like object.
+    """
+    with ExitStack() as stack:
+        if path == '-':
+            raw = sys.stdin.buffer
+            compression = compression_for_header(raw.peek(4)[:4])
+        else:
+            raw = stack.enter_context(open(path, 'rb'))
+            compression = compression_for_path(path)
+
+        _check_compression(compression)
+        if compression == 'gzip':
+            yield stack.enter_context(gzip.GzipFile(fileobj=raw, mode='rb'))
+        elif compression == 'zstd':
+            yield stack.enter_context(zstandard.ZstdDecompressor().stream_reader(raw, closefd=False))
+        else:
+            yield raw
+
+
+@contextmanager
+def open_output(path, compression=None):
+    """
+    Open a file (or stdout) for writing in binary, compressing it if necessary. Writes are handed to a background
+    thread, which compresses them and writes them out.
+
+    :param path: The path to the file, or '-' for stdout.
+    :param compression: 'gzip', 'zstd' or 'none', or None to choose based on the file extension.
+    :return: A context manager for a BackgroundWriter.
+    """
+    if compression is None:
+        compression = compression_for_path(path)
+    _check_compression(compression)
+
+    with ExitStack() as stack:
+        if path == '-':
+            raw = sys.stdout.buffer
+            stack.callback(raw.flush)
+        else:
+            raw = stack.enter_context(open(path, 'wb'))
+
+        if compression == 'gzip':
+            stream = stack.enter_context(
+                gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=GZIP_COMPRESSION_LEVEL))
+        elif compression == 'zstd':
+            stream = stack.enter_context(
+                zstandard.ZstdCompressor(level=ZSTD_COMPRESSION_LEVEL).stream_writer(raw, closefd=False))
+        else:
+            stream = raw
+
+        writer = BackgroundWriter(stream)
+        try:
+            yield writer
+        finally:
+            writer.close()
+
+
+class BackgroundWriter:
+    """
+    A write-only binary stream that writes to another stream in a background thread. Any error in the background
+    thread is raised by the next call to write() or close().
+    """
+
+    def __init__(self, stream, queue_depth=DEFAULT_QUEUE_DEPTH):
+        self.stream = stream
+        self.queue = queue.Queue(maxsize=queue_depth)
+        self.error = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="BackgroundWriter", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                return
+            if self.error is None:
+                try:
+                    self.stream.write(data)
+                except BaseException as e:
+                    # Keep draining the queue so that write() doesn't block forever.
+                    self.error = e
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def write(self, data):
+        self._raise_error()
+        if data:
+            self.queue.put(data)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+        self._raise_error()
+
+
+def read_chunks(fin, chunk_size):
+    """
+    Read a binary file as a series of chunks, each of which contains only complete lines. The last chunk might not
+    end with a newline if the file doesn't.
+
+    :param fin: The file to read.
+    :param chunk_size: The approximate number of bytes to read into each chunk.
+    """
+    remainder = b''
+    while True:
+        data = fin.read(chunk_size)
+        if not data:
+            if remainder:
+                yield remainder
+            return
+        if remainder:
+            data = remainder + data
+
+        # Hold back the incomplete line at the end of this chunk until we've read the rest of it.
+        last_newline = data.rfind(b'\n')
+        if last_newline == -1:
+            remainder = data
+        elif last_newline == len(data) - 1:
+            remainder = b''
+            yield data
+        else:
+            remainder = data[last_newline + 1:]
+            yield data[:last_newline + 1]
+
+
+def prefetch(iterable, queue_depth=DEFAULT_QUEUE_DEPTH):
+    """
+    Iterate over an iterable in a background thread (e.g. to read and decompress chunks of a file), keeping up to
+    queue_depth items ready for the caller. Any error in the background thread is raised in the caller.
+
+    :param iterable: The iterable to iterate over.
+    :param queue_depth: The maximum number of items to read ahead.
+    """
+    items = queue.Queue(maxsize=queue_depth)
+    done = object()
+    stop = threading.Event()
+
+    def run():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                items.put((item, None))
+        except BaseException as e:
+            items.put((None, e))
+        items.put((done, None))
+
+    thread = threading.Thread(target=run, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        # If the caller stops early, let the background thread finish.
+        stop.set()
+        while thread.is_alive():
+            try:
+                items.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def ordered_map(executor, fn, iterable, max_in_flight):
+    """
+    Like executor.map(), but only reads as many items from the iterable as there are tasks in flight, so that we
+    don't read the entire input file into memory when the workers can't keep up.
+
+    :param executor: The executor to submit tasks to.
+    :param fn: The function to apply to every item.
+    :param iterable: The items to apply the function to.
+    :param max_in_flight: The maximum number of submitted tasks whose results have not been returned yet.
+    :return: An iterator over the results, in the same order as the items.
+    """
+    in_flight = deque()
+    for item in iterable:
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().result()
+        in_flight.append(executor.submit(fn, item))
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+def _start_worker():
+    pass
+
+
+def map_chunks(fn, chunks, workers, initializer=None, initargs=()):
+    """
+    Apply a function to every chunk, either in this process or in a pool of worker processes, and return the results
+    in the same order as the chunks.
+
+    :param fn: The function to apply to every chunk. Must be picklable if workers > 1.
+    :param chunks: The chunks to apply the function to.
+    :param workers: The number of worker processes to use, or 1 to run everything in this process.
+    :param initializer: A function to call in every worker process before processing any chunks.
+    :param initargs: The arguments to the initializer.
+    """
+    if workers <= 1:
+        yield from map(fn, chunks)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        # Start every worker process before we start reading chunks: worker processes are forked, and a process forked
+        # while another thread is reading from stdin deadlocks when multiprocessing closes stdin in the child.
+        for future in [executor.submit(_start_worker) for _ in range(workers)]:
+            future.result()
+        yield from ordered_map(executor, fn, chunks, max_in_flight=2 * workers)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import os
+
+from id_mapping import MappingIndex, build_index
+from kg_io import open_input, open_output, prefetch, read_chunks
+from stage_cache import make_ignored_dir
+
+logging.basicConfig(level=logging.INFO)
+
+# Build and query the memory-mapped identifier mapping indexes (see scripts/id_mapping.py).
+#
+# Usage:
+#   map-ids.py build chebi_mesh.tsv mapping-indexes/chebi_mesh.idx
+#   map-ids.py build --left-prefix UniProtKB: --right-prefix NCBIGene: --value-separator ';' \
+#       uniprot-to-ncbi.txt mapping-indexes/uniprot-to-ncbi.idx
+#   map-ids.py lookup mapping-indexes/chebi_mesh.idx CHEBI:22916
+#   map-ids.py lookup --reverse mapping-indexes/chebi_mesh.idx MESH:D001896
+#   map-ids.py map-column --column 1 --reverse mapping-indexes/chebi_mesh.idx input.tsv output.tsv
+#
+# map-column replaces the identifiers in one column of a TSV file, writing a row for every identifier it maps to, and
+# either keeping or dropping (--drop-unmapped) the rows whose identifier doesn't map to anything.
+
+# By default, read about 16 MiB of lines at a time.
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def build(args):
+    if os.path.dirname(args.index_file):
+        make_ignored_dir(os.path.dirname(args.index_file))
+    count = build_index(args.mapping_file, args.index_file, left_prefix=args.left_prefix,
+                        right_prefix=args.right_prefix, value_separator=args.value_separator)
+    logging.info(f"Wrote {count} pairs from {args.mapping_file} to {args.index_file}.")
+
+
+def lookup(args):
+    with MappingIndex(args.index_file) as index:
+        results = index.reverse_many(args.identifiers) if args.reverse else index.forward_many(args.identifiers)
+    for identifier, values in zip(args.identifiers, results):
+        print(identifier + "\t" + "\t".join(values))
+
+
+def map_column(args):
+    column = args.column - 1
+    row_count = 0
+    unmapped_count = 0
+    with MappingIndex(args.index_file) as index, open_input(args.input_file) as fin, \
+            open_output(args.output_file) as fout:
+        for chunk in prefetch(read_chunks(fin, args.chunk_size)):
+            rows = [line.split('\t') for line in chunk.decode('utf-8').split('\n')]
+            if rows[-1] == ['']:
+                rows.pop()
+            identifiers = [row[column] if column < len(row) else '' for row in rows]
+            results = index.reverse_many(identifiers) if args.reverse else index.forward_many(identifiers)
+            output = []
+            for row, values in zip(rows, results):
+                if not values:
+                    unmapped_count += 1
+                    if not args.drop_unmapped:
+                        output.append("\t".join(row) + "\n")
+                    continue
+                for value in values:
+                    row[column] = value
+                    output.append("\t".join(row) + "\n")
+            fout.write("".join(output).encode('utf-8'))
+            row_count += len(rows)
+    logging.info(f"Mapped {row_count - unmapped_count} of {row_count} rows.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query identifier mapping indexes.")
+    subparsers = parser.add_subparsers(dest="subcommand", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Compile a two-column TSV mapping file into an index.")
+    build_parser.add_argument("mapping_file", help="The mapping file (e.g. chebi_mesh.tsv).")
+    build_parser.add_argument("index_file", help="The index file to write (e.g. chebi_mesh.idx).")
+    build_parser.add_argument("--left-prefix", default='', help="A prefix to add to the first column.")
+    build_parser.add_argument("--right-prefix", default='', help="A prefix to add to the second column.")
+    build_parser.add_argument("--value-separator", help="The separator between several IDs in the second column.")
+    build_parser.set_defaults(func=build)
+
+    lookup_parser = subparsers.add_parser("lookup", help="Print the mappings of some identifiers.")
+    lookup_parser.add_argument("index_file", help="The index file.")
+    lookup_parser.add_argument("identifiers", nargs='+', help="The identifiers to look up.")
+    lookup_parser.add_argument("--reverse", action="store_true", help="Look up identifiers in the second column.")
+    lookup_parser.set_defaults(func=lookup)
+
+    map_parser = subparsers.add_parser("map-column", help="Map the identifiers in a column of a TSV file.")
+    map_parser.add_argument("index_file", help="The index file.")
+    map_parser.add_argument("input_file", help="The TSV file to read, or '-' for stdin.")
+    map_parser.add_argument("output_file", help="The TSV file to write, or '-' for stdout.")
+    map_parser.add_argument("--column", type=int, default=1, help="The column to map, starting at 1 (default: 1).")
+    map_parser.add_argument("--reverse", action="store_true", help="Map from the second column to the first.")
+    map_parser.add_argument("--drop-unmapped", action="store_true", help="Drop rows that don't map to anything.")
+    map_parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                            help=f"Approximate number of bytes to read at a time (default: {DEFAULT_CHUNK_SIZE}).")
+    map_parser.set_defaults(func=map_column)
+
+    args = parser.parse_args()
+    if getattr(args, 'column', 1) < 1:
+        parser.error("--column starts at 1.")
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -34,21 +34,39 @@ object Script extends ZIOAppDefault {
   val modelState = ResourceFactory.createProperty("http://geneontology.org/lego/modelstate")
   val providedBy = ResourceFactory.createProperty("http://purl.org/pav/providedBy")
 
+  // Usage: merge_noctua_models.sc <models folder> <output.nq>
+  //        merge_noctua_models.sc <models folder> <output folder> --per-model
+  // With --per-model, the quads from every model file are written to <output folder>/<model file name>.nq instead
+  // (which is empty if the model is filtered out), so that they can be cached by scripts/update-model-cache.py.
   override def run = for {
     args <- getArgs
     modelsFolder <- ZIO.attempt(args(0))
     nQuadsOutput <- ZIO.attempt(args(1))
-    nQuadsWriter <- createStreamRDF(nQuadsOutput)
-    _ <- ZStream
-      .fromIterableZIO(
-        ZIO.attemptBlocking(
-          Files.list(Paths.get(modelsFolder)).collect(Collectors.toList()).asScala
-        )
+    perModel = args.contains("--per-model")
+    modelPaths = ZStream.fromIterableZIO(
+      ZIO.attemptBlocking(
+        Files.list(Paths.get(modelsFolder)).collect(Collectors.toList()).asScala
       )
-      .mapZIOParUnordered(8)(quads)
-      .foreach(quads => ZIO.attemptBlocking(quads.foreach(nQuadsWriter.quad(_))))
+    )
+    _ <-
+      if (perModel)
+        modelPaths.mapZIOParUnordered(8)(path => writeModel(path, Paths.get(nQuadsOutput))).runDrain
+      else
+        createStreamRDF(nQuadsOutput).flatMap { nQuadsWriter =>
+          modelPaths
+            .mapZIOParUnordered(8)(quads)
+            .foreach(quads => ZIO.attemptBlocking(quads.foreach(nQuadsWriter.quad(_))))
+        }
   } yield ()
 
+  def writeModel(path: Path, outputFolder: Path): Task[Unit] = ZIO.scoped {
+    for {
+      modelQuads <- quads(path)
+      nQuadsWriter <- createStreamRDF(outputFolder.resolve(path.getFileName().toString() + ".nq").toString())
+      _ <- ZIO.attemptBlocking(modelQuads.foreach(nQuadsWriter.quad(_)))
+    } yield ()
+  }
+
   def quads(path: Path): Task[Iterator[Quad]] = for {
     model <- ZIO.attemptBlocking(RDFDataMgr.loadModel(path.toFile().getPath()))
     modelIRI <- ZIO
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+import argparse
+import logging
+from contextlib import ExitStack
+
+from kg_io import map_chunks, open_input, open_output, prefetch, read_chunks
+from ntriples import to_tsv_line
+
+logging.basicConfig(level=logging.INFO)
+
+# Convert N-Triples or N-Quads (usually written out by riot) into the TSV files read by Souffle (ontology.facts,
+# biolink.facts and quad.facts), with one column per term (see ntriples.py).
+#
+# This replaces a chain of three sed processes, each of which had to read the entire file, with a single pass. The
+# input is read in large chunks of whole lines, which can be converted in a pool of worker processes (--workers), and
+# are always written out in their original order.
+#
+# Usage: riot --output=ntriples ontologies-merged.ttl | ntriples-to-tsv.py - ontology.facts
+#        riot --output=N-Quads *.nq | ntriples-to-tsv.py --quads - quad.facts
+
+# By default, read about 16 MiB of lines at a time.
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+
+# The number of columns to write out: 3 for triples or 4 for quads. This is replaced by configure() in every process.
+columns = 3
+
+
+def configure(column_count):
+    """
+    Configure the number of columns to write out in this process. This is also used to initialize worker processes.
+    """
+    global columns
+    columns = column_count
+
+
+def convert_chunk(chunk):
+    """
+    Convert a chunk of complete lines of N-Triples or N-Quads into TSV. This is the unit of work handed to workers.
+
+    :param chunk: A bytes object containing complete lines.
+    :return: A tuple of the TSV lines for the entire chunk as a single bytes object, and the number of lines in it.
+    """
+    lines = chunk.decode('utf-8').split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    output = [to_tsv_line(line, columns) for line in lines]
+    return "".join(output).encode('utf-8'), len(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert N-Triples or N-Quads into tab-separated files for Souffle.")
+    parser.add_argument("input_file", help="The N-Triples or N-Quads file to convert, or '-' for stdin.")
+    parser.add_argument("output_file", help="The TSV file to write, or '-' for stdout.")
+    parser.add_argument("--quads", action="store_true",
+                        help="Read N-Quads and write four columns (subject, predicate, object, graph) instead of three.")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="Number of worker processes to use (default: 1, i.e. no worker processes).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"Approximate number of bytes to hand to a worker at a time (default: {DEFAULT_CHUNK_SIZE}).")
+    args = parser.parse_args()
+
+    settings = (4 if args.quads else 3,)
+    configure(*settings)
+    line_count = 0
+
+    with ExitStack() as stack:
+        fin = stack.enter_context(open_input(args.input_file))
+        fout = stack.enter_context(open_output(args.output_file))
+
+        chunks = prefetch(read_chunks(fin, args.chunk_size))
+        for output, count in map_chunks(convert_chunk, chunks, args.workers, initializer=configure, initargs=settings):
+            fout.write(output)
+            line_count += count
+
+    logging.info(f"Converted {line_count} lines of {'N-Quads' if args.quads else 'N-Triples'} into TSV.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#
+# ntriples.py -- splitting N-Triples and N-Quads lines into the TSV columns read by Souffle.
+#
+# The Souffle programs in this pipeline read RDF as tab-separated files with one column per term, where every term is
+# written exactly as it appears in N-Triples (e.g. <http://...>, _:b0 or "a literal"@en). The Makefile used to create
+# these files with three chained sed processes (replace the first two spaces with tabs, then use a greedy regular
+# expression to split off the graph and the final '.'), each of which had to read the entire file, and which relied on
+# riot's exact spacing: a literal containing a tab added a column, and an N-Quads line in the default graph with a
+# literal object was split inside the literal. split_terms() reads every term properly instead, so every term is
+# kept in a single column, and lines without the expected number of terms are reported as errors.
+#
+
+# Terms in N-Triples can be separated by any number of spaces or tabs.
+WHITESPACE = ' \t'
+
+
+class NTriplesParseError(ValueError):
+    """
+    Raised when a line of N-Triples or N-Quads can't be split into terms.
+    """
+
+    def __init__(self, message, line):
+        line = line.rstrip('\r\n')
+        super().__init__(f"{message} in line: {line}")
+        self.line = line
+
+
+def _skip_whitespace(line, pos):
+    length = len(line)
+    while pos < length and line[pos] in WHITESPACE:
+        pos += 1
+    return pos
+
+
+def _find_whitespace(line, pos, length):
+    """Return the position of the next space or tab in line[:length] after pos, or length if there isn't one."""
+    while pos < length and line[pos] not in WHITESPACE:
+        pos += 1
+    return pos
+
+
+def _literal_end(line, start):
+    """
+    Find the end of the literal starting at line[start] (which must be '"'), including its language tag or datatype.
+    """
+    end = start
+    while True:
+        end = line.find('"', end + 1)
+        if end == -1:
+            raise NTriplesParseError("Unterminated literal", line)
+        # The quote is escaped if it is preceded by an odd number of backslashes.
+        backslashes = 0
+        while line[end - 1 - backslashes] == '\\':
+            backslashes += 1
+        if backslashes % 2 == 0:
+            break
+    end += 1
+    if line.startswith('^^<', end):
+        datatype_end = line.find('>', end)
+        if datatype_end == -1:
+            raise NTriplesParseError("Unterminated literal datatype", line)
+        return datatype_end + 1
+    if line.startswith('@', end):
+        # A language tag is letters, digits and '-', so it ends at the first other character (e.g. an attached '.').
+        end += 1
+        while end < len(line) and (line[end].isalnum() or line[end] == '-'):
+            end += 1
+    return end
+
+
+def split_terms(line):
+    """
+    Split a line of N-Triples or N-Quads into its terms.
+
+    Lines without literals (most of them) are simply split on whitespace; lines with literals are read term by term.
+    Tabs inside literals are replaced with the N-Triples escape sequence '\\t', so that every term fits in a single
+    TSV column.
+
+    :param line: A line of N-Triples or N-Quads, with or without its trailing newline.
+    :return: A list of terms, without the final '.', or an empty list for blank lines and comments.
+    :raises NTriplesParseError: If the line isn't terminated with '.' or contains an unterminated literal.
+    """
+    if '"' not in line:
+        terms = line.split()
+        if not terms or terms[0].startswith('#'):
+            return []
+        if terms[-1] == '.':
+            terms.pop()
+            return terms
+        # Otherwise the '.' is attached to the last term or followed by a comment, so read the line term by term.
+
+    terms = []
+    pos = _skip_whitespace(line, 0)
+    length = len(line.rstrip('\r\n'))
+    while pos < length:
+        char = line[pos]
+        if char == '.':
+            return terms
+        if char == '#' and not terms:
+            return []
+        if char == '<':
+            end = line.find('>', pos)
+            if end == -1:
+                raise NTriplesParseError("Unterminated IRI", line)
+            end += 1
+            terms.append(line[pos:end])
+        elif char == '"':
+            end = _literal_end(line, pos)
+            terms.append(line[pos:end].replace('\t', '\\t'))
+        else:
+            end = _find_whitespace(line, pos, length)
+            # Blank node labels can't end with '.', so this is the end of the statement.
+            if line[end - 1] == '.':
+                end -= 1
+            terms.append(line[pos:end])
+        pos = _skip_whitespace(line, end)
+    raise NTriplesParseError("Expected '.' at the end of the statement", line)
+
+
+def to_tsv_line(line, columns):
+    """
+    Convert a line of N-Triples or N-Quads into a line of TSV with the given number of columns.
+
+    :param line: A line of N-Triples or N-Quads.
+    :param columns: The number of columns to write: 3 for triples, 4 for quads (subject, predicate, object, graph).
+    :return: A TSV line with a trailing newline, or an empty string for blank lines and comments.
+    :raises NTriplesParseError: If the line can't be parsed or doesn't have the expected number of terms.
+    """
+    terms = split_terms(line)
+    if not terms:
+        return ""
+    if len(terms) != columns:
+        raise NTriplesParseError(f"Expected {columns} terms but found {len(terms)}", line)
+    return "\t".join(terms) + "\n"
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+import argparse
+import csv
+import datetime
+import logging
+import sys
+
+from stage_profile import load_report
+
+logging.basicConfig(level=logging.INFO)
+
+# Summarize the run report written by scripts/run-stage.py (see scripts/stage_profile.py), or compare two run reports
+# and flag the stages that have become slower or bigger.
+#
+# Usage:
+#   pipeline-report.py summary reports/run-20240101T000000.jsonl [--csv run.csv]
+#   pipeline-report.py compare reports/run-20240101T000000.jsonl reports/run-20240201T000000.jsonl [--threshold 0.2]
+#
+# compare exits with status 1 if any stage has regressed, so that it can be used in CI.
+
+# The measurements that are compared between runs, and whether they are times or sizes.
+METRICS = {
+    'wall_seconds': 'seconds',
+    'cpu_seconds': 'seconds',
+    'hash_seconds': 'seconds',
+    'peak_rss_bytes': 'bytes',
+    'peak_total_rss_bytes': 'bytes',
+    'read_bytes': 'bytes',
+    'written_bytes': 'bytes',
+}
+
+# Columns of the summary CSV file.
+SUMMARY_COLUMNS = ['stage', 'restored', 'exit_code', 'wall_seconds', 'cpu_seconds', 'average_cpus', 'hash_seconds',
+                   'peak_rss_bytes', 'peak_total_rss_bytes', 'read_bytes', 'written_bytes', 'block_read_bytes',
+                   'block_written_bytes', 'output_bytes', 'output_rows']
+
+DEFAULT_THRESHOLD = 0.2
+DEFAULT_MIN_SECONDS = 10
+DEFAULT_MIN_BYTES = 256 * 1024 * 1024
+
+
+def format_value(value, unit):
+    if unit == 'seconds':
+        return f"{value:.1f}s"
+    for suffix in ['B', 'KiB', 'MiB', 'GiB']:
+        if abs(value) < 1024:
+            return f"{value:.1f}{suffix}"
+        value /= 1024
+    return f"{value:.1f}TiB"
+
+
+def summary_row(record):
+    """Flatten a record into a row of the summary CSV file."""
+    row = {column: record.get(column, '') for column in SUMMARY_COLUMNS}
+    row['output_bytes'] = sum(record.get('output_bytes', {}).values())
+    row['output_rows'] = sum(record.get('output_rows', {}).values())
+    return row
+
+
+def elapsed_seconds(records):
+    """
+    :return: The time from the start of the first stage (including hashing its inputs) to the end of the last one, or
+        None if the records have no start times. Unlike the sum of the wall times of the stages, this counts stages
+        that ran in parallel once.
+    """
+    spans = []
+    for record in records:
+        if 'started_at' not in record:
+            continue
+        started_at = datetime.datetime.fromisoformat(record['started_at']).timestamp()
+        spans.append((started_at - record.get('hash_seconds', 0), started_at + record.get('wall_seconds', 0)))
+    if not spans:
+        return None
+    return max(end for _, end in spans) - min(start for start, _ in spans)
+
+
+def summarize(args):
+    stages = load_report(args.report)
+    rows = [summary_row(record) for record in stages.values()]
+    if args.csv:
+        with open(args.csv, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+        logging.info(f"Wrote {len(rows)} stages to {args.csv}.")
+
+    stage_seconds = sum(row['wall_seconds'] for row in rows)
+    elapsed = elapsed_seconds(stages.values())
+    print(f"{'stage':<40} {'wall':>10} {'cpu':>10} {'cpus':>6} {'peak rss':>12} {'total rss':>12} "
+          f"{'read':>12} {'written':>12} {'rows':>14}")
+    for row in sorted(rows, key=lambda row: row['wall_seconds'], reverse=True):
+        stage = row['stage'] + (' (restored)' if row['restored'] else '')
+        if row['exit_code']:
+            stage += f" (exit {row['exit_code']})"
+        print(f"{stage:<40} {format_value(row['wall_seconds'], 'seconds'):>10} "
+              f"{format_value(row['cpu_seconds'], 'seconds'):>10} {row['average_cpus']:>6} "
+              f"{format_value(row['peak_rss_bytes'], 'bytes'):>12} "
+              f"{format_value(row['peak_total_rss_bytes'], 'bytes'):>12} "
+              f"{format_value(row['read_bytes'], 'bytes'):>12} {format_value(row['written_bytes'], 'bytes'):>12} "
+              f"{row['output_rows']:>14}")
+    if rows:
+        elapsed = format_value(elapsed, 'seconds') if elapsed is not None else 'unknown'
+        print(f"Elapsed time: {elapsed}; stage-seconds (the sum of the wall times of every stage): "
+              f"{format_value(stage_seconds, 'seconds')}; peak RSS of a single process: "
+              f"{format_value(max(row['peak_rss_bytes'] for row in rows), 'bytes')}; peak total RSS of a stage: "
+              f"{format_value(max(row['peak_total_rss_bytes'] for row in rows), 'bytes')}.")
+
+
+def find_regressions(baseline, current, threshold, min_seconds, min_bytes):
+    """
+    Compare the records of a stage in two runs.
+
+    :return: A list of (metric, baseline value, current value) for every metric that has grown by more than
+        `threshold` (as a fraction of the baseline) and by more than min_seconds or min_bytes.
+    """
+    regressions = []
+    for metric, unit in METRICS.items():
+        if metric not in baseline or metric not in current:
+            continue
+        before, after = baseline[metric], current[metric]
+        minimum = min_seconds if unit == 'seconds' else min_bytes
+        if after - before > minimum and after > before * (1 + threshold):
+            regressions.append((metric, before, after))
+    return regressions
+
+
+def compare(args):
+    baseline_stages = load_report(args.baseline)
+    current_stages = load_report(args.current)
+    regressed = []
+    for stage, current in current_stages.items():
+        baseline = baseline_stages.get(stage)
+        if baseline is None:
+            print(f"{stage}: new stage")
+            continue
+        if baseline.get('restored') or current.get('restored'):
+            print(f"{stage}: not compared, since it was restored from the stage store in "
+                  f"{'both runs' if baseline.get('restored') and current.get('restored') else 'one run'}")
+            continue
+        if current.get('exit_code'):
+            print(f"{stage}: FAILED with exit code {current['exit_code']}")
+            regressed.append(stage)
+            continue
+
+        regressions = find_regressions(baseline, current, args.threshold, args.min_seconds, args.min_bytes)
+        for metric, before, after in regressions:
+            unit = METRICS[metric]
+            change = f"+{(after / before - 1) * 100:.0f}%" if before else "new"
+            print(f"{stage}: REGRESSION in {metric}: {format_value(before, unit)} -> {format_value(after, unit)} "
+                  f"({change})")
+        if regressions:
+            regressed.append(stage)
+
+        before_rows = sum(baseline.get('output_rows', {}).values())
+        after_rows = sum(current.get('output_rows', {}).values())
+        if before_rows != after_rows:
+            print(f"{stage}: output rows changed from {before_rows} to {after_rows} "
+                  f"({after_rows - before_rows:+d})")
+
+    for stage in baseline_stages:
+        if stage not in current_stages:
+            print(f"{stage}: missing from {args.current}")
+
+    if regressed:
+        print(f"{len(regressed)} stages regressed: {', '.join(regressed)}")
+        sys.exit(1)
+    print("No regressions.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize or compare pipeline run reports.")
+    subparsers = parser.add_subparsers(dest="subcommand", required=True)
+
+    summary_parser = subparsers.add_parser("summary", help="Summarize a run report.")
+    summary_parser.add_argument("report", help="The run report (a JSON Lines file written by run-stage.py).")
+    summary_parser.add_argument("--csv", help="Also write one row per stage to this CSV file.")
+    summary_parser.set_defaults(func=summarize)
+
+    compare_parser = subparsers.add_parser("compare", help="Flag stages that have regressed between two runs.")
+    compare_parser.add_argument("baseline", help="The run report of the earlier run.")
+    compare_parser.add_argument("current", help="The run report of the later run.")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help=f"Flag increases of more than this fraction (default: {DEFAULT_THRESHOLD}).")
+    compare_parser.add_argument("--min-seconds", type=float, default=DEFAULT_MIN_SECONDS,
+                                help=f"Ignore time increases smaller than this (default: {DEFAULT_MIN_SECONDS}).")
+    compare_parser.add_argument("--min-bytes", type=int, default=DEFAULT_MIN_BYTES,
+                                help=f"Ignore size increases smaller than this (default: {DEFAULT_MIN_BYTES}).")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+#
+# qualifiers.py -- expanding multivalued qualifiers into one row per combination of qualifier values.
+#
+# ORION does not currently support multivalued qualifiers, so every edge with qualifiers is duplicated once for
+# every combination of qualifier values, e.g. an edge with two anatomical_context_qualifier values becomes two edges,
+# each with a single anatomical_context_qualifier. This is shared by duplicate-spog-for-multivalued-qualifiers.py
+# (which reads kg.tsv) and compact-and-duplicate-kg-edges.py (which reads kg_edge.csv).
+#
+import json
+import logging
+from collections import Counter, defaultdict
+from functools import lru_cache
+from itertools import islice, product
+from math import prod
+
+# By default, cache the expansions of this many distinct qualifier strings (in each process).
+DEFAULT_QUALIFIER_CACHE_SIZE = 65536
+
+EXCESS_POLICIES = ['fail', 'truncate', 'spill']
+
+# scripts/kg_edges.dl writes out qualifiers as:
+#   (<predicate>=((<value>)))||(<predicate2>=((<value2>)))||...
+# compact_iris.sc reads these with backtracking regular expressions, which silently split values that contain ')))'
+# or '||' in the wrong place. iter_souffle_qualifiers() reads them in a single left-to-right pass instead, and stops
+# at the first problem with its exact byte offset.
+
+
+class QualifierParseError(ValueError):
+    """
+    Raised when a list of qualifiers from kg_edge.csv can't be parsed.
+
+    :ivar offset: The byte offset (in UTF-8) in the qualifier string at which the problem was found.
+    """
+
+    def __init__(self, message, qualifier_string, offset):
+        super().__init__(f"{message} at byte {offset} of qualifier string '{qualifier_string}'")
+        self.qualifier_string = qualifier_string
+        self.offset = offset
+
+
+def _parse_error(message, qualifier_string, index):
+    offset = len(qualifier_string[:index].encode('utf-8'))
+    return QualifierParseError(message, qualifier_string, offset)
+
+
+def iter_souffle_qualifiers(qualifier_string):
+    """
+    Lazily parse a list of qualifiers written out by scripts/kg_edges.dl.
+
+    The qualifier type ends at the first '>=((' and the value ends at the first ')))' (extended to include any
+    further ')' characters, so values may end with ')'). The value must then be followed by the end of the string
+    or by '||(<', so a value that contains ')))' is an error rather than being split in two.
+
+    :param qualifier_string: The qualifier column from kg_edge.csv.
+    :return: An iterator of (qualifier_type_iri, qualifier_value) pairs. The qualifier type IRI is returned without
+        angle brackets; qualifier values that are IRIs keep their angle brackets.
+    :raises QualifierParseError: If the string can't be parsed (after yielding every qualifier before the problem).
+    """
+    length = len(qualifier_string)
+    pos = 0
+    while True:
+        if not qualifier_string.startswith('(<', pos):
+            raise _parse_error("Expected '(<' at the start of a qualifier", qualifier_string, pos)
+        type_start = pos + 2
+        type_end = qualifier_string.find('>=((', type_start)
+        if type_end == -1:
+            raise _parse_error("Expected '>=((' after the qualifier type", qualifier_string, type_start)
+        if type_end == type_start:
+            raise _parse_error("Empty qualifier type", qualifier_string, type_start)
+
+        value_start = type_end + 4
+        value_end = qualifier_string.find(')))', value_start)
+        if value_end == -1:
+            raise _parse_error("Expected ')))' after the qualifier value", qualifier_string, value_start)
+        while value_end + 3 < length and qualifier_string[value_end + 3] == ')':
+            value_end += 1
+        if value_end == value_start:
+            raise _parse_error("Empty qualifier value", qualifier_string, value_start)
+
+        yield qualifier_string[type_start:type_end], qualifier_string[value_start:value_end]
+
+        pos = value_end + 3
+        if pos == length:
+            return
+        if not qualifier_string.startswith('||(<', pos):
+            raise _parse_error("Qualifier value contains ')))' or is followed by something other than '||'",
+                               qualifier_string, value_end)
+        pos += 2
+
+
+def parse_souffle_qualifiers(qualifier_string):
+    """
+    Parse a list of qualifiers written out by scripts/kg_edges.dl (see iter_souffle_qualifiers()).
+
+    :return: A list of (qualifier_type_iri, qualifier_value) pairs.
+    :raises QualifierParseError: If the string can't be parsed.
+    """
+    return list(iter_souffle_qualifiers(qualifier_string))
+
+
+class ExpansionLimitExceeded(Exception):
+    """
+    Raised by QualifierExpander.expand() when a list of qualifiers would expand into more than max_expansion
+    combinations. This is never cached, and the combinations are only generated if fragments() is called.
+    """
+
+    def __init__(self, factor, max_expansion, keys, value_sets):
+        super().__init__(f"{factor} combinations of qualifiers exceeds the limit of {max_expansion}")
+        self.factor = factor
+        self.keys = keys
+        self.value_sets = value_sets
+
+    def fragments(self):
+        """Lazily generate the JSON string for every combination of qualifier values."""
+        for values in product(*self.value_sets):
+            yield json.dumps(dict(zip(self.keys, values)))
+
+
+class QualifierExpander:
+    """
+    Expands qualifier strings into the JSON for every combination of qualifier values.
+
+    The same qualifier lists are repeated across many edges, so expansions are cached by their raw qualifier string.
+    """
+
+    def __init__(self, parse, cache_size=DEFAULT_QUALIFIER_CACHE_SIZE, max_expansion=None, excess_policy='fail'):
+        """
+        :param parse: A function that parses a raw qualifier string into an iterable of
+            (qualifier_type_id, qualifier_value) pairs.
+        :param cache_size: The maximum number of qualifier strings to cache (0 to disable caching).
+        :param max_expansion: The maximum number of output rows for a single input row (None for no limit).
+        :param excess_policy: What to do with rows that exceed this limit: 'fail', 'truncate' or 'spill'.
+        """
+        if excess_policy not in EXCESS_POLICIES:
+            raise ValueError(f"Unknown excess policy '{excess_policy}', expected one of {EXCESS_POLICIES}.")
+        self.parse = parse
+        self.max_expansion = max_expansion
+        self.excess_policy = excess_policy
+        self.expand = lru_cache(maxsize=cache_size)(self._expand)
+
+    def _expand(self, qualifier_string):
+        """
+        Expand a list of qualifiers into the Cartesian product of their values.
+
+        :param qualifier_string: The raw qualifier string.
+        :return: A tuple of JSON strings, one for each combination of qualifier values.
+        :raises ExpansionLimitExceeded: If there are more than max_expansion combinations of qualifier values.
+        """
+
+        # Load qualifiers into a dictionary.
+        # We might as well uniquify these values.
+        qualifier_values_by_type_id = defaultdict(set)
+        for qualifier_type, qualifier_value in self.parse(qualifier_string):
+            qualifier_values_by_type_id[qualifier_type].add(qualifier_value)
+
+        # Repeat the subject/predicate/object/graph lines for each qualifier value.
+        # This is the first time I had one LLM check another LLM's reasoning :)
+        keys = list(qualifier_values_by_type_id.keys())
+        value_sets = [sorted(qualifier_values_by_type_id[k]) for k in keys]
+
+        # Check how many lines we're about to write out before we write them.
+        factor = prod(len(value_set) for value_set in value_sets)
+        if self.max_expansion is not None and factor > self.max_expansion:
+            raise ExpansionLimitExceeded(factor, self.max_expansion, keys, value_sets)
+
+        # Note that we're calculating the Cartesian product for the value-sets only,
+        # so we're picking one set of values for each iteration of this loop.
+        # But then we need to put the keys back in, which is why we made sure
+        # they were both in the right order.
+        return tuple(json.dumps(dict(zip(keys, values))) for values in product(*value_sets))
+
+    def expand_row(self, prefix, qualifier_string, line, report, spill):
+        """
+        Expand a single qualified row into one or more output lines.
+
+        :param prefix: The first five columns of the output lines, including the tab after the fifth column.
+        :param qualifier_string: The raw qualifier string of this row.
+        :param line: The input line, for error messages and spilling.
+        :param report: An ExpansionReport to record the expansion factor of this row in.
+        :param spill: A list to append the input line to if it is spilled.
+        :return: The output lines as a single string.
+        """
+        try:
+            fragments = self.expand(qualifier_string)
+            report.record(len(fragments), len(fragments))
+        except ExpansionLimitExceeded as e:
+            if self.excess_policy == 'truncate':
+                logging.warning(f"Truncating {e.factor} combinations of qualifiers to {self.max_expansion} in line: "
+                                f"{line.strip()}")
+                fragments = islice(e.fragments(), self.max_expansion)
+                report.record(e.factor, self.max_expansion)
+                report.counts['truncated_rows'] += 1
+            elif self.excess_policy == 'spill':
+                logging.warning(f"Spilling line with {e.factor} combinations of qualifiers: {line.strip()}")
+                spill.append(line if line.endswith('\n') else line + '\n')
+                report.record(e.factor, 0)
+                report.counts['spilled_rows'] += 1
+                return ""
+            else:
+                raise ValueError(f"Line expands into {e.factor} combinations of qualifiers, but at most "
+                                 f"{self.max_expansion} are allowed (see --max-expansion): {line}") from e
+
+        # Write out one line for each set of qualifier values.
+        return "".join(f"{prefix}{fragment}\n" for fragment in fragments)
+
+    def cache_counts(self):
+        """Return a Counter of the cache hits and misses so far."""
+        cache_info = self.expand.cache_info()
+        return Counter({'cache_hits': cache_info.hits, 'cache_misses': cache_info.misses})
+
+
+class ExpansionReport:
+    """
+    Counts of what happened while expanding qualifiers, including a histogram of expansion factors (the number of
+    combinations of qualifier values in each qualified row). Reports from different chunks can be merged.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        # Maps expansion factors to the number of rows with that factor.
+        self.expansion_factors = Counter()
+
+    def record(self, factor, output_rows):
+        self.counts['qualified_rows'] += 1
+        self.counts['output_rows'] += output_rows
+        self.expansion_factors[factor] += 1
+
+    def update(self, other):
+        self.counts.update(other.counts)
+        self.expansion_factors.update(other.expansion_factors)
+
+    def log(self):
+        lookups = self.counts['cache_hits'] + self.counts['cache_misses']
+        if lookups > 0:
+            logging.info(f"Qualifier cache: {self.counts['cache_hits']} hits, {self.counts['cache_misses']} misses "
+                         f"({self.counts['cache_hits'] / lookups:.1%} hit rate).")
+
+        logging.info(f"Expanded {self.counts['qualified_rows']} qualified rows into {self.counts['output_rows']} rows "
+                     f"({self.counts['truncated_rows']} truncated, {self.counts['spilled_rows']} spilled).")
+
+        # Summarize expansion factors in power-of-two buckets: 1, 2, 3-4, 5-8, 9-16, ...
+        buckets = Counter()
+        for factor, rows in self.expansion_factors.items():
+            buckets[(factor - 1).bit_length()] += rows
+        for bucket in sorted(buckets):
+            low = (1 << (bucket - 1)) + 1 if bucket > 0 else 1
+            high = 1 << bucket
+            label = str(low) if low == high else f"{low}-{high}"
+            logging.info(f"  Expansion factor {label:>13}: {buckets[bucket]} rows")
+        if self.expansion_factors:
+            logging.info(f"  Largest expansion factor: {max(self.expansion_factors)}")
+
+
+def add_expansion_arguments(parser):
+    """
+    Add the command line arguments that configure a QualifierExpander to an argparse parser.
+    """
+    parser.add_argument("--qualifier-cache-size", type=int, default=DEFAULT_QUALIFIER_CACHE_SIZE,
+                        help=f"Number of distinct qualifier strings to cache the expansions of in each process, or 0 to "
+                             f"disable caching (default: {DEFAULT_QUALIFIER_CACHE_SIZE}).")
+    parser.add_argument("--max-expansion", type=int, default=None,
+                        help="Maximum number of output rows for a single input row (default: no limit).")
+    parser.add_argument("--on-excess", choices=EXCESS_POLICIES, default='fail',
+                        help="What to do with rows that exceed --max-expansion: fail with an error, truncate them to "
+                             "the first --max-expansion combinations, or write the unexpanded row to --spill-file "
+                             "(default: fail).")
+    parser.add_argument("--spill-file",
+                        help="File to write unexpanded rows to with --on-excess spill.")
+
+
+def expansion_settings(parser, args):
+    """
+    Check the arguments added by add_expansion_arguments() and return them as a tuple of (cache_size,
+    max_expansion, excess_policy), which can be passed to worker processes.
+    """
+    if args.on_excess == 'spill' and not args.spill_file:
+        parser.error("--on-excess spill requires --spill-file")
+    return args.qualifier_cache_size, args.max_expansion, args.on_excess
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+import argparse
+import datetime
+import logging
+import os
+import re
+import subprocess
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import count
+
+from stage_cache import make_ignored_dir
+from stage_profile import load_report
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+# Build Makefile targets by running independent stages in parallel, without running more stages at once than fit in
+# the memory of the pod.
+#
+# `make -j` would run independent branches of the pipeline (e.g. the ontology branch, noctua-models.nq, aop-models.nq,
+# ctd-models.nq and the Biolink downloads) at the same time, but it doesn't know that every JVM in the pipeline is
+# started with -Xmx96G, so two of them at once would exceed the 140Gi memory limit of the pod. This reads the stage
+# graph from `make -p`, estimates the memory of every stage, and runs every stage whose prerequisites have been built
+# with `make <target>` as soon as there is room for it:
+# - The memory of a stage is its estimate in STAGE_MEMORY (for the Souffle stages, which have no -Xmx to go by), or
+#   else the total of the -Xmx heap sizes in its recipe, or --default-memory if there are none. With
+#   --memory-report, it is at least the peak total RSS of the stage in an earlier run report (see
+#   scripts/stage_profile.py), and --memory TARGET=SIZE overrides it.
+# - A stage is never started alongside other stages if the total memory of the running stages would exceed
+#   --memory-limit. A stage that needs more than the limit by itself is only run when nothing else is running.
+# - Once a stage has to wait for memory, the memory it needs is reserved for it: the oldest waiting stage is considered
+#   first, and other stages are only started if they fit alongside it, so that a stream of small stages can't keep a
+#   large one waiting until they have all been built.
+# - Stages that are already up to date (according to `make -q`) are skipped.
+# Every stage is logged to <log dir>/<target>.log, and all stages share a single run report (STAGE_REPORT).
+#
+# Usage: run-pipeline.py [--memory-limit 140Gi] [--jobs 3] [--dry-run] [VARIABLE=value ...] [target ...]
+
+DEFAULT_MEMORY_LIMIT = '140Gi'
+DEFAULT_MEMORY = '16Gi'
+DEFAULT_JOBS = 3
+DEFAULT_LOG_DIR = 'logs'
+
+# The memory of the stages that don't run in a JVM but need more than --default-memory. The Souffle programs that
+# compute inferred.csv and kg_edge.csv account for most of the ~108Gi peak of a full run (see
+# kubernetes/cam-pipeline-build.yaml), so each of them is only run by itself. scripts/intern-facts.py keeps a symbol
+# table of every distinct term in its inputs in memory (about 160 bytes per term).
+STAGE_MEMORY = {
+    'inferred.csv': '108Gi',
+    'kg_edge.csv': '108Gi',
+    'interned.dir': '32Gi',
+    'kg_edge_interned.csv': '108Gi',
+}
+
+TARGET_LINE = re.compile(r'^([^#\t=:][^=:]*?)\s*::?\s*(.*)$')
+HEAP_SIZE = re.compile(r'-Xmx(\d+[kKmMgGtT]?)\b')
+SIZE = re.compile(r'^(\d+(?:\.\d+)?)\s*([kKmMgGtT]?)(i?[bB]?)$')
+
+SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+
+
+def parse_size(size):
+    """
+    Parse a memory size such as '96G', '140Gi' or '512m' into bytes. Like the JVM and Kubernetes, the units are powers
+    of 1024.
+    """
+    match = SIZE.match(size.strip())
+    if not match:
+        raise ValueError(f"Could not parse memory size '{size}'.")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+
+def format_size(size):
+    return f"{size / 1024 ** 3:.1f}Gi"
+
+
+def read_stage_graph(make_args):
+    """
+    Read every rule with a recipe from the Makefile database printed by `make -p`.
+
+    :param make_args: Arguments to pass to make (e.g. ['-f', 'Makefile', 'CORES=5']).
+    :return: A dictionary of targets to their lists of prerequisites (including order-only prerequisites).
+    """
+    result = subprocess.run(['make', '-p', '-q', '-r', *make_args], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            text=True)
+    rules = {}
+    in_files = False
+    not_a_target = False
+    target = None
+    for line in result.stdout.splitlines():
+        if line.startswith('# Files'):
+            in_files = True
+        elif line.startswith('# files hash-table stats'):
+            break
+        elif not in_files:
+            continue
+        elif line.startswith('# Not a target'):
+            not_a_target = True
+        elif line.startswith('\t') and target is not None:
+            # A recipe line: only targets with recipes are stages.
+            rules.setdefault(target, prerequisites)
+        elif line == '':
+            not_a_target = False
+            target = None
+        elif not line.startswith('#') and (match := TARGET_LINE.match(line)):
+            if not_a_target or match.group(1).startswith('.'):
+                continue
+            target = match.group(1)
+            prerequisites = [p for p in match.group(2).split() if p != '|']
+    return rules
+
+
+def reachable_stages(rules, goals):
+    """
+    :return: The stages needed to build the goals, with their prerequisites limited to other stages.
+    """
+    stages = {}
+    pending = list(goals)
+    while pending:
+        target = pending.pop()
+        if target in stages:
+            continue
+        if target not in rules:
+            if not os.path.exists(target):
+                raise ValueError(f"No rule to make target '{target}'.")
+            continue
+        stages[target] = [p for p in rules[target] if p in rules]
+        pending.extend(stages[target])
+    return stages
+
+
+def recipe(target, prerequisites, make_args):
+    """Return the recipe that `make` would run for a target once its prerequisites are up to date."""
+    assume_old = [arg for prerequisite in prerequisites for arg in ['-o', prerequisite]]
+    result = subprocess.run(['make', '-n', '-B', *assume_old, *make_args, target], stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, text=True)
+    return result.stdout
+
+
+def estimate_memory(target, recipe_text, default_memory, measured, overrides):
+    """
+    Estimate the memory needed by a stage (see the comment at the top of this file).
+
+    :return: The memory in bytes.
+    """
+    if target in overrides:
+        return overrides[target]
+    if target in STAGE_MEMORY:
+        memory = parse_size(STAGE_MEMORY[target])
+    else:
+        heaps = [parse_size(size) for size in HEAP_SIZE.findall(recipe_text)]
+        memory = sum(heaps) if heaps else default_memory
+    return max(memory, measured.get(target, 0))
+
+
+def count_dependents(stages):
+    """Count the stages that (directly or indirectly) depend on every stage, to start the most needed stages first."""
+    dependents = {target: set() for target in stages}
+
+    def add(target, dependent):
+        for prerequisite in stages[target]:
+            if dependent not in dependents[prerequisite]:
+                dependents[prerequisite].add(dependent)
+                add(prerequisite, dependent)
+
+    for target in stages:
+        add(target, target)
+    return {target: len(dependents[target]) for target in stages}
+
+
+def run_stage(target, make_args, log_dir):
+    """Run `make <target>`, logging its output to <log_dir>/<target>.log. Returns the exit code."""
+    log_path = os.path.join(log_dir, target.replace('/', '_') + '.log')
+    with open(log_path, 'w', encoding='utf-8') as log:
+        return subprocess.run(['make', *make_args, target], stdout=log, stderr=subprocess.STDOUT).returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build Makefile targets, running independent stages in parallel "
+                                                 "within a memory limit.")
+    parser.add_argument("goals", nargs='*', default=['all'],
+                        help="Targets to build and VARIABLE=value assignments to pass to make (default: all).")
+    parser.add_argument("-f", "--file", default='Makefile', help="The Makefile (default: Makefile).")
+    parser.add_argument("--memory-limit", default=DEFAULT_MEMORY_LIMIT,
+                        help=f"The memory available to all stages at once (default: {DEFAULT_MEMORY_LIMIT}).")
+    parser.add_argument("--default-memory", default=DEFAULT_MEMORY,
+                        help=f"The memory of a stage without any -Xmx options (default: {DEFAULT_MEMORY}).")
+    parser.add_argument("--memory", action="append", default=[], metavar="TARGET=SIZE",
+                        help="The memory needed by a stage, overriding the estimate (can be repeated).")
+    parser.add_argument("--memory-report", help="A run report from an earlier run, whose peak total RSS of every "
+                                                "stage is used as the minimum memory of that stage.")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"The most stages to run at once (default: {DEFAULT_JOBS}).")
+    parser.add_argument("-k", "--keep-going", action="store_true",
+                        help="Keep building stages that don't depend on a stage that failed.")
+    parser.add_argument("--log-dir", default=DEFAULT_LOG_DIR,
+                        help=f"The folder to log the output of every stage to (default: {DEFAULT_LOG_DIR}).")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Print the stages, their prerequisites and their memory without running anything.")
+    args = parser.parse_args()
+
+    goals = [goal for goal in args.goals if '=' not in goal] or ['all']
+    variables = [goal for goal in args.goals if '=' in goal]
+    if not any(variable.startswith('STAGE_REPORT=') for variable in variables):
+        # Every `make` would otherwise start its own run report.
+        now = datetime.datetime.now(datetime.timezone.utc)
+        variables.append(f"STAGE_REPORT=reports/run-{now:%Y%m%dT%H%M%SZ}.jsonl")
+    make_args = ['-f', args.file, *variables]
+
+    memory_limit = parse_size(args.memory_limit)
+    default_memory = parse_size(args.default_memory)
+    overrides = {}
+    for override in args.memory:
+        target, size = override.split('=', 1)
+        overrides[target] = parse_size(size)
+    measured = {}
+    if args.memory_report:
+        measured = {stage: record.get('peak_total_rss_bytes', 0)
+                    for stage, record in load_report(args.memory_report).items() if not record.get('restored')}
+
+    try:
+        stages = reachable_stages(read_stage_graph(make_args), goals)
+    except ValueError as e:
+        parser.error(str(e))
+    memory = {target: estimate_memory(target, recipe(target, prerequisites, make_args), default_memory, measured,
+                                      overrides)
+              for target, prerequisites in stages.items()}
+    dependents = count_dependents(stages)
+    # Start the stages that the most other stages are waiting for first, and then the biggest ones.
+    order = sorted(stages, key=lambda target: (-dependents[target], -memory[target], target))
+
+    for target in order:
+        if memory[target] > memory_limit:
+            logging.warning(f"{target} needs {format_size(memory[target])}, more than the limit of "
+                            f"{format_size(memory_limit)}, so it will only be run by itself.")
+    if args.dry_run:
+        for target in order:
+            print(f"{target}\t{format_size(memory[target])}\t{' '.join(stages[target])}")
+        return
+
+    make_ignored_dir(args.log_dir)
+    done = set()
+    failed = set()
+    checked = set()
+    pending = set(stages)
+    running = {}
+    # The stages that have had to wait for memory, in the order in which they first had to.
+    waiting = {}
+    waiting_order = count()
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        while pending or running:
+            if failed and not args.keep_going:
+                pending.clear()
+            # Stages that depend on a failed stage can never be built.
+            for target in [target for target in pending if any(p in failed for p in stages[target])]:
+                logging.error(f"Not building {target}, since a stage it depends on failed.")
+                pending.discard(target)
+                failed.add(target)
+
+            used = sum(memory[target] for target in running.values())
+            reserved = 0
+            oldest_waiting = sorted((target for target in waiting if target in pending), key=waiting.get)[:1]
+            for target in oldest_waiting + order:
+                if target not in pending or not all(p in done for p in stages[target]):
+                    continue
+                if target not in checked:
+                    checked.add(target)
+                    if subprocess.run(['make', '-q', *make_args, target], stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.DEVNULL).returncode == 0:
+                        logging.info(f"{target} is up to date.")
+                        pending.discard(target)
+                        done.add(target)
+                        continue
+                if len(running) >= args.jobs:
+                    break
+                if running and used + reserved + memory[target] > memory_limit:
+                    # Refuse to co-schedule: wait for running stages to finish first, and keep the memory of the first
+                    # stage that has to wait free for it.
+                    waiting.setdefault(target, next(waiting_order))
+                    if not reserved:
+                        reserved = min(memory[target], memory_limit)
+                    continue
+                waiting.pop(target, None)
+                logging.info(f"Starting {target} ({format_size(memory[target])}; "
+                             f"{format_size(used + memory[target])} of {format_size(memory_limit)} in use).")
+                pending.discard(target)
+                running[executor.submit(run_stage, target, make_args, args.log_dir)] = target
+                used += memory[target]
+
+            if not running:
+                # Prerequisites come before their dependents in `order`, so every stage that could be started has been.
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                target = running.pop(future)
+                if future.result() == 0:
+                    logging.info(f"Finished {target}.")
+                    done.add(target)
+                else:
+                    logging.error(f"{target} failed with exit code {future.result()}; see "
+                                  f"{os.path.join(args.log_dir, target.replace('/', '_') + '.log')}.")
+                    failed.add(target)
+
+    if failed:
+        sys.exit(1)
+    logging.info(f"Built {', '.join(goals)}.")
+
+
+if __name__ == "__main__":
+    main()
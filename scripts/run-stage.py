@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import os
+import shlex
+import subprocess
+import sys
+import time
+
+from stage_cache import ArtifactStore, remove_path
+from stage_profile import StageProfiler, append_record, describe_outputs
+
+logging.basicConfig(level=logging.INFO)
+
+# Run a pipeline stage (a Makefile recipe), unless the stage store already has its outputs for the same command and
+# the same input contents, in which case they are restored instead (see scripts/stage_cache.py).
+#
+# Usage (in the Makefile):
+#   ontology.facts: ontologies-merged.ttl
+#       $(STAGE) -i $^ -o $@ -- 'riot --nocheck --output=ntriples $< | ... >$@'
+#
+# The command is run with /bin/sh, like a Makefile recipe: either pass it as a single argument, or as several
+# arguments, which are quoted for the shell. Every input and output can be a file or a folder. Set STAGE_STORE to ''
+# (or pass --store '') to always run the command without using the store.
+#
+# With --report (or $STAGE_REPORT), the wall time, CPU time, peak RSS, bytes read and written, and the size and number
+# of rows of every output are appended to a run report (see scripts/stage_profile.py and scripts/pipeline-report.py).
+# These only cover restoring or running the stage: the time taken to hash its inputs (which can be several GB) is
+# recorded separately, as hash_seconds.
+
+DEFAULT_STORE = '.stage-store'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a pipeline stage, or restore its outputs from the stage store.")
+    parser.add_argument("-i", "--inputs", nargs='*', default=[], help="The files and folders that the stage reads.")
+    parser.add_argument("-o", "--outputs", nargs='+', required=True, help="The files and folders that the stage writes.")
+    parser.add_argument("--extra", action="append", default=[],
+                        help="Anything else the outputs depend on, e.g. BIOLINK=v4.2.1 (can be repeated).")
+    parser.add_argument("--store", default=os.environ.get('STAGE_STORE', DEFAULT_STORE),
+                        help=f"The stage store folder, or '' to disable it (default: $STAGE_STORE or {DEFAULT_STORE}).")
+    parser.add_argument("--report", default=os.environ.get('STAGE_REPORT', ''),
+                        help="A run report to append the resources used by this stage to, or '' to not record them "
+                             "(default: $STAGE_REPORT).")
+    parser.add_argument("--name", help="The name of the stage in the run report (default: the first output).")
+    parser.add_argument("--no-row-counts", action="store_true",
+                        help="Don't count the rows in the outputs for the run report.")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="'--' followed by the command to run.")
+    args = parser.parse_args()
+
+    command_args = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if not command_args:
+        parser.error("No command given.")
+    command = command_args[0] if len(command_args) == 1 else shlex.join(command_args)
+
+    record = {'stage': args.name or args.outputs[0], 'outputs': args.outputs, 'command': command}
+
+    store = ArtifactStore(args.store) if args.store else None
+    key = None
+    if store is not None:
+        hash_start = time.perf_counter()
+        key = store.stage_key(command, args.inputs, args.extra)
+        record['hash_seconds'] = round(time.perf_counter() - hash_start, 3)
+
+    profiler = StageProfiler()
+    profiler.start()
+    restored = False
+    returncode = 0
+    if store is not None:
+        restored = store.restore(key) is not None
+        if restored:
+            logging.info(f"Restored {' '.join(args.outputs)} from {args.store} (stage {key[:12]}).")
+
+    if not restored:
+        # Remove any old outputs, so that the command writes new files.
+        for output in args.outputs:
+            remove_path(output)
+
+        process = subprocess.Popen(command, shell=True, executable='/bin/sh')
+        if args.report:
+            profiler.watch(process.pid)
+        returncode = process.wait()
+
+    if args.report:
+        record.update(profiler.stop())
+        record.update({'restored': restored, 'exit_code': returncode})
+        if returncode == 0:
+            record.update(describe_outputs(args.outputs, count_output_rows=not args.no_row_counts))
+        append_record(args.report, record)
+
+    if returncode != 0:
+        sys.exit(returncode)
+
+    if store is not None and not restored:
+        store.save(key, args.outputs)
+        logging.info(f"Saved {' '.join(args.outputs)} to {args.store} (stage {key[:12]}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#
+# stage_cache.py -- a content-addressed store for the outputs of pipeline stages.
+#
+# Make decides whether to rebuild a target by comparing timestamps, so re-downloading a file or re-cloning a
+# repository rebuilds everything downstream of it, even if the content is the same as before. scripts/run-stage.py
+# wraps a Makefile recipe: it computes a key for the stage from the command and the content of its inputs, and if the
+# store already has the outputs of a stage with that key, it restores them instead of running the command.
+#
+# The store is a folder with:
+# - objects/<sha256>: the content of every output file, named by its SHA-256 hash. Outputs are saved and restored as
+#   copies of these files (never hard links), so restored outputs are ordinary writable files that later recipes can
+#   append to or rewrite in place without changing the store. The objects themselves are read-only.
+# - stages/<key>.json: the outputs of every stage, and every file in them as a list of [path, sha256] pairs (with a
+#   sha256 of null for folders, so that empty folders are restored too).
+# - hashes/<digest>: the SHA-256 hash of an input file, keyed on its path, size, modification time and inode, so that
+#   unchanged inputs (which may be tens of gigabytes) aren't hashed again on every run.
+# The store can be deleted at any time to start from scratch (`make clean` does). It contains a .gitignore that ignores
+# everything in it, as do the other folders that the pipeline keeps its state in (see make_ignored_dir()).
+#
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+
+# Read files in blocks of this size when hashing them.
+BLOCK_SIZE = 1024 * 1024
+
+
+def _write_atomically(path, text):
+    """Write a text file so that other processes either see the old file or the complete new one."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _walk_files(path):
+    """Return the paths of every file and folder in a folder (or just the path for a file), sorted by path."""
+    if not os.path.isdir(path):
+        return [path]
+    paths = [path]
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        paths.extend(os.path.join(root, name) for name in dirs)
+        paths.extend(os.path.join(root, name) for name in sorted(files))
+    return sorted(paths)
+
+
+def make_ignored_dir(path):
+    """Create a folder (if needed) with a .gitignore that makes git ignore everything in it."""
+    os.makedirs(path, exist_ok=True)
+    gitignore_path = os.path.join(path, '.gitignore')
+    if not os.path.exists(gitignore_path):
+        with open(gitignore_path, 'w', encoding='utf-8') as f:
+            f.write("# Created automatically by the cam-pipeline scripts.\n*\n")
+
+
+def remove_path(path):
+    """Remove a file or folder if it exists."""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+class ArtifactStore:
+    """
+    A content-addressed store of stage outputs (see the comment at the top of this file).
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _object_path(self, sha256):
+        return os.path.join(self.root, 'objects', sha256[:2], sha256)
+
+    def _stage_path(self, key):
+        return os.path.join(self.root, 'stages', key + '.json')
+
+    def _memo_path(self, path):
+        st = os.stat(path)
+        stat_key = f"{os.path.abspath(path)}\0{st.st_size}\0{st.st_mtime_ns}\0{st.st_ino}"
+        return os.path.join(self.root, 'hashes', hashlib.sha256(stat_key.encode('utf-8')).hexdigest())
+
+    def hash_file(self, path):
+        """
+        Return the SHA-256 hash of a file, reusing the hash from an earlier run if the file hasn't changed since.
+        """
+        memo_path = self._memo_path(path)
+        if os.path.exists(memo_path):
+            with open(memo_path, 'r', encoding='utf-8') as f:
+                return f.read().strip()
+
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while block := f.read(BLOCK_SIZE):
+                sha256.update(block)
+        _write_atomically(memo_path, sha256.hexdigest())
+        return sha256.hexdigest()
+
+    def hash_input(self, path):
+        """
+        Return the SHA-256 hash of a file, or of the names and contents of every file in a folder.
+
+        :raises FileNotFoundError: If the input doesn't exist.
+        """
+        if not os.path.isdir(path):
+            return self.hash_file(path)
+        sha256 = hashlib.sha256()
+        for file_path in _walk_files(path):
+            relative_path = os.path.relpath(file_path, path)
+            file_hash = 'folder' if os.path.isdir(file_path) else self.hash_file(file_path)
+            sha256.update(f"{relative_path}\0{file_hash}\n".encode('utf-8'))
+        return sha256.hexdigest()
+
+    def stage_key(self, command, inputs, extra=()):
+        """
+        Compute the key of a stage.
+
+        :param command: The command that the stage runs.
+        :param inputs: The paths of the files and folders that the stage reads.
+        :param extra: Any other strings that the outputs depend on (e.g. 'BIOLINK=v4.2.1').
+        :return: A hex string.
+        """
+        sha256 = hashlib.sha256()
+        sha256.update(f"command\0{command}\n".encode('utf-8'))
+        for path in sorted(set(inputs)):
+            sha256.update(f"input\0{path}\0{self.hash_input(path)}\n".encode('utf-8'))
+        for value in extra:
+            sha256.update(f"extra\0{value}\n".encode('utf-8'))
+        return sha256.hexdigest()
+
+    def has_stage(self, key):
+        return os.path.exists(self._stage_path(key))
+
+    def restore(self, key):
+        """
+        Restore the outputs of a stage, replacing any existing outputs.
+
+        :return: The list of restored outputs, or None if the store doesn't have this stage.
+        """
+        if not self.has_stage(key):
+            return None
+        with open(self._stage_path(key), 'r', encoding='utf-8') as f:
+            stage = json.load(f)
+        # Make sure every object is still there before touching the outputs.
+        if any(sha256 is not None and not os.path.exists(self._object_path(sha256)) for _, sha256 in stage['files']):
+            return None
+
+        for output in stage['outputs']:
+            remove_path(output)
+        for path, sha256 in stage['files']:
+            if sha256 is None:
+                os.makedirs(path, exist_ok=True)
+                continue
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(self._object_path(sha256), path)
+            # Make should see restored outputs as new, and the next stage shouldn't need to hash them again.
+            os.utime(path)
+            _write_atomically(self._memo_path(path), sha256)
+        return stage['outputs']
+
+    def save(self, key, outputs):
+        """
+        Save the outputs of a stage. Output files are copied into the store, so the outputs stay writable and
+        changing them later doesn't change the store.
+
+        :param key: The key of the stage.
+        :param outputs: The paths of the files and folders written by the stage.
+        :raises FileNotFoundError: If an output doesn't exist.
+        """
+        make_ignored_dir(self.root)
+        files = []
+        for output in outputs:
+            if not os.path.lexists(output):
+                raise FileNotFoundError(f"Stage output {output} was not created.")
+            for path in _walk_files(output):
+                if os.path.isdir(path):
+                    files.append([path, None])
+                    continue
+                sha256 = self.hash_file(path)
+                object_path = self._object_path(sha256)
+                if not os.path.exists(object_path):
+                    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                    tmp_path = f"{object_path}.tmp-{os.getpid()}"
+                    shutil.copyfile(path, tmp_path)
+                    os.chmod(tmp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                    os.replace(tmp_path, object_path)
+                files.append([path, sha256])
+        _write_atomically(self._stage_path(key), json.dumps({'outputs': list(outputs), 'files': files}, indent=1))
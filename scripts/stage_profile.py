@@ -0,0 +1,195 @@
+#
+# stage_profile.py -- measuring the resources used by pipeline stages.
+#
+# scripts/run-stage.py runs every stage (a Makefile recipe) as a child process, and can record what it used in a run
+# report. Most of these numbers come from getrusage(RUSAGE_CHILDREN) once the stage has finished:
+# - CPU time is the total user and system time of every process in the stage (e.g. both riot and Python in a pipe).
+# - Peak RSS is the peak resident set size of the largest single process in the stage (e.g. the JVM).
+# - Block I/O is what was read from and written to storage, i.e. not counting reads served by the page cache.
+# While the stage is running, the profiler also samples /proc every SAMPLE_INTERVAL seconds for every process in the
+# stage, which gives:
+# - the bytes read and written by every process (rchar and wchar in /proc/<pid>/io, which include the page cache and
+#   pipes), as of the last sample before each process finished, and
+# - the peak total RSS of every process in the stage at once, which is what a pod needs to have room for.
+# Every stage is appended to the run report as a line of JSON, which scripts/pipeline-report.py can summarize, convert
+# to CSV or compare with the report of an earlier run.
+#
+import datetime
+import json
+import os
+import resource
+import threading
+import time
+
+from stage_cache import make_ignored_dir
+
+# getrusage() counts block I/O in 512-byte blocks.
+BLOCK_BYTES = 512
+
+# Read files in blocks of this size when counting rows.
+BLOCK_SIZE = 1024 * 1024
+
+# How often to sample /proc while a stage is running, in seconds.
+SAMPLE_INTERVAL = 1.0
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def count_rows(path):
+    """Count the lines in a file (or in every file in a folder)."""
+    if os.path.isdir(path):
+        return sum(count_rows(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+    rows = 0
+    with open(path, 'rb') as f:
+        while block := f.read(BLOCK_SIZE):
+            rows += block.count(b'\n')
+    return rows
+
+
+def output_size(path):
+    """Return the size of a file (or of every file in a folder) in bytes."""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+    return os.path.getsize(path)
+
+
+def _descendants(pid):
+    """Return the IDs of a process and every process descended from it, according to /proc."""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                # The command name (in parentheses) can contain spaces, so split after it.
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    pids = [pid]
+    for p in pids:
+        pids.extend(children.get(p, []))
+    return pids
+
+
+def _sample_process(pid):
+    """
+    :return: A tuple of the RSS (in bytes), the bytes read and the bytes written by a process, or None if it has gone.
+    """
+    try:
+        with open(f'/proc/{pid}/statm', 'r') as f:
+            rss = int(f.read().split()[1]) * PAGE_SIZE
+        with open(f'/proc/{pid}/io', 'r') as f:
+            io = dict(line.split(': ') for line in f.read().splitlines())
+        return rss, int(io['rchar']), int(io['wchar'])
+    except (OSError, KeyError, ValueError, IndexError):
+        return None
+
+
+class StageProfiler:
+    """
+    Measures the resources used by the child processes of this process between start() and stop(). Call watch() with
+    the ID of the child process running the stage to sample /proc while it runs.
+    """
+
+    def __init__(self, sample_interval=SAMPLE_INTERVAL):
+        self.sample_interval = sample_interval
+        self._stopped = threading.Event()
+        self._thread = None
+        # The last (rchar, wchar) seen for every process, and the peak total RSS seen across processes.
+        self._io = {}
+        self._peak_tree_rss = 0
+
+    def start(self):
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+        self.start_time = time.perf_counter()
+        self.start_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    def watch(self, pid):
+        """Sample /proc for a process and its descendants in a background thread until stop() is called."""
+        self._thread = threading.Thread(target=self._sample, args=(pid,), daemon=True)
+        self._thread.start()
+
+    def _sample(self, pid):
+        while True:
+            tree_rss = 0
+            for p in _descendants(pid):
+                sample = _sample_process(p)
+                if sample is not None:
+                    rss, read, written = sample
+                    tree_rss += rss
+                    self._io[p] = (read, written)
+            self._peak_tree_rss = max(self._peak_tree_rss, tree_rss)
+            if self._stopped.wait(self.sample_interval):
+                return
+
+    def stop(self):
+        """
+        :return: A dictionary of the resources used since start().
+        """
+        wall_seconds = time.perf_counter() - self.start_time
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        user_seconds = usage.ru_utime - self.start_usage.ru_utime
+        system_seconds = usage.ru_stime - self.start_usage.ru_stime
+        return {
+            'started_at': self.started_at.isoformat(),
+            'wall_seconds': round(wall_seconds, 3),
+            'user_cpu_seconds': round(user_seconds, 3),
+            'system_cpu_seconds': round(system_seconds, 3),
+            'cpu_seconds': round(user_seconds + system_seconds, 3),
+            'average_cpus': round((user_seconds + system_seconds) / wall_seconds, 2) if wall_seconds > 0 else 0,
+            # ru_maxrss is in KiB on Linux, and is the peak of every child so far rather than a difference, so it's only
+            # reported if watch() was called with the child running the stage.
+            'peak_rss_bytes': usage.ru_maxrss * 1024 if self._thread is not None else 0,
+            'peak_total_rss_bytes': self._peak_tree_rss,
+            'read_bytes': sum(read for read, _ in self._io.values()),
+            'written_bytes': sum(written for _, written in self._io.values()),
+            'block_read_bytes': (usage.ru_inblock - self.start_usage.ru_inblock) * BLOCK_BYTES,
+            'block_written_bytes': (usage.ru_oublock - self.start_usage.ru_oublock) * BLOCK_BYTES,
+        }
+
+
+def describe_outputs(outputs, count_output_rows=True):
+    """
+    :return: A dictionary with the size in bytes (and optionally the number of rows) of every output that exists.
+    """
+    existing = [output for output in outputs if os.path.exists(output)]
+    description = {'output_bytes': {output: output_size(output) for output in existing}}
+    if count_output_rows:
+        description['output_rows'] = {output: count_rows(output) for output in existing}
+    return description
+
+
+def append_record(report_file, record):
+    """
+    Append a stage to a run report. Each record is written with a single write() to a file opened for appending, so
+    that stages run in parallel (e.g. by `make -j`) don't interleave their records.
+    """
+    if os.path.dirname(report_file):
+        make_ignored_dir(os.path.dirname(report_file))
+    line = (json.dumps(record, sort_keys=True) + "\n").encode('utf-8')
+    fd = os.open(report_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def load_report(report_file):
+    """
+    Load a run report.
+
+    :return: A dictionary of stage names to records, in the order in which the stages finished. If a stage was run more
+        than once, the last run is used.
+    """
+    stages = {}
+    with open(report_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                stages.pop(record['stage'], None)
+                stages[record['stage']] = record
+    return stages
@@ -0,0 +1,186 @@
+#
+# stand_in_server.py -- a local HTTP server that stands in for CAM-KP (and NodeNorm) by replaying recorded responses.
+#
+# The tests and benchmarks talk to CAM_KP_API_ENDPOINT and NODE_NORM_API_ENDPOINT. This server serves both from one
+# port, under path prefixes (by default /cam-kp/ and /nodenorm/, see DEFAULT_UPSTREAMS), so that they can be pointed at
+# http://127.0.0.1:<port>/cam-kp/ and http://127.0.0.1:<port>/nodenorm/ instead:
+# - In record mode, every request is forwarded to the upstream service for its prefix, and the response is saved in
+#   the recordings directory before it is returned.
+# - Otherwise, every request is answered from the recordings directory, and requests that were never recorded get a
+#   404. If a KG file is given, TRAPI queries that were never recorded are answered by the local TRAPI engine
+#   (scripts/trapi_engine.py) instead.
+# Since every route (/query, /cypher, /metadata, /meta_knowledge_graph, /sri_testing_data, the node and CURIE routes,
+# NodeNorm's get_normalized_nodes, ...) is recorded in the same way, the server doesn't need to know about any of them.
+#
+# A recording is a JSON file named after a hash of the request: the method, the path with its query parameters
+# sorted, and the JSON body with its keys sorted, so that the same request always finds the same recording.
+#
+import hashlib
+import json
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_UPSTREAMS = {
+    'cam-kp/': os.getenv('CAM_KP_API_ENDPOINT', 'https://automat.renci.org/cam-kp/'),
+    'nodenorm/': os.getenv('NODE_NORM_API_ENDPOINT', 'https://nodenormalization-sri.renci.org/'),
+}
+
+# The number of connections to keep open to every upstream service in record mode.
+UPSTREAM_POOL_SIZE = 16
+UPSTREAM_TIMEOUT = 300
+
+
+def canonical_request(method, path, body):
+    """
+    :return: A string that identifies a request, whatever the order of its query parameters or JSON keys.
+    """
+    parts = urlsplit(path)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    if body:
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True, separators=(',', ':'))
+        except ValueError:
+            body = body.decode('utf-8', errors='replace')
+    else:
+        body = ''
+    return f"{method} {parts.path}?{query}\n{body}"
+
+
+class Recordings:
+    """A directory of recorded responses."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, method, path, body):
+        key = hashlib.sha256(canonical_request(method, path, body).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, method, path, body):
+        """
+        :return: The recording of a request (a dictionary with the status, content_type and content of the
+            response), or None.
+        """
+        try:
+            with open(self._path(method, path, body), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, method, path, body, status, content_type, content):
+        os.makedirs(self.directory, exist_ok=True)
+        recording_path = self._path(method, path, body)
+        recording = {
+            'method': method,
+            'path': path,
+            'request': body.decode('utf-8', errors='replace') if body else None,
+            'status': status,
+            'content_type': content_type,
+            'content': content.decode('utf-8'),
+        }
+        tmp_path = f"{recording_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(recording, f, indent=1)
+        os.replace(tmp_path, recording_path)
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    The stand-in server. Use start() to run it in a background thread.
+
+    :param recordings_dir: The directory of recordings.
+    :param upstreams: A dictionary of path prefixes (e.g. 'cam-kp/') to the URLs of the services they stand in for.
+    :param record: Forward every request to its upstream service and record the response.
+    :param local_kg: A trapi_engine.LocalKG to answer TRAPI queries that were never recorded (optional).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, recordings_dir, upstreams=None, record=False, local_kg=None):
+        super().__init__(address, StandInHandler)
+        self.recordings = Recordings(recordings_dir)
+        self.upstreams = DEFAULT_UPSTREAMS if upstreams is None else upstreams
+        self.record = record
+        self.local_kg = local_kg
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.upstreams) or 1, pool_maxsize=UPSTREAM_POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        """Serve requests in a daemon thread. Call shutdown() to stop."""
+        thread = threading.Thread(target=self.serve_forever, name='stand-in-server', daemon=True)
+        thread.start()
+        return thread
+
+    def upstream_url(self, path):
+        """:return: The upstream URL for a request path, or None if it doesn't start with any prefix."""
+        relative = path.lstrip('/')
+        for prefix, upstream in self.upstreams.items():
+            if relative.startswith(prefix):
+                return upstream + relative[len(prefix):]
+        return None
+
+    def respond(self, method, path, body):
+        """
+        :return: A tuple of the status, content type and content of the response to a request.
+        """
+        if self.record:
+            url = self.upstream_url(path)
+            if url is None:
+                return 404, 'application/json', json.dumps({'detail': f"No upstream for {path}."}).encode('utf-8')
+            response = self.session.request(method, url, data=body or None, timeout=UPSTREAM_TIMEOUT,
+                                            headers={'Content-Type': 'application/json'} if body else None)
+            content_type = response.headers.get('Content-Type', 'application/json')
+            self.recordings.put(method, path, body, response.status_code, content_type, response.content)
+            return response.status_code, content_type, response.content
+
+        recording = self.recordings.get(method, path, body)
+        if recording is not None:
+            return recording['status'], recording['content_type'], recording['content'].encode('utf-8')
+        if self.local_kg is not None and method == 'POST' and urlsplit(path).path.endswith('/query'):
+            from trapi_engine import QueryError
+            try:
+                response_json = self.local_kg.query(json.loads(body))
+            except (QueryError, ValueError) as e:
+                return 400, 'application/json', json.dumps({'detail': str(e)}).encode('utf-8')
+            return 200, 'application/json', json.dumps(response_json).encode('utf-8')
+        return 404, 'application/json', json.dumps({'detail': f"No recording for {method} {path}."}).encode('utf-8')
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Keep connections alive, as the real services do, and send small responses at once rather than waiting for the
+    # client to acknowledge the headers, which would add tens of milliseconds to every request.
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        try:
+            status, content_type, content = self.server.respond(self.command, self.path, body)
+        except requests.RequestException as e:
+            status, content_type = 502, 'application/json'
+            content = json.dumps({'detail': f"Upstream request failed: {e}"}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
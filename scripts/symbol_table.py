@@ -0,0 +1,111 @@
+#
+# symbol_table.py -- dense integer IDs for the terms in the Souffle input files.
+#
+# kg_edges.dl can be compiled to read integer IDs instead of IRIs (see the comment at the top of that file). The IDs
+# are assigned by scripts/intern-facts.py in the order in which terms are first seen, starting with the IRIs that
+# kg_edges.dl refers to itself, which it declares with fixed IDs as:
+#   #define RDF_TYPE IRI(0, "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>")
+# The symbol table is written out as a TSV file with two columns (ID and term), which is used by
+# scripts/decode-kg-edges.py to turn the IDs in kg_edge.csv back into terms.
+#
+import re
+
+# Souffle numbers are signed 32-bit integers by default.
+MAX_SYMBOL_ID = 2 ** 31 - 1
+
+IRI_DEFINE_PATTERN = re.compile(r'^#define\s+(\w+)\s+IRI\(\s*(\d+)\s*,\s*"(.*)"\s*\)\s*$')
+
+
+def load_program_constants(program_file):
+    """
+    Read the IRIs with fixed IDs from a Souffle program.
+
+    :param program_file: The path to the Souffle program (e.g. scripts/kg_edges.dl).
+    :return: A dictionary of macro names to (id, term) pairs.
+    :raises ValueError: If the IDs are not 0, 1, 2, ... without gaps, or two macros use the same ID.
+    """
+    constants = {}
+    with open(program_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            match = IRI_DEFINE_PATTERN.match(line)
+            if match:
+                constants[match.group(1)] = (int(match.group(2)), match.group(3))
+
+    ids = sorted(symbol_id for symbol_id, _ in constants.values())
+    if ids != list(range(len(ids))):
+        raise ValueError(f"The IRI IDs in {program_file} should be 0 to {len(ids) - 1} without gaps or duplicates, "
+                         f"but are {ids}.")
+    return constants
+
+
+class SymbolTable:
+    """
+    Assigns dense integer IDs to terms in the order in which they are first seen.
+    """
+
+    def __init__(self, constants=None):
+        """
+        :param constants: A dictionary of names to (id, term) pairs (as returned by load_program_constants()) to
+            assign IDs to first.
+        """
+        # Dictionaries keep their insertion order, so the ID of every term is also its position in this dictionary.
+        self.ids = {}
+        for symbol_id, term in sorted((constants or {}).values()):
+            if self.intern(term) != symbol_id:
+                raise ValueError(f"Term {term} is declared with more than one ID.")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def intern(self, term):
+        """Return the ID of a term, assigning it the next ID if it hasn't been seen before."""
+        return self.ids.setdefault(term, len(self.ids))
+
+    def intern_columns(self, line):
+        """
+        Intern every column of a line of TSV.
+
+        :param line: A line of TSV, without its trailing newline.
+        :return: The list of IDs.
+        """
+        ids = self.ids
+        return [ids.setdefault(term, len(ids)) for term in line.split('\t')]
+
+    def check_size(self):
+        """
+        :raises OverflowError: If there are more terms than can be represented as Souffle numbers.
+        """
+        if len(self.ids) - 1 > MAX_SYMBOL_ID:
+            raise OverflowError(f"{len(self.ids)} terms can't be represented as 32-bit Souffle numbers.")
+
+    def write(self, f, symbol_ids=None):
+        """
+        Write the symbol table as TSV with two columns (ID and term).
+
+        :param f: A text file to write to.
+        :param symbol_ids: Only write out the terms with these IDs (in increasing order of ID), or None for all terms.
+        """
+        if symbol_ids is None:
+            for symbol_id, term in enumerate(self.ids):
+                f.write(f"{symbol_id}\t{term}\n")
+        else:
+            terms = list(self.ids)
+            for symbol_id in sorted(symbol_ids):
+                f.write(f"{symbol_id}\t{terms[symbol_id]}\n")
+
+
+def load_terms(symbols_file):
+    """
+    Read a symbol table written by SymbolTable.write().
+
+    :param symbols_file: The path to the symbol table.
+    :return: A list of terms, indexed by their ID.
+    """
+    terms = []
+    with open(symbols_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            symbol_id, term = line.rstrip('\n').split('\t', 1)
+            if int(symbol_id) != len(terms):
+                raise ValueError(f"Expected symbol ID {len(terms)} but found {symbol_id} in {symbols_file}.")
+            terms.append(term)
+    return terms
@@ -0,0 +1,451 @@
+#
+# trapi_engine.py -- a local, in-process TRAPI query engine over kg_duplicated.tsv.
+#
+# tests/test_examples.py sends the example queries in tests/examples to a CAM-KP deployment. LocalKG answers the same
+# queries from a kg_duplicated.tsv built by this pipeline, so the examples can be checked against a new KG before it
+# is deployed, without any network access (set CAM_KP_KG_FILE when running the tests).
+#
+# The KG is loaded into columnar arrays: every subject, predicate, object, graph, primary knowledge source and
+# qualifier string is interned once, and each column is an array of integer IDs. Edges are indexed by subject, object
+# and predicate, and nodes by Biolink category. A query graph is answered one edge at a time, starting from the edges
+# with pinned nodes (`ids`), and results are grouped by their node bindings, as in CAM-KP.
+#
+# Node categories come from:
+# - a node categories file (written by scripts/kg-node-categories.py from the Biolink Model's class mappings), if
+#   given, and otherwise
+# - the CURIE prefix of the node (PREFIX_CATEGORIES), as a fallback; GO terms, whose category depends on their branch
+#   of GO, get all three GO categories in that case.
+# Predicates and categories are expanded to their descendants using rdfs:subPropertyOf and rdfs:subClassOf in
+# biolink.facts, if given (and otherwise, categories using CATEGORY_ANCESTORS). Symmetric predicates match edges in
+# both directions.
+#
+import json
+from array import array
+from collections import defaultdict
+
+BIOLINK_PREFIX = 'https://w3id.org/biolink/vocab/'
+RDFS_SUBPROPERTY_OF = '<http://www.w3.org/2000/01/rdf-schema#subPropertyOf>'
+RDFS_SUBCLASS_OF = '<http://www.w3.org/2000/01/rdf-schema#subClassOf>'
+
+NAMED_THING = 'biolink:NamedThing'
+RELATED_TO = 'biolink:related_to'
+GO_CATEGORIES = ['biolink:MolecularActivity', 'biolink:BiologicalProcess', 'biolink:CellularComponent']
+
+# The fallback categories for nodes with these CURIE prefixes, for nodes that the Biolink Model's class mappings don't
+# categorize (or if there is no node categories file).
+PREFIX_CATEGORIES = {
+    'CHEBI': ['biolink:ChemicalEntity'],
+    'MESH': ['biolink:ChemicalEntity'],
+    'PUBCHEM.COMPOUND': ['biolink:SmallMolecule'],
+    'CHEMBL.COMPOUND': ['biolink:SmallMolecule'],
+    'DRUGBANK': ['biolink:SmallMolecule'],
+    'NCBIGene': ['biolink:Gene'],
+    'HGNC': ['biolink:Gene'],
+    'MGI': ['biolink:Gene'],
+    'RGD': ['biolink:Gene'],
+    'ZFIN': ['biolink:Gene'],
+    'SGD': ['biolink:Gene'],
+    'WormBase': ['biolink:Gene'],
+    'Flybase': ['biolink:Gene'],
+    'Xenbase': ['biolink:Gene'],
+    'dictyBase': ['biolink:Gene'],
+    'PomBase': ['biolink:Gene'],
+    'tair.locus': ['biolink:Gene'],
+    'AGI_LocusCode': ['biolink:Gene'],
+    'PseudoCAP': ['biolink:Gene'],
+    'UniProtKB': ['biolink:Protein'],
+    'PR': ['biolink:Protein'],
+    'RNACENTRAL': ['biolink:RNAProduct'],
+    'GO': GO_CATEGORIES,
+    'REACTO': ['biolink:MolecularActivity'],
+    'CL': ['biolink:Cell'],
+    'UBERON': ['biolink:GrossAnatomicalStructure'],
+    'EMAPA': ['biolink:GrossAnatomicalStructure'],
+    'WBbt': ['biolink:GrossAnatomicalStructure'],
+    'NCBITaxon': ['biolink:OrganismTaxon'],
+    'MONDO': ['biolink:Disease'],
+    'DOID': ['biolink:Disease'],
+    'HP': ['biolink:PhenotypicFeature'],
+}
+
+# The ancestors of the categories above in the Biolink Model (including mixins), used to match a query for a more
+# general category (e.g. biolink:GeneOrGeneProduct) only if biolink.facts isn't given.
+CATEGORY_ANCESTORS = {
+    'biolink:ChemicalEntity': ['biolink:ChemicalOrDrugOrTreatment', 'biolink:ChemicalEntityOrGeneOrGeneProduct',
+                               'biolink:ChemicalEntityOrProteinOrPolypeptide', 'biolink:PhysicalEssence'],
+    'biolink:MolecularEntity': ['biolink:ChemicalEntity'],
+    'biolink:SmallMolecule': ['biolink:MolecularEntity'],
+    'biolink:BiologicalEntity': ['biolink:ThingWithTaxon'],
+    'biolink:Gene': ['biolink:BiologicalEntity', 'biolink:GeneOrGeneProduct', 'biolink:GenomicEntity',
+                     'biolink:ChemicalEntityOrGeneOrGeneProduct', 'biolink:PhysicalEssence',
+                     'biolink:OntologyClass'],
+    'biolink:GeneOrGeneProduct': ['biolink:MacromolecularMachineMixin'],
+    'biolink:GeneProductMixin': ['biolink:GeneOrGeneProduct'],
+    'biolink:Polypeptide': ['biolink:BiologicalEntity', 'biolink:ChemicalEntityOrGeneOrGeneProduct',
+                            'biolink:ChemicalEntityOrProteinOrPolypeptide'],
+    'biolink:Protein': ['biolink:Polypeptide', 'biolink:GeneProductMixin'],
+    'biolink:Transcript': ['biolink:BiologicalEntity'],
+    'biolink:RNAProduct': ['biolink:Transcript', 'biolink:GeneProductMixin'],
+    'biolink:BiologicalProcessOrActivity': ['biolink:BiologicalEntity', 'biolink:Occurrent',
+                                            'biolink:OntologyClass'],
+    'biolink:MolecularActivity': ['biolink:BiologicalProcessOrActivity'],
+    'biolink:BiologicalProcess': ['biolink:BiologicalProcessOrActivity'],
+    'biolink:OrganismalEntity': ['biolink:BiologicalEntity'],
+    'biolink:AnatomicalEntity': ['biolink:OrganismalEntity', 'biolink:PhysicalEssence'],
+    'biolink:CellularComponent': ['biolink:AnatomicalEntity'],
+    'biolink:Cell': ['biolink:AnatomicalEntity'],
+    'biolink:GrossAnatomicalStructure': ['biolink:AnatomicalEntity'],
+    'biolink:OrganismTaxon': ['biolink:OntologyClass'],
+    'biolink:DiseaseOrPhenotypicFeature': ['biolink:BiologicalEntity'],
+    'biolink:Disease': ['biolink:DiseaseOrPhenotypicFeature'],
+    'biolink:PhenotypicFeature': ['biolink:DiseaseOrPhenotypicFeature'],
+}
+
+# Predicates that hold in both directions, so that e.g. a query for proteins that interact with pyruvate also finds
+# edges from pyruvate to a protein.
+SYMMETRIC_PREDICATES = {
+    'biolink:related_to', 'biolink:related_to_at_instance_level', 'biolink:interacts_with',
+    'biolink:physically_interacts_with', 'biolink:directly_physically_interacts_with',
+    'biolink:genetically_interacts_with', 'biolink:coexists_with', 'biolink:colocalizes_with', 'biolink:overlaps',
+    'biolink:associated_with', 'biolink:correlated_with',
+}
+
+# The infores of CAM-KP, as the aggregator of every edge.
+CAM_KP_INFORES = 'infores:cam-kp'
+
+
+class QueryError(ValueError):
+    """Raised for a query graph that LocalKG can't answer (which CAM-KP would answer with a 400 error)."""
+
+
+def biolink_curie(term):
+    """Convert '<https://w3id.org/biolink/vocab/affects>' into 'biolink:affects', or return None."""
+    if term.startswith('<' + BIOLINK_PREFIX) and term.endswith('>'):
+        return 'biolink:' + term[len(BIOLINK_PREFIX) + 1:-1]
+    return None
+
+
+def prefix_categories(curie):
+    """Return the fallback categories of a node from its CURIE prefix (see PREFIX_CATEGORIES)."""
+    return PREFIX_CATEGORIES.get(curie.split(':', 1)[0], [NAMED_THING])
+
+
+def _closure(parents, term):
+    """Return a term and all of its ancestors, given a dictionary of terms to their parents."""
+    seen = {term}
+    pending = [term]
+    while pending:
+        for parent in parents.get(pending.pop(), ()):
+            if parent not in seen:
+                seen.add(parent)
+                pending.append(parent)
+    return seen
+
+
+class LocalKG:
+    """
+    A knowledge graph loaded from kg_duplicated.tsv, which can answer TRAPI queries with query().
+
+    :param kg_file: kg_duplicated.tsv (subject, predicate, object, graph, primary knowledge source and qualifiers as
+        JSON, separated by tabs).
+    :param biolink_facts_file: biolink.facts, to expand predicates and categories using the Biolink Model (optional).
+    :param node_categories_file: A TSV file of node CURIEs and their categories, separated by '|' (optional).
+    """
+
+    def __init__(self, kg_file, biolink_facts_file=None, node_categories_file=None):
+        self.terms = []
+        self.term_ids = {}
+        self.subjects = array('i')
+        self.predicates = array('i')
+        self.objects = array('i')
+        self.graphs = array('i')
+        self.sources = array('i')
+        self.qualifiers = array('i')
+        self._load_edges(kg_file)
+
+        self.by_subject = self._index(self.subjects)
+        self.by_object = self._index(self.objects)
+        self.by_predicate = self._index(self.predicates)
+
+        self.predicate_parents = defaultdict(set)
+        self.category_parents = {}
+        if biolink_facts_file:
+            self._load_biolink(biolink_facts_file)
+        else:
+            self.category_parents = {category: set(parents) for category, parents in CATEGORY_ANCESTORS.items()}
+
+        self.node_categories = {}
+        if node_categories_file:
+            with open(node_categories_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    curie, _, categories = line.rstrip('\n').partition('\t')
+                    if curie in self.term_ids and categories:
+                        self.node_categories[self.term_ids[curie]] = categories.split('|')
+        self.by_category = self._index_categories()
+        self._parsed_qualifiers = {}
+
+    def _intern(self, term):
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = self.term_ids[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def _load_edges(self, kg_file):
+        intern = self._intern
+        with open(kg_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                columns = line.rstrip('\n').split('\t')
+                if len(columns) < 5:
+                    continue
+                self.subjects.append(intern(columns[0]))
+                self.predicates.append(intern(columns[1]))
+                self.objects.append(intern(columns[2]))
+                self.graphs.append(intern(columns[3]))
+                self.sources.append(intern(columns[4]))
+                self.qualifiers.append(intern(columns[5] if len(columns) > 5 else ''))
+
+    @staticmethod
+    def _index(column):
+        rows = defaultdict(lambda: array('i'))
+        for row, term_id in enumerate(column):
+            rows[term_id].append(row)
+        return dict(rows)
+
+    def _load_biolink(self, biolink_facts_file):
+        with open(biolink_facts_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                columns = line.rstrip('\n').split('\t')
+                if len(columns) != 3 or columns[1] not in (RDFS_SUBPROPERTY_OF, RDFS_SUBCLASS_OF):
+                    continue
+                child, parent = biolink_curie(columns[0]), biolink_curie(columns[2])
+                if child and parent:
+                    parents = self.predicate_parents if columns[1] == RDFS_SUBPROPERTY_OF else self.category_parents
+                    parents.setdefault(child, set()).add(parent)
+
+    def categories(self, node_id):
+        """Return the categories of a node (given its term ID), without their ancestors."""
+        categories = self.node_categories.get(node_id)
+        if categories is None:
+            categories = prefix_categories(self.terms[node_id])
+        return categories
+
+    def _index_categories(self):
+        by_category = defaultdict(set)
+        closures = {}
+        for node_id in set(self.by_subject) | set(self.by_object):
+            for category in self.categories(node_id):
+                if category not in closures:
+                    closures[category] = _closure(self.category_parents, category)
+                for ancestor in closures[category]:
+                    by_category[ancestor].add(node_id)
+        return dict(by_category)
+
+    def __len__(self):
+        return len(self.subjects)
+
+    def _qualifiers(self, row):
+        qualifier_id = self.qualifiers[row]
+        if qualifier_id not in self._parsed_qualifiers:
+            text = self.terms[qualifier_id]
+            self._parsed_qualifiers[qualifier_id] = json.loads(text) if text else {}
+        return self._parsed_qualifiers[qualifier_id]
+
+    def _predicate_ids(self, predicates):
+        """
+        :return: The term IDs of the predicates that match a list of query predicates, and of the predicates that also
+            match in reverse, or None for any predicate.
+        """
+        if not predicates or RELATED_TO in predicates:
+            return None, None
+        matching = set()
+        symmetric = set()
+        for predicate_id in self.by_predicate:
+            ancestors = _closure(self.predicate_parents, self.terms[predicate_id])
+            matches = ancestors.intersection(predicates)
+            if matches:
+                matching.add(predicate_id)
+                if self.terms[predicate_id] in SYMMETRIC_PREDICATES or matches & SYMMETRIC_PREDICATES:
+                    symmetric.add(predicate_id)
+        return matching, symmetric
+
+    def _node_ids(self, qnode):
+        """
+        :return: The set of term IDs that a query node can be bound to, or None for any node.
+        """
+        if qnode.get('ids'):
+            # Pinned nodes aren't filtered by category.
+            return {self.term_ids[curie] for curie in qnode['ids'] if curie in self.term_ids}
+        categories = [category for category in qnode.get('categories') or [] if category != NAMED_THING]
+        if not categories:
+            return None
+        return set().union(*(self.by_category.get(category, set()) for category in categories))
+
+    def _matches_qualifiers(self, row, constraints):
+        if not constraints:
+            return True
+        qualifiers = self._qualifiers(row)
+        for constraint in constraints:
+            if all(qualifiers.get(q['qualifier_type_id']) == q['qualifier_value']
+                   for q in constraint.get('qualifier_set', [])):
+                return True
+        return False
+
+    def _match_edge(self, qedge, subject_ids, object_ids):
+        """
+        Find the edges that match a query edge.
+
+        :param subject_ids: The term IDs that the subject can be bound to, or None for any.
+        :param object_ids: The term IDs that the object can be bound to, or None for any.
+        :return: A list of (row, subject ID, object ID) tuples, where the subject and object are in the direction of
+            the query edge (which is the reverse of the KG edge for symmetric predicates).
+        """
+        predicate_ids, symmetric_ids = self._predicate_ids(qedge.get('predicates'))
+        constraints = qedge.get('qualifier_constraints')
+
+        def candidate_rows(ids, index):
+            return {row for term_id in ids for row in index.get(term_id, ())}
+
+        # Start from the smallest set of rows that we can find with an index.
+        if subject_ids is not None and (object_ids is None or len(subject_ids) <= len(object_ids)):
+            rows = candidate_rows(subject_ids, self.by_subject) | candidate_rows(subject_ids, self.by_object)
+        elif object_ids is not None:
+            rows = candidate_rows(object_ids, self.by_object) | candidate_rows(object_ids, self.by_subject)
+        elif predicate_ids is not None:
+            rows = candidate_rows(predicate_ids, self.by_predicate)
+        else:
+            rows = range(len(self))
+
+        matches = []
+        for row in rows:
+            subject_id, predicate_id, object_id = self.subjects[row], self.predicates[row], self.objects[row]
+            if predicate_ids is not None and predicate_id not in predicate_ids:
+                continue
+            if not self._matches_qualifiers(row, constraints):
+                continue
+            if ((subject_ids is None or subject_id in subject_ids) and
+                    (object_ids is None or object_id in object_ids)):
+                matches.append((row, subject_id, object_id))
+            # Any predicate (symmetric_ids is None) includes related_to, which is symmetric.
+            if ((symmetric_ids is None or predicate_id in symmetric_ids) and subject_id != object_id and
+                    (subject_ids is None or object_id in subject_ids) and
+                    (object_ids is None or subject_id in object_ids)):
+                matches.append((row, object_id, subject_id))
+        return matches
+
+    def _edge(self, row):
+        qualifiers = self._qualifiers(row)
+        source = self.terms[self.sources[row]]
+        edge = {
+            'subject': self.terms[self.subjects[row]],
+            'predicate': self.terms[self.predicates[row]],
+            'object': self.terms[self.objects[row]],
+            'sources': [
+                {'resource_id': source, 'resource_role': 'primary_knowledge_source'},
+                {'resource_id': CAM_KP_INFORES, 'resource_role': 'aggregator_knowledge_source',
+                 'upstream_resource_ids': [source]},
+            ],
+            'attributes': [{'attribute_type_id': 'biolink:xref', 'value': [self.terms[self.graphs[row]]]}],
+        }
+        if qualifiers:
+            edge['qualifiers'] = [{'qualifier_type_id': qualifier_type, 'qualifier_value': value}
+                                  for qualifier_type, value in qualifiers.items()]
+        return edge
+
+    def query(self, trapi_query, limit=None):
+        """
+        Answer a TRAPI query.
+
+        :param trapi_query: A TRAPI request, i.e. {"message": {"query_graph": {"nodes": ..., "edges": ...}}}.
+        :param limit: The maximum number of results to return (default: all).
+        :return: A TRAPI response, with the query graph, knowledge graph and results.
+        :raises QueryError: If the query graph is missing or refers to undefined nodes.
+        """
+        try:
+            query_graph = trapi_query['message']['query_graph']
+            qnodes = query_graph['nodes']
+            qedges = query_graph['edges']
+        except (KeyError, TypeError) as e:
+            raise QueryError(f"Query does not contain a query graph: {e}") from e
+        if not qedges:
+            raise QueryError("Query graph has no edges.")
+        for qedge_id, qedge in qedges.items():
+            for end in ('subject', 'object'):
+                if qedge.get(end) not in qnodes:
+                    raise QueryError(f"Edge {qedge_id} refers to undefined node {qedge.get(end)}.")
+
+        allowed = {qnode_id: self._node_ids(qnode) for qnode_id, qnode in qnodes.items()}
+
+        # Bind one edge at a time, always choosing an edge that touches a node that is already bound (or pinned).
+        bindings = [({}, {})]
+        remaining = dict(qedges)
+        bound = set()
+        while remaining and bindings:
+            qedge_id = next((e for e, q in remaining.items() if q['subject'] in bound or q['object'] in bound), None)
+            if qedge_id is None:
+                qedge_id = min(remaining, key=lambda e: min(
+                    len(allowed[remaining[e][end]]) if allowed[remaining[e][end]] is not None else len(self)
+                    for end in ('subject', 'object')))
+            qedge = remaining.pop(qedge_id)
+            subject_qnode, object_qnode = qedge['subject'], qedge['object']
+
+            subject_ids = allowed[subject_qnode]
+            object_ids = allowed[object_qnode]
+            if subject_qnode in bound:
+                subject_ids = {nodes[subject_qnode] for nodes, _ in bindings}
+            if object_qnode in bound:
+                object_ids = {nodes[object_qnode] for nodes, _ in bindings}
+            matches = self._match_edge(qedge, subject_ids, object_ids)
+
+            by_ends = defaultdict(list)
+            for row, subject_id, object_id in matches:
+                by_ends[subject_id, object_id].append(row)
+            extended = []
+            for nodes, edges in bindings:
+                for (subject_id, object_id), rows in by_ends.items():
+                    if nodes.get(subject_qnode, subject_id) != subject_id:
+                        continue
+                    if nodes.get(object_qnode, object_id) != object_id:
+                        continue
+                    extended.append(({**nodes, subject_qnode: subject_id, object_qnode: object_id},
+                                     {**edges, qedge_id: rows}))
+            bindings = extended
+            bound.update([subject_qnode, object_qnode])
+
+        # Group the bindings by their nodes, as CAM-KP does.
+        results = {}
+        for nodes, edges in bindings:
+            key = tuple(sorted(nodes.items()))
+            result = results.setdefault(key, (nodes, defaultdict(set)))
+            for qedge_id, rows in edges.items():
+                result[1][qedge_id].update(rows)
+        grouped = list(results.values())
+        if limit is not None:
+            grouped = grouped[:limit]
+
+        kg_nodes = {}
+        kg_edges = {}
+        trapi_results = []
+        for nodes, edges in grouped:
+            for node_id in nodes.values():
+                if self.terms[node_id] not in kg_nodes:
+                    kg_nodes[self.terms[node_id]] = {'categories': self.categories(node_id), 'attributes': []}
+            for rows in edges.values():
+                for row in rows:
+                    kg_edges.setdefault(f"e{row}", self._edge(row))
+            trapi_results.append({
+                'node_bindings': {qnode_id: [{'id': self.terms[node_id]}] for qnode_id, node_id in nodes.items()},
+                'analyses': [{
+                    'resource_id': CAM_KP_INFORES,
+                    'edge_bindings': {qedge_id: [{'id': f"e{row}"} for row in sorted(rows)]
+                                      for qedge_id, rows in edges.items()},
+                }],
+            })
+
+        return {
+            'message': {
+                'query_graph': query_graph,
+                'knowledge_graph': {'nodes': kg_nodes, 'edges': kg_edges},
+                'results': trapi_results,
+            }
+        }
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from stage_cache import make_ignored_dir
+
+logging.basicConfig(level=logging.INFO)
+
+# Incrementally rebuild the N-Quads for a folder of models (noctua-models.nq or aop-models.nq).
+#
+# merge_noctua_models.sc used to load every model on every run, even though only a few models change between
+# releases. This keeps a cache folder with the N-Quads of every model (<model file name>.nq, written by
+# `merge_noctua_models.sc --per-model`) and a manifest of the SHA-256 hash of every model file, and on every run:
+# - hashes every model file,
+# - runs merge_noctua_models.sc on the models that are new or have changed since the last run,
+# - removes the cached N-Quads of models that have been deleted, and
+# - concatenates the cached N-Quads of every model (in the order of their file names) into the output file.
+# If any of the --dependency files change (e.g. merge_noctua_models.sc itself), every model is rebuilt.
+#
+# Usage: update-model-cache.py --merge-command 'scala-cli run scripts/merge_noctua_models.sc --' \
+#            --dependency scripts/merge_noctua_models.sc noctua-models/models noctua-models-cache noctua-models.nq
+
+MANIFEST_FILE = 'manifest.json'
+
+# Read and write files in blocks of this size.
+BLOCK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """Return the SHA-256 hash of a file as a hex string."""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while block := f.read(BLOCK_SIZE):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def hash_files(paths, workers):
+    """Hash a list of files in a pool of threads, returning a dictionary of path to hash."""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(paths, executor.map(hash_file, paths)))
+
+
+def load_manifest(cache_dir):
+    """
+    Load the manifest of a cache folder.
+
+    :return: A dictionary with 'dependencies' (a hash of the --dependency files) and 'models' (a dictionary of model
+        file names to their hashes), which is empty if there is no manifest yet.
+    """
+    path = os.path.join(cache_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {'dependencies': None, 'models': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(cache_dir, manifest):
+    """Save the manifest of a cache folder, replacing the previous manifest only once it has been written out."""
+    path = os.path.join(cache_dir, MANIFEST_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def cache_path(cache_dir, model_file):
+    return os.path.join(cache_dir, model_file + '.nq')
+
+
+def rebuild_models(merge_command, models_dir, model_files, cache_dir):
+    """
+    Run merge_noctua_models.sc on some of the models in a folder, writing their N-Quads into the cache folder.
+
+    :param merge_command: The command to run merge_noctua_models.sc, as a shell command. The folder of models, the
+        cache folder and --per-model are appended to it.
+    :param models_dir: The folder of models.
+    :param model_files: The file names of the models to rebuild.
+    :param cache_dir: The cache folder.
+    """
+    # merge_noctua_models.sc reads every file in a folder, so give it a folder with links to the models to rebuild.
+    with tempfile.TemporaryDirectory(prefix='models-', dir=cache_dir) as staging_dir:
+        for model_file in model_files:
+            os.symlink(os.path.abspath(os.path.join(models_dir, model_file)), os.path.join(staging_dir, model_file))
+        command = f"{merge_command} {shlex.quote(staging_dir)} {shlex.quote(cache_dir)} --per-model"
+        logging.info(f"Running: {command}")
+        subprocess.run(command, shell=True, check=True)
+
+    missing = [model_file for model_file in model_files if not os.path.exists(cache_path(cache_dir, model_file))]
+    if missing:
+        raise RuntimeError(f"{merge_command} did not write N-Quads for {len(missing)} models, e.g. {missing[:5]}")
+
+
+def concatenate(cache_dir, model_files, output_file):
+    """Concatenate the cached N-Quads of some models into a single file."""
+    with open(output_file + '.tmp', 'wb') as fout:
+        for model_file in model_files:
+            with open(cache_path(cache_dir, model_file), 'rb') as fin:
+                shutil.copyfileobj(fin, fout, BLOCK_SIZE)
+    os.replace(output_file + '.tmp', output_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally rebuild the N-Quads for a folder of models.")
+    parser.add_argument("models_dir", help="The folder of models (e.g. noctua-models/models).")
+    parser.add_argument("cache_dir", help="The folder to cache the N-Quads of every model in.")
+    parser.add_argument("output_file", help="The N-Quads file to write (e.g. noctua-models.nq).")
+    parser.add_argument("--merge-command", required=True,
+                        help="The shell command to run merge_noctua_models.sc with, up to and including '--'.")
+    parser.add_argument("--dependency", action="append", default=[],
+                        help="A file that, if changed, invalidates the entire cache (can be repeated).")
+    parser.add_argument("-j", "--workers", type=int, default=8,
+                        help="Number of threads to hash model files with (default: 8).")
+    args = parser.parse_args()
+
+    make_ignored_dir(args.cache_dir)
+    manifest = load_manifest(args.cache_dir)
+
+    dependencies = hashlib.sha256()
+    for dependency in args.dependency:
+        dependencies.update(hash_file(dependency).encode('utf-8'))
+    if manifest['dependencies'] != dependencies.hexdigest():
+        if manifest['models']:
+            logging.info("Dependencies have changed, so every model will be rebuilt.")
+        manifest = {'dependencies': dependencies.hexdigest(), 'models': {}}
+
+    model_files = sorted(entry.name for entry in os.scandir(args.models_dir) if entry.is_file())
+    hashes = hash_files([os.path.join(args.models_dir, model_file) for model_file in model_files], args.workers)
+    current = {model_file: hashes[os.path.join(args.models_dir, model_file)] for model_file in model_files}
+
+    cached = manifest['models']
+    added = [model_file for model_file in model_files if model_file not in cached]
+    changed = [model_file for model_file in model_files
+               if model_file in cached and cached[model_file] != current[model_file]]
+    deleted = [model_file for model_file in cached if model_file not in current]
+    logging.info(f"{len(model_files)} models: {len(model_files) - len(changed) - len(added)} unchanged, "
+                 f"{len(changed)} changed, {len(added)} new, {len(deleted)} deleted.")
+
+    # Forget about models that are about to be rebuilt or deleted before touching the cache, so that the manifest
+    # never refers to a cached file that is out of date.
+    for model_file in changed + deleted:
+        del cached[model_file]
+    save_manifest(args.cache_dir, manifest)
+
+    for model_file in deleted:
+        if os.path.exists(cache_path(args.cache_dir, model_file)):
+            os.remove(cache_path(args.cache_dir, model_file))
+
+    if changed or added:
+        rebuild_models(args.merge_command, args.models_dir, changed + added, args.cache_dir)
+        for model_file in changed + added:
+            cached[model_file] = current[model_file]
+        save_manifest(args.cache_dir, manifest)
+
+    concatenate(args.cache_dir, model_files, args.output_file)
+    logging.info(f"Wrote the N-Quads for {len(model_files)} models to {args.output_file}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#
+# conftest.py -- fixtures shared by the tests of the Automat-CAM-KP API.
+#
+# All the tests share a single requests.Session (http_session), so that connections to the API are kept alive and
+# reused instead of paying for a new TLS handshake on every request. The parametrized tests in test_curies.py and
+# test_examples.py submit all of their requests to a thread pool (http_executor) up front with submit_requests, and
+# every test then waits for its own response, so the whole suite takes about as long as its slowest requests. Only the
+# requests of the tests that will actually run (e.g. those selected with -k) are submitted (see selected_params).
+#
+# By default, the tests talk to a local stand-in server (scripts/stand_in_server.py), which replays the small set of
+# fixture responses in tests/recordings (see the README there), so that the tests run without network access. Set
+# CAM_KP_RECORDINGS to another directory of recordings to replay those instead, or set CAM_KP_API_ENDPOINT (or set
+# CAM_KP_RECORDINGS to an empty string) to test a live deployment. With CAM_KP_RECORD=1, the stand-in server forwards
+# every request to CAM_KP_API_ENDPOINT or NODE_NORM_API_ENDPOINT and records the responses first.
+#
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# The number of requests to make at once, and the number of connections to keep open to every host.
+HTTP_WORKERS = int(os.getenv("HTTP_WORKERS", "8"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", str(HTTP_WORKERS)))
+
+# Retry requests that fail with a gateway error (e.g. while the deployment is scaling up) a few times. Every request
+# the tests make is read-only, so POSTs can be retried as well.
+HTTP_RETRIES = Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504], allowed_methods=None,
+                     raise_on_status=False)
+
+
+# The unit tests of the pipeline scripts (e.g. test_qualifiers.py) import them from scripts/.
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+
+# The recordings the tests replay if neither CAM_KP_RECORDINGS nor CAM_KP_API_ENDPOINT is set.
+DEFAULT_RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+
+
+def pytest_configure(config):
+    recordings_dir = os.getenv("CAM_KP_RECORDINGS")
+    if recordings_dir is None and not os.getenv("CAM_KP_API_ENDPOINT"):
+        recordings_dir = DEFAULT_RECORDINGS_DIR
+    if not recordings_dir:
+        return
+    from stand_in_server import DEFAULT_UPSTREAMS, StandInServer
+
+    server = StandInServer(("127.0.0.1", 0), recordings_dir, upstreams=DEFAULT_UPSTREAMS,
+                           record=os.getenv("CAM_KP_RECORD") == "1")
+    server.start()
+    # The test modules read these variables when they are imported, which is after this hook has run.
+    config.stand_in_server = server
+    os.environ["CAM_KP_API_ENDPOINT"] = f"{server.url}cam-kp/"
+    os.environ["NODE_NORM_API_ENDPOINT"] = f"{server.url}nodenorm/"
+
+
+def pytest_unconfigure(config):
+    server = getattr(config, "stand_in_server", None)
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+
+def make_session(pool_size=HTTP_POOL_SIZE):
+    """Create a requests.Session that keeps up to pool_size connections open to every host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=HTTP_RETRIES)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@pytest.fixture(scope="session")
+def http_session():
+    """A requests.Session shared by all the tests."""
+    with make_session() as session:
+        yield session
+
+
+@pytest.fixture(scope="session")
+def http_executor():
+    """A thread pool for making requests concurrently, shared by all the tests."""
+    with ThreadPoolExecutor(max_workers=HTTP_WORKERS) as executor:
+        yield executor
+
+
+@pytest.fixture(scope="session")
+def submit_requests(http_session, http_executor):
+    """
+    A function that starts many HTTP requests at once, with http_session in http_executor.
+
+    The function takes a dictionary of keys to (method, url, keyword arguments for session.request()) tuples, and
+    returns a dictionary of the same keys to futures of the responses. Calling result() on a future waits for the
+    response, and raises any exception the request raised.
+    """
+    def submit(calls):
+        return {key: http_executor.submit(http_session.request, method, url, **kwargs)
+                for key, (method, url, kwargs) in calls.items()}
+    return submit
+
+
+@pytest.fixture(scope="session")
+def selected_params(request):
+    """
+    A function that returns the values of a parametrized argument in the tests of a module that will run, i.e. that
+    were collected and not deselected (e.g. with -k), in order and without duplicates. Fixtures that prefetch the
+    responses of every test use this to avoid sending requests for tests that won't run.
+
+    The function takes the module (request.module in the fixture) and the name of the argument.
+    """
+    def params(module, argname):
+        values = {}
+        for item in request.session.items:
+            callspec = getattr(item, "callspec", None)
+            if item.module is module and callspec is not None and argname in callspec.params:
+                values.setdefault(callspec.params[argname], None)
+        return list(values)
+    return params
@@ -17,16 +17,19 @@
 # These tests assume that some edges will always be in Automat-CAM-KP:
 # - NCBIGene:15481 ("heat shock protein 8 [Mus musculus (house mouse)]")
 #   biolink:active_in UBERON:0002240 ("spinal cord")
+import json
 import logging
 import os
 import urllib.parse
 
-import requests
+import pytest
 
 CAM_KP_API_ENDPOINT = os.getenv(
     "CAM_KP_API_ENDPOINT", "https://automat.renci.org/cam-kp/"
 )
 TRAPI_VERSION = os.getenv("TRAPI_VERSION", "1.4")
+# The meta knowledge graph computed from the KG by scripts/kg-meta-knowledge-graph.py (optional).
+META_KNOWLEDGE_GRAPH_FILE = os.getenv("META_KNOWLEDGE_GRAPH_FILE")
 
 # Some data that is used by multiple tests.
 trapi_query_what_is_hsp8_mus_musculus_active_in = {
@@ -65,12 +68,12 @@ uberon_0002240_node_info = {
 }
 
 
-def test_metadata():
+def test_metadata(http_session):
     """
     Test the GET /cam-kp/metadata endpoint.
     """
     metadata_url = urllib.parse.urljoin(CAM_KP_API_ENDPOINT, "metadata")
-    response = requests.get(metadata_url)
+    response = http_session.get(metadata_url)
     assert response.ok, f"Could not retrieve metadata from {metadata_url}."
 
     metadata = response.json()
@@ -129,14 +132,14 @@ def test_metadata():
     assert metadata["qc_results"]["warnings"] == {}
 
 
-def test_sri_testing_data():
+def test_sri_testing_data(http_session):
     """
     Test the SRI Testing Data output at GET /cam-kp/1.4/sri_testing_data.
     """
     sri_testing_url = urllib.parse.urljoin(
         CAM_KP_API_ENDPOINT, f"{TRAPI_VERSION}/sri_testing_data"
     )
-    response = requests.get(sri_testing_url)
+    response = http_session.get(sri_testing_url)
     assert response.ok, f"Could not retrieve SRI Testing Data URL at {sri_testing_url}."
     sri_testing_data = response.json()
 
@@ -230,14 +233,14 @@ def test_sri_testing_data():
     }
 
 
-def test_meta_knowledge_graph():
+def test_meta_knowledge_graph(http_session):
     """
     Test the GET /cam-kp/1.4/meta_knowledge_graph
     """
     meta_knowledge_graph_url = urllib.parse.urljoin(
         CAM_KP_API_ENDPOINT, f"{TRAPI_VERSION}/meta_knowledge_graph"
     )
-    response = requests.get(meta_knowledge_graph_url)
+    response = http_session.get(meta_knowledge_graph_url)
     assert (
         response.ok
     ), f"Unable to request the meta knowledge graph from {meta_knowledge_graph_url}."
@@ -2304,7 +2307,37 @@ def test_meta_knowledge_graph():
     ), "Found differences between edge types in MetaKG and expected edge types."
 
 
-def test_simple_spec():
+@pytest.mark.skipif(not META_KNOWLEDGE_GRAPH_FILE, reason="META_KNOWLEDGE_GRAPH_FILE is not set")
+def test_meta_knowledge_graph_matches_kg(http_session):
+    """
+    Compare GET /cam-kp/1.4/meta_knowledge_graph with the meta knowledge graph computed from the KG.
+    """
+    meta_knowledge_graph_url = urllib.parse.urljoin(
+        CAM_KP_API_ENDPOINT, f"{TRAPI_VERSION}/meta_knowledge_graph"
+    )
+    response = http_session.get(meta_knowledge_graph_url)
+    assert (
+        response.ok
+    ), f"Unable to request the meta knowledge graph from {meta_knowledge_graph_url}."
+    metakg = response.json()
+    with open(META_KNOWLEDGE_GRAPH_FILE, "r") as f:
+        expected_metakg = json.load(f)
+
+    # CAM-KP doesn't list qualifiers in its meta knowledge graph, so only compare the categories and predicates.
+    def edge_tuples(edges):
+        return {(edge["subject"], edge["predicate"], edge["object"]) for edge in edges}
+
+    actual_edges = edge_tuples(metakg["edges"])
+    expected_edges = edge_tuples(expected_metakg["edges"])
+    assert (
+        set(metakg["nodes"]) == set(expected_metakg["nodes"])
+    ), f"Node types differ from {META_KNOWLEDGE_GRAPH_FILE}: added {set(metakg['nodes']) - set(expected_metakg['nodes'])}, deleted {set(expected_metakg['nodes']) - set(metakg['nodes'])}"
+    assert (
+        actual_edges == expected_edges
+    ), f"Edge types differ from {META_KNOWLEDGE_GRAPH_FILE}: added {actual_edges - expected_edges}, deleted {expected_edges - actual_edges}"
+
+
+def test_simple_spec(http_session):
     """
     Test the GET /cam-kp/simple_spec endpoint.
     """
@@ -2319,7 +2352,7 @@ def test_simple_spec():
 
     simple_spec_endpoint = urllib.parse.urljoin(CAM_KP_API_ENDPOINT, "simple_spec")
     for simple_spec_test in simple_spec_tests:
-        response = requests.get(
+        response = http_session.get(
             simple_spec_endpoint,
             {
                 "source": simple_spec_test["source"],
@@ -2339,7 +2372,7 @@ def test_simple_spec():
         ), f"When querying for {simple_spec_test['source']} to {simple_spec_test['target']}, expected predicates {simple_spec_test['expected_predicates']} did not match {predicates}."
 
 
-def test_source_target_curie_one_hop_and_simple_spec():
+def test_source_target_curie_one_hop_and_simple_spec(http_session):
     """
     Test the GET /cam-kp/{source_type}/{target_type}/{curie} endpoint and the /cam-kp/simple_spec endpoint.
     """
@@ -2360,7 +2393,7 @@ def test_source_target_curie_one_hop_and_simple_spec():
             CAM_KP_API_ENDPOINT
             + f"{source_target_curie['source_type']}/{source_target_curie['target_type']}/{source_target_curie['curie']}"
         )
-        response = requests.get(source_target_url)
+        response = http_session.get(source_target_url)
         assert (
             response.ok
         ), f"Could not retrieve source-target-curie response from {source_target_url}."
@@ -2393,7 +2426,7 @@ def test_source_target_curie_one_hop_and_simple_spec():
         ), f"All expected knowledge sources in {source_target_curie['expected_knowledge_sources']} are not present in the list of knowledge sources obtained: {knowledge_sources}"
 
 
-def test_node_type_curie():
+def test_node_type_curie(http_session):
     """
     Test the GET /cam-kp/{node_type}/{curie} endpoint.
     """
@@ -2410,7 +2443,7 @@ def test_node_type_curie():
             CAM_KP_API_ENDPOINT
             + f"{node_type_curie['node_type']}/{node_type_curie['curie']}"
         )
-        response = requests.get(node_type_curie_url)
+        response = http_session.get(node_type_curie_url)
         assert (
             response.ok
         ), f"Could not retrieve node-type/CURIE information at {node_type_curie_url}."
@@ -2420,21 +2453,22 @@ def test_node_type_curie():
         assert node_type_data[0] == node_type_curie["expected"]
 
 
-def test_query():
+def test_query(http_session):
     f"""
     Test the POST /cam-kp/{TRAPI_VERSION}/query endpoint.
     """
 
     query_post_url = f"{CAM_KP_API_ENDPOINT}{TRAPI_VERSION}/query"
-    response = requests.post(
+    response = http_session.post(
         query_post_url, json=trapi_query_what_is_hsp8_mus_musculus_active_in
     )
     assert (
         response.ok
     ), f"Got response {response} when attempting to post example TRAPI message to {query_post_url}: {trapi_query_what_is_hsp8_mus_musculus_active_in}"
 
-    assert "message" in response.json()
-    message = response.json()["message"]
+    response_json = response.json()
+    assert "message" in response_json
+    message = response_json["message"]
 
     assert "query_graph" in message
     assert "knowledge_graph" in message
@@ -2485,7 +2519,7 @@ def test_query():
     ]
 
 
-def test_cypher():
+def test_cypher(http_session):
     """
     Test the /cam-kp/cypher endpoint.
     """
@@ -2494,13 +2528,14 @@ def test_cypher():
     cypher_query = {
         "query": "MATCH (s{id: 'NCBIGene:15481'})-[p]-(o{id: 'UBERON:0002240'}) RETURN s, p, o LIMIT 10"
     }
-    response = requests.post(f"{CAM_KP_API_ENDPOINT}cypher", json=cypher_query)
+    response = http_session.post(f"{CAM_KP_API_ENDPOINT}cypher", json=cypher_query)
     assert (
         response.ok
     ), f"Received response {response} when POSTing request to {CAM_KP_API_ENDPOINT}cypher: {cypher_query}"
 
-    assert "results" in response.json()
-    results = response.json()["results"]
+    response_json = response.json()
+    assert "results" in response_json
+    results = response_json["results"]
     assert len(results) == 1
     result = results[0]
 
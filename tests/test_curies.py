@@ -6,7 +6,6 @@ import os
 import urllib.parse
 
 import pytest
-import requests
 
 CAM_KP_API_ENDPOINT = os.getenv(
     "CAM_KP_API_ENDPOINT", "https://automat.renci.org/cam-kp/"
@@ -32,8 +31,31 @@ CURIES_TO_TEST = [
 ]
 
 
+def node_type_curie_url(curie):
+    return CAM_KP_API_ENDPOINT + f"biolink:NamedThing/{curie}"
+
+
+def source_target_url(curie):
+    return CAM_KP_API_ENDPOINT + f"biolink:NamedThing/biolink:NamedThing/{curie}"
+
+
+@pytest.fixture(scope="module")
+def identifier_responses(request, submit_requests, selected_params):
+    """
+    Start looking up every identifier in CURIES_TO_TEST that will be tested at once, so that each test only waits for
+    its own responses.
+
+    :return: A dictionary of (curie, 'node_type' or 'source_target') to futures of the responses.
+    """
+    calls = {}
+    for curie in selected_params(request.module, 'curie'):
+        calls[curie, 'node_type'] = ('GET', node_type_curie_url(curie), {})
+        calls[curie, 'source_target'] = ('GET', source_target_url(curie), {})
+    return submit_requests(calls)
+
+
 @pytest.mark.parametrize('curie', CURIES_TO_TEST)
-def test_identifier(curie):
+def test_identifier(curie, http_session, identifier_responses):
     """
     Test whether Automat-CAM-KP knows anything useful about a particular identifier.
 
@@ -41,14 +63,10 @@ def test_identifier(curie):
     """
 
     # Step 1. Use the node-type-curie endpoint to look up this identifier.
-    node_type_curie_url = (
-        CAM_KP_API_ENDPOINT
-        + f"biolink:NamedThing/{curie}"
-    )
-    response = requests.get(node_type_curie_url)
+    response = identifier_responses[curie, 'node_type'].result()
     assert (
         response.ok
-    ), f"Could not retrieve node-type/CURIE information at {node_type_curie_url}."
+    ), f"Could not retrieve node-type/CURIE information at {node_type_curie_url(curie)}."
     node_type_data = response.json()
 
     assert len(node_type_data) <= 1, f"Multiple entries found for CURIE {curie}."
@@ -57,7 +75,7 @@ def test_identifier(curie):
     if len(node_type_data) == 0:
         # Normalize the identifier and see if that provides insights.
         node_norm_url = (NODE_NORM_API_ENDPOINT + f"get_normalized_nodes")
-        response = requests.get(node_norm_url, {
+        response = http_session.get(node_norm_url, params={
             "curie": curie,
             "conflate": "true"
         })
@@ -77,14 +95,10 @@ def test_identifier(curie):
 
     # If we get there, there is only a single response -- perfect.
     # Step 2. See what CURIEs we connect to this CURIE.
-    source_target_url = (
-            CAM_KP_API_ENDPOINT
-            + f"biolink:NamedThing/biolink:NamedThing/{curie}"
-    )
-    response = requests.get(source_target_url)
+    response = identifier_responses[curie, 'source_target'].result()
     assert (
         response.ok
-    ), f"Could not retrieve source-target-curie response from {source_target_url}: {response}"
+    ), f"Could not retrieve source-target-curie response from {source_target_url(curie)}: {response}"
     results = response.json()
 
     linked_nodes = []
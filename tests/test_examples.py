@@ -3,15 +3,23 @@
 #
 # Test the example files in ./examples and ensure we are getting roughly the right number of results.
 #
+# If CAM_KP_KG_FILE is set to a kg_duplicated.tsv file, the queries are answered offline by the in-process engine in
+# scripts/trapi_engine.py instead of by CAM_KP_API_ENDPOINT (see `make validate-examples`). BIOLINK_FACTS_FILE and
+# NODE_CATEGORIES_FILE can point it to biolink.facts and kg_node_categories.tsv.
+#
+import functools
 import json
 import os
+import sys
 import pytest
-import requests
 
 CAM_KP_API_ENDPOINT = os.getenv(
     "CAM_KP_API_ENDPOINT", "https://automat.renci.org/cam-kp/"
 )
 TRAPI_VERSION = os.getenv("TRAPI_VERSION", "1.4")
+CAM_KP_KG_FILE = os.getenv("CAM_KP_KG_FILE")
+BIOLINK_FACTS_FILE = os.getenv("BIOLINK_FACTS_FILE")
+NODE_CATEGORIES_FILE = os.getenv("NODE_CATEGORIES_FILE")
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 example_files_to_test = [
@@ -19,6 +27,37 @@ example_files_to_test = [
 ]
 
 
+@functools.cache
+def local_kg():
+    """Load CAM_KP_KG_FILE once for all the examples."""
+    sys.path.insert(0, os.path.join(script_dir, "..", "scripts"))
+    from trapi_engine import LocalKG
+    return LocalKG(CAM_KP_KG_FILE, biolink_facts_file=BIOLINK_FACTS_FILE, node_categories_file=NODE_CATEGORIES_FILE)
+
+
+def load_example(example_filename):
+    with open(os.path.join(script_dir, "examples", example_filename), "r") as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module")
+def example_responses(request, submit_requests, selected_params):
+    """
+    Start posting every example query that will be tested to CAM_KP_API_ENDPOINT at once, so that each test only waits
+    for its own response.
+
+    :return: A dictionary of example filenames to futures of the responses (empty if CAM_KP_KG_FILE is set).
+    """
+    if CAM_KP_KG_FILE:
+        return {}
+    calls = {}
+    for example_filename in selected_params(request.module, 'example_filename'):
+        example = load_example(example_filename)
+        if example.get("query"):
+            calls[example_filename] = ('POST', f"{CAM_KP_API_ENDPOINT}{TRAPI_VERSION}/query", {"json": example["query"]})
+    return submit_requests(calls)
+
+
 # Test assertions.
 def assertion_expected_result_counts(assertion: dict, response_json):
     """
@@ -98,7 +137,7 @@ def assertion_expected_node_results(assertion: dict, response_json):
 
 
 @pytest.mark.parametrize('example_filename', example_files_to_test)
-def test_example(example_filename):
+def test_example(example_filename, example_responses):
     f"""
     Test the example files in the example directory.
     
@@ -109,9 +148,7 @@ def test_example(example_filename):
     - `assertions`: A list of assertions to test against the example file. An empty list is an error.
     """
 
-    example_file = os.path.join(script_dir, "examples", example_filename)
-    with open(example_file, "r") as f:
-        example = json.load(f)
+    example = load_example(example_filename)
 
     # Run some checks on the example.
     for section in ["meta", "query", "assertions"]:
@@ -120,11 +157,14 @@ def test_example(example_filename):
     assert len(example["assertions"]) > 0, f"No assertions found in example {example_filename}"
 
     trapi_query = example["query"]
-    query_post_url = f"{CAM_KP_API_ENDPOINT}{TRAPI_VERSION}/query"
-    response = requests.post(query_post_url, json=trapi_query)
-    assert response.ok, f"Got response {response} when attempting to post example TRAPI message to {query_post_url}: {trapi_query}"
-
-    response_json = response.json()
+    if CAM_KP_KG_FILE:
+        response_json = local_kg().query(trapi_query)
+    else:
+        query_post_url = f"{CAM_KP_API_ENDPOINT}{TRAPI_VERSION}/query"
+        response = example_responses[example_filename].result()
+        assert response.ok, f"Got response {response} when attempting to post example TRAPI message to {query_post_url}: {trapi_query}"
+
+        response_json = response.json()
     assert "message" in response_json
     message = response_json["message"]
 
@@ -0,0 +1,75 @@
+#
+# test_iri_compaction.py -- test that IRICompactor in scripts/iri_compaction.py compacts IRIs exactly like
+# compact_iri() (and so like scripts/compact_iris.sc).
+#
+import json
+import os
+
+import pytest
+
+from iri_compaction import IRICompactor, compact_iri, load_namespaces
+
+SUPPLEMENTAL_NAMESPACES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                                            "supplemental-namespaces.json")
+
+# A small Biolink Model prefix map, with namespaces that overlap each other and supplemental-namespaces.json.
+PREFIX_MAP = {
+    "GO": "http://purl.obolibrary.org/obo/GO_",
+    "OBO": "http://purl.obolibrary.org/obo/",
+    "UniProtKB": "http://purl.uniprot.org/uniprot/",
+    "NCBIGene": "http://identifiers.org/ncbigene/",
+    "biolink": "https://w3id.org/biolink/vocab/",
+    # The same namespace as biolink, which load_namespaces() puts second, so "biolink" wins.
+    "biolink2": "https://w3id.org/biolink/vocab/",
+}
+
+IRIS = [
+    "http://purl.obolibrary.org/obo/GO_0005488",
+    "http://purl.obolibrary.org/obo/UBERON_0002240",
+    "http://purl.obolibrary.org/obo/WBbt_0005762",
+    "http://identifiers.org/ncbigene/15481",
+    "http://identifiers.org/uniprot/P21796",
+    "http://identifiers.org/tair.locus/locus:2040567",
+    "http://identifiers.org/tair.locus/2040567",
+    "https://w3id.org/biolink/vocab/Gene",
+    "http://purl.obolibrary.org/obo/",
+    "http://purl.obolibrary.org/",
+    "http://example.org/unknown",
+    "",
+]
+
+
+@pytest.fixture
+def namespaces(tmp_path):
+    prefix_map_file = tmp_path / "prefix-map.json"
+    prefix_map_file.write_text(json.dumps(PREFIX_MAP), encoding="utf-8")
+    return load_namespaces(prefix_map_file, SUPPLEMENTAL_NAMESPACES_FILE)
+
+
+def test_load_namespaces_longest_first(namespaces):
+    lengths = [len(namespace) for namespace, _ in namespaces]
+    assert lengths == sorted(lengths, reverse=True)
+
+
+@pytest.mark.parametrize("iri", IRIS)
+@pytest.mark.parametrize("cache_size", [0, 16])
+def test_compactor_matches_compact_iri(namespaces, iri, cache_size):
+    compactor = IRICompactor(namespaces, cache_size=cache_size)
+    assert compactor.compact(iri) == compact_iri(iri, namespaces)
+    # A second call (which is cached if cache_size > 0) gives the same answer.
+    assert compactor.compact(iri) == compact_iri(iri, namespaces)
+
+
+def test_longest_namespace_wins(namespaces):
+    compactor = IRICompactor(namespaces)
+    assert compactor.compact("http://purl.obolibrary.org/obo/GO_0005488") == "GO:0005488"
+    assert compactor.compact("http://purl.obolibrary.org/obo/UBERON_0002240") == "OBO:UBERON_0002240"
+    assert compactor.compact("http://identifiers.org/tair.locus/locus:2040567") == "tair.locus:2040567"
+
+
+def test_first_prefix_wins_for_a_repeated_namespace(namespaces):
+    assert IRICompactor(namespaces).compact("https://w3id.org/biolink/vocab/Gene") == "biolink:Gene"
+
+
+def test_unknown_iri_is_unchanged(namespaces):
+    assert IRICompactor(namespaces).compact("http://example.org/unknown") == "http://example.org/unknown"
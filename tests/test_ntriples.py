@@ -0,0 +1,71 @@
+#
+# test_ntriples.py -- test how scripts/ntriples.py splits N-Triples and N-Quads into Souffle's TSV columns.
+#
+import pytest
+
+from ntriples import NTriplesParseError, split_terms, to_tsv_line
+
+S = "<http://example.org/s>"
+P = "<http://example.org/p>"
+G = "<http://example.org/g>"
+
+
+@pytest.mark.parametrize("line,terms", [
+    (f"{S} {P} <http://example.org/o> .\n", [S, P, "<http://example.org/o>"]),
+    (f"{S}\t{P}  _:b0 .", [S, P, "_:b0"]),
+    (f"{S} {P} _:b0.\n", [S, P, "_:b0"]),
+    (f"{S} {P} _:b0.", [S, P, "_:b0"]),
+    (f'{S} {P} "a literal"@en.\n', [S, P, '"a literal"@en']),
+    (f"{S} {P} <http://example.org/o> {G} .\n", [S, P, "<http://example.org/o>", G]),
+    (f'{S} {P} "a literal" .\n', [S, P, '"a literal"']),
+    (f'{S} {P} "a literal"@en-gb {G} .\n', [S, P, '"a literal"@en-gb', G]),
+    (f'{S} {P} "1"^^<http://www.w3.org/2001/XMLSchema#integer> .\n',
+     [S, P, '"1"^^<http://www.w3.org/2001/XMLSchema#integer>']),
+    ("\n", []),
+    ("# a comment\n", []),
+    (f"{S} {P} <http://example.org/o> . # a comment\n", [S, P, "<http://example.org/o>"]),
+])
+def test_split_terms(line, terms):
+    assert split_terms(line) == terms
+
+
+@pytest.mark.parametrize("literal", [
+    r'"an \"escaped\" quote"',
+    r'"a backslash at the end\\"',
+    r'"a newline\nand a tab\t"',
+    r'"unicode é escapes"',
+    '"spaces . and dots . inside"',
+    '"a > in a literal"',
+])
+def test_escapes_are_kept(literal):
+    # Escape sequences are copied through as they are, and quotes preceded by an even number of backslashes end the
+    # literal.
+    assert split_terms(f"{S} {P} {literal} {G} .\n") == [S, P, literal, G]
+
+
+def test_raw_tab_in_literal_is_escaped():
+    assert split_terms(f'{S} {P} "a\ttab" .\n') == [S, P, r'"a\ttab"']
+    assert to_tsv_line(f'{S} {P} "a\ttab" .\n', 3) == f'{S}\t{P}\t"a\\ttab"\n'
+
+
+def test_to_tsv_line():
+    assert to_tsv_line(f'{S} {P} "o"@en {G} .\n', 4) == f'{S}\t{P}\t"o"@en\t{G}\n'
+    assert to_tsv_line("# a comment\n", 3) == ""
+
+
+@pytest.mark.parametrize("line,message", [
+    (f"{S} {P} <http://example.org/o>\n", "Expected '.'"),
+    (f'{S} {P} "unterminated .\n', "Unterminated literal"),
+    (f'{S} {P} "escaped quote at the end\\" .\n', "Unterminated literal"),
+    (f'{S} {P} "1"^^<http://example.org/type .\n', "Unterminated literal datatype"),
+    (f'{S} <http://example.org/p "o" .\n', "Unterminated IRI"),
+])
+def test_parse_errors(line, message):
+    with pytest.raises(NTriplesParseError, match=message) as excinfo:
+        split_terms(line)
+    assert excinfo.value.line == line.rstrip("\n")
+
+
+def test_wrong_number_of_terms():
+    with pytest.raises(NTriplesParseError, match="Expected 3 terms but found 4"):
+        to_tsv_line(f"{S} {P} <http://example.org/o> {G} .\n", 3)
@@ -0,0 +1,145 @@
+#
+# test_qualifiers.py -- test the qualifier parsing and expansion in scripts/qualifiers.py.
+#
+import json
+
+import pytest
+
+from qualifiers import (ExpansionReport, QualifierExpander, QualifierParseError, iter_souffle_qualifiers,
+                        parse_souffle_qualifiers)
+
+BIOLINK = "https://w3id.org/biolink/vocab/"
+ANATOMICAL_CONTEXT = BIOLINK + "anatomical_context_qualifier"
+OBJECT_ASPECT = BIOLINK + "object_aspect_qualifier"
+
+
+def souffle_qualifiers(*pairs):
+    """Write qualifiers the way scripts/kg_edges.dl does."""
+    return "||".join(f"(<{qualifier_type}>=(({value})))" for qualifier_type, value in pairs)
+
+
+def test_parse_souffle_qualifiers():
+    qualifier_string = souffle_qualifiers(
+        (ANATOMICAL_CONTEXT, "<http://purl.obolibrary.org/obo/UBERON_0002240>"),
+        (OBJECT_ASPECT, "activity"),
+    )
+    assert parse_souffle_qualifiers(qualifier_string) == [
+        (ANATOMICAL_CONTEXT, "<http://purl.obolibrary.org/obo/UBERON_0002240>"),
+        (OBJECT_ASPECT, "activity"),
+    ]
+
+
+def test_parse_value_ending_with_parenthesis():
+    # A value can end with ')', since ')))' is extended to include any further ')'.
+    qualifier_string = souffle_qualifiers((OBJECT_ASPECT, "activity (of a gene)"))
+    assert parse_souffle_qualifiers(qualifier_string) == [(OBJECT_ASPECT, "activity (of a gene)")]
+
+
+@pytest.mark.parametrize("qualifier_string,message,offset", [
+    ("", "Expected '(<'", 0),
+    ("<x>=((y)))", "Expected '(<'", 0),
+    ("(<>=((y)))", "Empty qualifier type", 2),
+    ("(<x>((y)))", "Expected '>=(('", 2),
+    ("(<x>=(()))", "Empty qualifier value", 7),
+    ("(<x>=((y", "Expected ')))'", 7),
+    # Errors after a value are reported at the end of the value.
+    ("(<x>=((y)))|(<z>=((w)))", "followed by something other than '||'", 8),
+    ("(<x>=((y)))||(<z>=((w)))junk", "followed by something other than '||'", 21),
+    ("(<x>=((a)))b)))", "followed by something other than '||'", 8),
+])
+def test_parse_error_offsets(qualifier_string, message, offset):
+    with pytest.raises(QualifierParseError) as excinfo:
+        parse_souffle_qualifiers(qualifier_string)
+    assert message in str(excinfo.value)
+    assert excinfo.value.offset == offset
+    assert excinfo.value.qualifier_string == qualifier_string
+
+
+def test_parse_error_offsets_are_in_utf8_bytes():
+    # 'é' is two bytes in UTF-8, so the error just after it is at byte 9 rather than at character 8.
+    qualifier_string = "(<x>=((é)))junk"
+    with pytest.raises(QualifierParseError) as excinfo:
+        parse_souffle_qualifiers(qualifier_string)
+    assert excinfo.value.offset == 9
+
+
+def test_iter_souffle_qualifiers_yields_qualifiers_before_an_error():
+    qualifiers = iter_souffle_qualifiers("(<x>=((y)))||(<z>=((w")
+    assert next(qualifiers) == ("x", "y")
+    with pytest.raises(QualifierParseError):
+        next(qualifiers)
+
+
+def test_expand_cartesian_product():
+    expander = QualifierExpander(parse_souffle_qualifiers)
+    fragments = expander.expand(souffle_qualifiers(
+        (ANATOMICAL_CONTEXT, "b"), (ANATOMICAL_CONTEXT, "a"), (ANATOMICAL_CONTEXT, "a"), (OBJECT_ASPECT, "activity"),
+    ))
+    # Repeated values are merged, and the values of each qualifier are sorted.
+    assert [json.loads(fragment) for fragment in fragments] == [
+        {ANATOMICAL_CONTEXT: "a", OBJECT_ASPECT: "activity"},
+        {ANATOMICAL_CONTEXT: "b", OBJECT_ASPECT: "activity"},
+    ]
+
+
+def test_expand_is_cached():
+    expander = QualifierExpander(parse_souffle_qualifiers)
+    qualifier_string = souffle_qualifiers((OBJECT_ASPECT, "activity"))
+    assert expander.expand(qualifier_string) is expander.expand(qualifier_string)
+    assert expander.cache_counts() == {'cache_hits': 1, 'cache_misses': 1}
+
+
+def expand_row(excess_policy, qualifier_string, max_expansion=2):
+    expander = QualifierExpander(parse_souffle_qualifiers, max_expansion=max_expansion, excess_policy=excess_policy)
+    report = ExpansionReport()
+    spill = []
+    line = f"s\tp\to\tg\tx\t{qualifier_string}\n"
+    output = expander.expand_row("s\tp\to\tg\tx\t", qualifier_string, line, report, spill)
+    return output, report, spill, line
+
+
+# Three values of one qualifier and two of another expand into six rows.
+SIX_COMBINATIONS = souffle_qualifiers(
+    (ANATOMICAL_CONTEXT, "a"), (ANATOMICAL_CONTEXT, "b"), (ANATOMICAL_CONTEXT, "c"),
+    (OBJECT_ASPECT, "activity"), (OBJECT_ASPECT, "abundance"),
+)
+
+
+def test_expand_row_within_limit():
+    output, report, spill, _ = expand_row('fail', souffle_qualifiers((OBJECT_ASPECT, "activity")))
+    assert output == f's\tp\to\tg\tx\t{{"{OBJECT_ASPECT}": "activity"}}\n'
+    assert report.counts['output_rows'] == 1
+    assert report.expansion_factors == {1: 1}
+    assert spill == []
+
+
+def test_expand_row_fail():
+    with pytest.raises(ValueError, match="6 combinations"):
+        expand_row('fail', SIX_COMBINATIONS)
+
+
+def test_expand_row_truncate():
+    output, report, spill, _ = expand_row('truncate', SIX_COMBINATIONS)
+    rows = output.splitlines()
+    assert len(rows) == 2
+    # The first combinations are kept, in the same order as an unlimited expansion.
+    unlimited = QualifierExpander(parse_souffle_qualifiers).expand(SIX_COMBINATIONS)
+    assert [row.split("\t")[5] for row in rows] == list(unlimited[:2])
+    assert report.counts['truncated_rows'] == 1
+    assert report.counts['output_rows'] == 2
+    assert report.expansion_factors == {6: 1}
+    assert spill == []
+
+
+def test_expand_row_spill():
+    output, report, spill, line = expand_row('spill', SIX_COMBINATIONS)
+    assert output == ""
+    assert spill == [line]
+    assert report.counts['spilled_rows'] == 1
+    assert report.counts['output_rows'] == 0
+    assert report.expansion_factors == {6: 1}
+
+
+def test_unknown_excess_policy():
+    with pytest.raises(ValueError, match="Unknown excess policy"):
+        QualifierExpander(parse_souffle_qualifiers, excess_policy='drop')
@@ -0,0 +1,109 @@
+#
+# test_stage_cache.py -- test that scripts/stage_cache.py restores the outputs of a stage only when its command and
+# the contents of its inputs haven't changed.
+#
+import os
+
+import pytest
+
+from stage_cache import ArtifactStore
+
+COMMAND = "sort input.txt >output.txt"
+
+
+def write(path, content):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture
+def stage(tmp_path, monkeypatch):
+    """A stage with one input file and one output file and folder, in a fresh working directory."""
+    monkeypatch.chdir(tmp_path)
+    write("input.txt", "b\na\n")
+    os.makedirs("output-folder")
+    write("output.txt", "a\nb\n")
+    write(os.path.join("output-folder", "part-1.txt"), "a\n")
+    return ArtifactStore(str(tmp_path / ".stage-store"))
+
+
+def test_miss_on_an_empty_store(stage):
+    key = stage.stage_key(COMMAND, ["input.txt"])
+    assert not stage.has_stage(key)
+    assert stage.restore(key) is None
+
+
+def test_hit_restores_the_outputs(stage):
+    key = stage.stage_key(COMMAND, ["input.txt"])
+    stage.save(key, ["output.txt", "output-folder"])
+    os.remove("output.txt")
+    write(os.path.join("output-folder", "part-2.txt"), "stale\n")
+
+    assert stage.restore(key) == ["output.txt", "output-folder"]
+    assert read("output.txt") == "a\nb\n"
+    assert sorted(os.listdir("output-folder")) == ["part-1.txt"]
+    assert os.access("output.txt", os.W_OK)
+
+
+def test_changing_a_restored_output_does_not_change_the_store(stage):
+    key = stage.stage_key(COMMAND, ["input.txt"])
+    stage.save(key, ["output.txt"])
+    stage.restore(key)
+    write("output.txt", "changed\n")
+
+    stage.restore(key)
+    assert read("output.txt") == "a\nb\n"
+
+
+def test_changing_an_input_invalidates_the_stage(stage):
+    key = stage.stage_key(COMMAND, ["input.txt"])
+    stage.save(key, ["output.txt"])
+    write("input.txt", "c\nb\na\n")
+
+    new_key = stage.stage_key(COMMAND, ["input.txt"])
+    assert new_key != key
+    assert stage.restore(new_key) is None
+
+
+@pytest.mark.parametrize("command,extra", [
+    ("sort -r input.txt >output.txt", ()),
+    (COMMAND, ("BIOLINK=v4.2.1",)),
+])
+def test_changing_the_command_or_extra_values_invalidates_the_stage(stage, command, extra):
+    key = stage.stage_key(COMMAND, ["input.txt"])
+    stage.save(key, ["output.txt"])
+    assert stage.stage_key(command, ["input.txt"], extra) != key
+
+
+def test_folder_inputs_are_hashed_by_content(stage):
+    key = stage.stage_key(COMMAND, ["output-folder"])
+    assert stage.stage_key(COMMAND, ["output-folder"]) == key
+    write(os.path.join("output-folder", "part-2.txt"), "b\n")
+    assert stage.stage_key(COMMAND, ["output-folder"]) != key
+
+
+def test_missing_objects_are_a_miss(stage):
+    key = stage.stage_key(COMMAND, ["input.txt"])
+    stage.save(key, ["output.txt"])
+    objects = os.path.join(stage.root, "objects")
+    for folder, _, files in os.walk(objects):
+        for name in files:
+            os.remove(os.path.join(folder, name))
+
+    assert stage.restore(key) is None
+    assert read("output.txt") == "a\nb\n"
+
+
+def test_missing_output_is_an_error(stage):
+    with pytest.raises(FileNotFoundError):
+        stage.save(stage.stage_key(COMMAND, ["input.txt"]), ["missing.txt"])
+
+
+def test_store_is_ignored_by_git(stage):
+    stage.save(stage.stage_key(COMMAND, ["input.txt"]), ["output.txt"])
+    assert read(os.path.join(stage.root, ".gitignore")).splitlines()[-1] == "*"
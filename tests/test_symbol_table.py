@@ -0,0 +1,123 @@
+#
+# test_symbol_table.py -- test that terms interned by scripts/intern-facts.py (with scripts/symbol_table.py) decode back
+# into the same terms with scripts/decode-kg-edges.py.
+#
+import importlib.util
+import os
+
+import pytest
+
+from symbol_table import SymbolTable, load_program_constants, load_terms
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+KG_EDGES_PROGRAM = os.path.join(SCRIPTS_DIR, "kg_edges.dl")
+
+
+def load_script(name):
+    """Import a script whose file name isn't a valid module name (e.g. decode-kg-edges.py)."""
+    spec = importlib.util.spec_from_file_location(name.replace("-", "_"), os.path.join(SCRIPTS_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+intern_facts = load_script("intern-facts")
+decode_kg_edges = load_script("decode-kg-edges")
+
+RDF_TYPE = "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>"
+GRAPH = "<http://model.geneontology.org/SYNGO_2911>"
+QUADS = [
+    f"<http://identifiers.org/ncbigene/15481>\t<http://purl.obolibrary.org/obo/RO_0002325>\t"
+    f"<http://purl.obolibrary.org/obo/UBERON_0002240>\t{GRAPH}",
+    f"<http://identifiers.org/ncbigene/15481>\t{RDF_TYPE}\t<http://purl.obolibrary.org/obo/CHEBI_22916>\t{GRAPH}",
+    f'_:b0\t<http://www.w3.org/2000/01/rdf-schema#label>\t"sp\\u00e9cial \\"label\\""@en\t{GRAPH}',
+    f'_:b0\t<http://www.w3.org/2000/01/rdf-schema#label>\t"non-ASCII: é, 日本"\t{GRAPH}',
+]
+
+
+def test_program_constants_come_first():
+    constants = load_program_constants(KG_EDGES_PROGRAM)
+    assert constants["RDF_TYPE"] == (0, RDF_TYPE)
+    symbols = SymbolTable(constants)
+    for symbol_id, term in constants.values():
+        assert symbols.intern(term) == symbol_id
+    assert len(symbols) == len(constants)
+
+
+def test_conflicting_constants():
+    with pytest.raises(ValueError, match="more than one ID"):
+        SymbolTable({"A": (0, "<a>"), "B": (1, "<a>")})
+
+
+def test_intern_assigns_dense_ids_in_order():
+    symbols = SymbolTable()
+    assert symbols.intern_columns("<a>\t<b>\t<a>") == [0, 1, 0]
+    assert symbols.intern("<c>") == 2
+    assert symbols.intern("<b>") == 1
+
+
+def test_intern_decode_round_trip(tmp_path):
+    quads_file = tmp_path / "quad.facts"
+    quads_file.write_text("".join(quad + "\n" for quad in QUADS), encoding="utf-8")
+    interned_file = tmp_path / "interned.facts"
+    symbols = SymbolTable(load_program_constants(KG_EDGES_PROGRAM))
+    text_ids = set()
+    # A tiny chunk size, so that lines are interned over several chunks.
+    line_count = intern_facts.intern_file(symbols, str(quads_file), str(interned_file), set(), text_ids, 64)
+    assert line_count == len(QUADS)
+
+    symbols_file = tmp_path / "symbols.tsv"
+    with open(symbols_file, "w", encoding="utf-8") as f:
+        symbols.write(f)
+    terms = load_terms(symbols_file)
+    assert len(terms) == len(symbols)
+
+    interned_lines = interned_file.read_text(encoding="utf-8").splitlines()
+    decoded = ["\t".join(terms[int(symbol_id)] for symbol_id in line.split("\t")) for line in interned_lines]
+    assert decoded == QUADS
+    # Every graph is needed as text by kg_edges.dl.
+    assert text_ids == {symbols.intern(GRAPH)}
+
+
+def test_write_subset(tmp_path):
+    symbols = SymbolTable()
+    symbols.intern_columns("<a>\t<b>\t<c>")
+    symbols_file = tmp_path / "symbol_text.facts"
+    with open(symbols_file, "w", encoding="utf-8") as f:
+        symbols.write(f, {2, 0})
+    assert symbols_file.read_text(encoding="utf-8") == "0\t<a>\n2\t<c>\n"
+    # A subset has gaps in its IDs, so it can't be loaded as a complete symbol table.
+    with pytest.raises(ValueError, match="Expected symbol ID 1"):
+        load_terms(symbols_file)
+
+
+def test_decode_kg_edge_line():
+    symbols = SymbolTable()
+    subject, predicate, obj, graph, qualifier_type, value1, value2 = (
+        "<http://identifiers.org/ncbigene/15481>",
+        "<https://w3id.org/biolink/vocab/active_in>",
+        "<http://purl.obolibrary.org/obo/UBERON_0002240>",
+        GRAPH,
+        "<https://w3id.org/biolink/vocab/anatomical_context_qualifier>",
+        "<http://purl.obolibrary.org/obo/UBERON_0000955>",
+        '"a (parenthesised) value"',
+    )
+    ids = {term: symbols.intern(term) for term in [subject, predicate, obj, graph, qualifier_type, value1, value2]}
+    terms = list(symbols.ids)
+    interned = (f"{ids[subject]}\t{ids[predicate]}\t{ids[obj]}\t{ids[graph]}\tinfores:go-cam\t"
+                f"({ids[qualifier_type]}=(({ids[value1]})))||({ids[qualifier_type]}=(({ids[value2]})))")
+    assert decode_kg_edges.decode_line(interned, terms) == (
+        f"{subject}\t{predicate}\t{obj}\t{graph[1:-1]}\tinfores:go-cam\t"
+        f"({qualifier_type}=(({value1})))||({qualifier_type}=(({value2})))\n"
+    )
+    unqualified = f"{ids[subject]}\t{ids[predicate]}\t{ids[obj]}\t{ids[graph]}\tinfores:go-cam\t"
+    assert decode_kg_edges.decode_line(unqualified, terms) == (
+        f"{subject}\t{predicate}\t{obj}\t{graph[1:-1]}\tinfores:go-cam\t\n"
+    )
+
+
+def test_decode_bad_lines():
+    with pytest.raises(ValueError, match="6 tab-delimited columns"):
+        decode_kg_edges.decode_line("0\t1\t2", ["<a>", "<b>", "<c>"])
+    with pytest.raises(ValueError, match="Could not parse interned qualifier"):
+        decode_kg_edges.decode_qualifiers("(0=((1))", ["<a>", "<b>"])
@@ -0,0 +1,131 @@
+#
+# test_trapi_engine.py -- test that scripts/trapi_engine.py answers small one-hop TRAPI queries over a
+# kg_duplicated.tsv the way CAM-KP would.
+#
+import json
+
+import pytest
+
+from trapi_engine import CAM_KP_INFORES, LocalKG, QueryError
+
+GRAPH = "http://model.geneontology.org/SYNGO_2911"
+KG_EDGES = [
+    ("CHEBI:15377", "biolink:positively_regulates", "NCBIGene:15481", GRAPH, "infores:go-cam",
+     {"biolink:object_aspect_qualifier": "activity"}),
+    ("CHEBI:15377", "biolink:negatively_regulates", "NCBIGene:15481", GRAPH, "infores:ctd", None),
+    ("CHEBI:15377", "biolink:affects", "GO:0005488", GRAPH, "infores:go-cam", None),
+    ("NCBIGene:15481", "biolink:interacts_with", "NCBIGene:768206", GRAPH, "infores:go-cam", None),
+]
+BIOLINK_FACTS = [
+    ("positively_regulates", "subPropertyOf", "regulates"),
+    ("negatively_regulates", "subPropertyOf", "regulates"),
+    ("regulates", "subPropertyOf", "affects"),
+    ("Gene", "subClassOf", "BiologicalEntity"),
+    ("MolecularActivity", "subClassOf", "BiologicalEntity"),
+]
+
+
+@pytest.fixture
+def kg(tmp_path):
+    kg_file = tmp_path / "kg_duplicated.tsv"
+    with open(kg_file, "w", encoding="utf-8") as f:
+        for *columns, qualifiers in KG_EDGES:
+            f.write("\t".join(columns + [json.dumps(qualifiers) if qualifiers else ""]) + "\n")
+
+    biolink_facts_file = tmp_path / "biolink.facts"
+    with open(biolink_facts_file, "w", encoding="utf-8") as f:
+        for child, relation, parent in BIOLINK_FACTS:
+            f.write(f"<https://w3id.org/biolink/vocab/{child}>\t<http://www.w3.org/2000/01/rdf-schema#{relation}>\t"
+                    f"<https://w3id.org/biolink/vocab/{parent}>\n")
+
+    node_categories_file = tmp_path / "node-categories.tsv"
+    with open(node_categories_file, "w", encoding="utf-8") as f:
+        f.write("GO:0005488\tbiolink:MolecularActivity\n")
+
+    return LocalKG(str(kg_file), str(biolink_facts_file), str(node_categories_file))
+
+
+def one_hop(subject, obj, predicates=None, qualifier_constraints=None):
+    qedge = {"subject": "n0", "object": "n1"}
+    if predicates:
+        qedge["predicates"] = predicates
+    if qualifier_constraints:
+        qedge["qualifier_constraints"] = qualifier_constraints
+    return {"message": {"query_graph": {"nodes": {"n0": subject, "n1": obj}, "edges": {"e0": qedge}}}}
+
+
+def bound_ids(response, qnode_id):
+    return sorted(binding["id"] for result in response["message"]["results"]
+                  for binding in result["node_bindings"][qnode_id])
+
+
+def test_one_hop_query(kg):
+    response = kg.query(one_hop({"ids": ["CHEBI:15377"]}, {"categories": ["biolink:Gene"]}, ["biolink:regulates"]))
+    message = response["message"]
+
+    # Both regulates edges bind to the same pair of nodes, so they are grouped into one result.
+    assert len(message["results"]) == 1
+    result = message["results"][0]
+    assert result["node_bindings"] == {"n0": [{"id": "CHEBI:15377"}], "n1": [{"id": "NCBIGene:15481"}]}
+    edge_ids = [binding["id"] for binding in result["analyses"][0]["edge_bindings"]["e0"]]
+    assert sorted(message["knowledge_graph"]["edges"][edge_id]["predicate"] for edge_id in edge_ids) == [
+        "biolink:negatively_regulates", "biolink:positively_regulates"]
+
+    assert message["knowledge_graph"]["nodes"] == {
+        "CHEBI:15377": {"categories": ["biolink:ChemicalEntity"], "attributes": []},
+        "NCBIGene:15481": {"categories": ["biolink:Gene"], "attributes": []},
+    }
+    edge = message["knowledge_graph"]["edges"][edge_ids[0]]
+    assert edge["sources"][1] == {"resource_id": CAM_KP_INFORES, "resource_role": "aggregator_knowledge_source",
+                                  "upstream_resource_ids": [edge["sources"][0]["resource_id"]]}
+    assert edge["attributes"] == [{"attribute_type_id": "biolink:xref", "value": [GRAPH]}]
+
+
+def test_predicates_are_expanded_to_descendants(kg):
+    response = kg.query(one_hop({"ids": ["CHEBI:15377"]}, {}, ["biolink:affects"]))
+    assert bound_ids(response, "n1") == ["GO:0005488", "NCBIGene:15481"]
+
+    response = kg.query(one_hop({"ids": ["CHEBI:15377"]}, {}, ["biolink:positively_regulates"]))
+    assert len(response["message"]["knowledge_graph"]["edges"]) == 1
+
+
+def test_categories_are_expanded_to_descendants(kg):
+    response = kg.query(one_hop({"ids": ["CHEBI:15377"]}, {"categories": ["biolink:BiologicalEntity"]}))
+    assert bound_ids(response, "n1") == ["GO:0005488", "NCBIGene:15481"]
+    assert response["message"]["knowledge_graph"]["nodes"]["GO:0005488"]["categories"] == [
+        "biolink:MolecularActivity"]
+
+
+def test_symmetric_predicates_match_in_reverse(kg):
+    response = kg.query(one_hop({"ids": ["NCBIGene:768206"]}, {}, ["biolink:interacts_with"]))
+    assert bound_ids(response, "n1") == ["NCBIGene:15481"]
+
+    response = kg.query(one_hop({"ids": ["NCBIGene:15481"]}, {"ids": ["CHEBI:15377"]}, ["biolink:regulates"]))
+    assert response["message"]["results"] == []
+
+
+def test_qualifier_constraints(kg):
+    constraints = [{"qualifier_set": [
+        {"qualifier_type_id": "biolink:object_aspect_qualifier", "qualifier_value": "activity"}]}]
+    response = kg.query(one_hop({"ids": ["CHEBI:15377"]}, {}, ["biolink:affects"], constraints))
+    edges = list(response["message"]["knowledge_graph"]["edges"].values())
+    assert len(edges) == 1
+    assert edges[0]["predicate"] == "biolink:positively_regulates"
+    assert edges[0]["qualifiers"] == [
+        {"qualifier_type_id": "biolink:object_aspect_qualifier", "qualifier_value": "activity"}]
+
+
+def test_unknown_ids_have_no_results(kg):
+    response = kg.query(one_hop({"ids": ["CHEBI:0"]}, {}))
+    assert response["message"]["results"] == []
+    assert response["message"]["knowledge_graph"] == {"nodes": {}, "edges": {}}
+
+
+@pytest.mark.parametrize("query", [
+    {},
+    {"message": {"query_graph": {"nodes": {"n0": {}}, "edges": {}}}},
+    {"message": {"query_graph": {"nodes": {"n0": {}}, "edges": {"e0": {"subject": "n0", "object": "n1"}}}}},
+])
+def test_invalid_query_graphs(kg, query):
+    with pytest.raises(QueryError):
+        kg.query(query)